@@ -0,0 +1,147 @@
+# Recall@k, Latenz und Speicher der FAISS-Index-Typen (FAISS_INDEX) gegen den Flat-Index – auf den eigenen Chunks
+#
+#   python prototype/ann_benchmark.py                               # Store specs, k=10
+#   python prototype/ann_benchmark.py --store pool --k 48 --queries 500 --target-recall 0.98
+#
+# Die Chunk-Vektoren kommen aus dem Embedding-Cache (kein erneutes Einbetten). '--queries' zufällige Chunks
+# werden zurückgehalten und dienen als Anfragen; die Grundwahrheit liefert eine exakte Suche (IndexFlatL2)
+# über die übrigen Chunks. Je Index-Typ: Aufbau inkl. Training, Größe (serialisiert ≈ RAM bzw. Page-Cache),
+# Latenz je Einzel-Anfrage (p50/p95) und Recall@k über mehrere Suchbreiten (efSearch bzw. nprobe), dazu die
+# kleinste Suchbreite, die '--target-recall' erreicht. Aufbau-Parameter (FAISS_HNSW_M, FAISS_NLIST, ...) aus
+# der Umgebung wie beim Index-Cache. Bericht als Artefakt "ann_report" im RunStore (RUNS_DIR).
+import argparse
+import json
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional
+import faiss as faiss_lib
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from indexing import IndexSpec, embedding_model_name, make_index, search_params
+from rag_utils import STORE_CORPORA, _load_or_build_store
+from run_store import RunStore, new_run_id
+
+# Suchbreiten je Index-Typ (efSearch bzw. nprobe); flat hat keine
+SWEEPS: Dict[str, List[Optional[int]]] = {
+    "flat": [None],
+    "hnsw": [16, 32, 64, 128, 256],
+    "ivf": [1, 2, 4, 8, 16, 32, 64],
+    "ivfpq": [1, 2, 4, 8, 16, 32, 64],
+}
+# Mindestzahl zurückgehaltener Anfragen; darunter sind Recall und p95 nicht aussagekräftig
+MIN_QUERIES = 10
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f[f >= 0]) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def _latency(index: faiss_lib.Index, queries: np.ndarray, k: int, params) -> Dict:
+    """Einzel-Anfragen wie im Retrieval-Pfad ohne Batching (ms); Ergebnis aller Anfragen für den Recall."""
+    ms, rows = [], []
+    index.search(queries[:1], k, params=params)  # Aufwärmen
+    for q in queries:
+        t0 = time.perf_counter()
+        _, found = index.search(q[None, :], k, params=params)
+        ms.append((time.perf_counter() - t0) * 1000)
+        rows.append(found[0])
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 3), "p95_ms": round(float(np.percentile(ms, 95)), 3),
+            "found": np.array(rows)}
+
+
+def ann_report(vectors: np.ndarray, k: int = 10, n_queries: int = 200, target_recall: float = 0.95,
+               kinds: Optional[List[str]] = None, seed: int = 0) -> Dict:
+    rng = np.random.default_rng(seed)
+    requested, n_queries = n_queries, min(n_queries, len(vectors) // 10)  # höchstens 10 % des Corpus
+    if n_queries < MIN_QUERIES:
+        raise RuntimeError(
+            f"ann_report braucht mindestens {MIN_QUERIES} zurückgehaltene Anfragen, möglich sind {n_queries} "
+            f"({len(vectors)} Chunks, höchstens 10 % als Anfragen; angefordert: {requested}). "
+            f"Größeren Store wählen (mindestens {MIN_QUERIES * 10} Chunks) oder --queries erhöhen.")
+    held_out = rng.choice(len(vectors), size=n_queries, replace=False)
+    mask = np.ones(len(vectors), dtype=bool)
+    mask[held_out] = False
+    base, queries = np.ascontiguousarray(vectors[mask]), np.ascontiguousarray(vectors[held_out])
+    k = min(k, len(base))
+
+    exact = faiss_lib.IndexFlatL2(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, k)
+
+    env = IndexSpec.from_env()
+    out: Dict[str, Dict] = {}
+    for kind in kinds or list(SWEEPS):
+        spec = replace(env, kind=kind)
+        t0 = time.perf_counter()
+        index = make_index(base, spec)
+        build_s = time.perf_counter() - t0
+        runs = []
+        for breadth in SWEEPS[kind]:
+            if breadth is not None:
+                spec = replace(spec, ef_search=breadth) if kind == "hnsw" else replace(spec, nprobe=breadth)
+            lat = _latency(index, queries, k, search_params(index, spec, k))
+            runs.append({"breadth": breadth, "recall": round(_recall(lat.pop("found"), truth), 4), **lat})
+        reached = [r for r in runs if r["recall"] >= target_recall]
+        out[kind] = {
+            "factory": spec.factory(base.shape[1], len(base)),
+            # z.B. IVF-PQ mit weniger Bits bzw. IVF-Flat, wenn der Corpus fürs PQ-Training zu klein ist
+            "fallback": spec.resolve(len(base)).fallback or None,
+            "build_s": round(build_s, 3),
+            "bytes": int(faiss_lib.serialize_index(index).nbytes),
+            "sweep": runs,
+            # kleinste Suchbreite mit Ziel-Recall (None: nicht erreicht)
+            "recommended": reached[0]["breadth"] if reached else None,
+        }
+    flat_bytes = out.get("flat", {}).get("bytes")
+    for entry in out.values():
+        entry["bytes_vs_flat"] = round(entry["bytes"] / flat_bytes, 3) if flat_bytes else None
+    return {
+        "vectors": int(len(base)),
+        "dim": int(base.shape[1]),
+        "queries": int(n_queries),
+        "k": int(k),
+        "target_recall": target_recall,
+        "indexes": out,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k / Latenz / Speicher der FAISS-Index-Typen")
+    parser.add_argument("--store", choices=sorted(STORE_CORPORA), default="specs")
+    parser.add_argument("--k", type=int, default=10, help="z.B. 48 für die MMR-Suche der Specs")
+    parser.add_argument("--queries", type=int, default=200, help="zurückgehaltene Chunks als Anfragen")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--kinds", nargs="+", choices=list(SWEEPS), help="Standard: alle")
+    parser.add_argument("--output", help="Bericht zusätzlich als JSON-Datei")
+    args = parser.parse_args()
+
+    load_dotenv(find_dotenv(), override=True)
+    store, _ = _load_or_build_store(STORE_CORPORA[args.store])
+    embeddings = store.faiss.embedding_function
+    vectors = np.asarray(embeddings.embed_documents(list(store.chunks.texts())), dtype=np.float32)
+    report = ann_report(vectors, args.k, args.queries, args.target_recall, args.kinds)
+    report.update(store=args.store, embedding_model=embedding_model_name())
+    run_id = new_run_id()
+    RunStore().put(run_id, "ann_report", report, kind="ann")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"Store {args.store}: {report['vectors']} Vektoren × {report['dim']}, {report['queries']} Anfragen, "
+          f"k={report['k']} (Run {run_id})")
+    print(f"{'Index':<24} {'Breite':>6} {'Recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'MB':>8} {'×Flat':>6} {'Aufbau s':>9}")
+    for kind, entry in report["indexes"].items():
+        for r in entry["sweep"]:
+            mark = " *" if r["breadth"] == entry["recommended"] and r["breadth"] is not None else ""
+            print(f"{entry['factory']:<24} {str(r['breadth'] or '-'):>6} {r['recall']:>7.4f} {r['p50_ms']:>8.3f} "
+                  f"{r['p95_ms']:>8.3f} {entry['bytes'] / 1e6:>8.2f} {entry['bytes_vs_flat'] or 0:>6.3f} "
+                  f"{entry['build_s']:>9.2f}{mark}")
+    print(f"* kleinste Suchbreite mit Recall >= {args.target_recall} "
+          "(FAISS_EF_SEARCH bzw. FAISS_NPROBE; wirkt ohne Neuaufbau)")
+    for kind, entry in report["indexes"].items():
+        if entry["fallback"]:
+            print(f"{kind}: {entry['fallback']}")
+
+
+if __name__ == "__main__":
+    main()
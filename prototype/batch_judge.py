@@ -0,0 +1,142 @@
+# Headless Batch-Bewertung vieler Fragen (CSV/JSONL) mit Checkpoint/Resume
+#
+#   python prototype/batch_judge.py fragen.csv --workers 4
+#   python prototype/batch_judge.py fragen.jsonl --csv evaluation_results.csv
+#
+# Eingabe: Spalten/Felder 'question' und 'origin' (Namen per --question-col/--origin-col).
+# Jede fertige Frage wird sofort in die Checkpoint-Datei geschrieben; ein abgebrochener
+# Lauf setzt beim erneuten Start dort fort. Ergebnisse gehen am Ende gesammelt in den
+# Ergebnis-Store (bereits übernommene Einträge werden im Checkpoint markiert, der Store
+# überspringt sie zusätzlich über ihren Inhalts-Hash), optional zusätzlich als CSV (--csv).
+import argparse
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Tuple
+import pandas as pd
+from dotenv import load_dotenv, find_dotenv
+from rag_utils import LazyStores, load_specs_for_evaluation
+from llm_judge import evaluate_question, results_to_row
+from results_store import ResultsStore
+
+
+def read_questions(path: str, question_col: str = "question", origin_col: str = "origin",
+                   default_origin: str = "unbekannt") -> List[Tuple[str, str, str]]:
+    """
+    Liest (key, origin, question). Der Key hängt nur vom Inhalt ab (+ laufende Nummer bei
+    Duplikaten), damit ein Resume auch bei umsortierter Eingabe passt.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        rows = pd.read_csv(path).fillna("").to_dict("records")
+    out, seen = [], {}
+    for r in rows:
+        q = str(r.get(question_col, "")).strip()
+        if not q:
+            continue
+        origin = str(r.get(origin_col, "") or default_origin).strip()
+        h = hashlib.sha256(f"{origin}\x00{q}".encode("utf-8")).hexdigest()[:32]
+        seen[h] = seen.get(h, 0) + 1
+        out.append((f"{h}#{seen[h]}", origin, q))
+    return out
+
+
+def read_checkpoint(path: Path) -> Dict[str, Dict]:
+    done: Dict[str, Dict] = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # halb geschriebene letzte Zeile nach Absturz
+                if entry.get("exported"):
+                    if entry["key"] in done:
+                        done[entry["key"]]["exported"] = True
+                else:
+                    done[entry["key"]] = entry
+    return done
+
+
+def run_batch(items: List[Tuple[str, str, str]], specs: Dict[int, str], checkpoint: Path,
+              workers: int = 4) -> List[Dict]:
+    """Bewertet alle noch nicht im Checkpoint stehenden Fragen parallel; liefert alle Einträge."""
+    done = read_checkpoint(checkpoint)
+    todo = [it for it in items if it[0] not in done]
+    print(f"{len(items)} Fragen, {len(items) - len(todo)} bereits bewertet, {len(todo)} offen")
+    lock = threading.Lock()
+    checkpoint.parent.mkdir(parents=True, exist_ok=True)
+    with open(checkpoint, "a", encoding="utf-8") as ckpt, ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(evaluate_question, q, specs=specs): (key, origin, q) for key, origin, q in todo}
+        for n, fut in enumerate(as_completed(futures), 1):
+            key, origin, q = futures[fut]
+            try:
+                results = fut.result()
+            except Exception as e:
+                print(f"[{n}/{len(todo)}] Fehler ({origin}): {e}")
+                continue
+            entry = {"key": key, "origin": origin, "question": q, "results": results}
+            with lock:
+                ckpt.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                ckpt.flush()
+            done[key] = entry
+            print(f"[{n}/{len(todo)}] {origin}: Ø {results_to_row(q, results, origin)['average_score']}")
+    return [done[key] for key, _, _ in items if key in done]
+
+
+def result_key(entry: Dict) -> str:
+    """
+    Inhalts-Hash eines Checkpoint-Eintrags als result_key im Store: stürzt der Lauf zwischen
+    append_many und mark_exported ab, schreibt der Resume dieselben Einträge nicht doppelt.
+    """
+    raw = json.dumps([entry["key"], entry["origin"], entry["question"], entry["results"]],
+                     ensure_ascii=False, sort_keys=True)
+    return "batch:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def mark_exported(checkpoint: Path, entries: List[Dict]) -> None:
+    """Vermerkt exportierte Einträge, damit ein erneuter Start sie nicht doppelt in die CSV schreibt."""
+    with open(checkpoint, "a", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps({"key": e["key"], "exported": True}) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-Bewertung von Abituraufgaben (LLM-as-a-Judge)")
+    parser.add_argument("input", help="CSV oder JSONL mit Fragen")
+    parser.add_argument("--db", help="Ergebnis-Store (Standard: RESULTS_DB bzw. evaluation_results.sqlite)")
+    parser.add_argument("--csv", help="nach dem Lauf alle Ergebnisse zusätzlich als CSV exportieren")
+    parser.add_argument("--checkpoint", help="Standard: <RUNS_DIR>/batch_<input>.checkpoint.jsonl")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", "4")))
+    parser.add_argument("--question-col", default="question")
+    parser.add_argument("--origin-col", default="origin")
+    parser.add_argument("--default-origin", default="unbekannt")
+    args = parser.parse_args()
+
+    load_dotenv(find_dotenv(), override=True)
+    items = read_questions(args.input, args.question_col, args.origin_col, args.default_origin)
+    checkpoint = Path(args.checkpoint or os.path.join(
+        os.getenv("RUNS_DIR", "runs"), f"batch_{Path(args.input).stem}.checkpoint.jsonl"))
+
+    # Specs-Snapshot einmal für alle Fragen
+    specs = load_specs_for_evaluation(LazyStores())  # lädt nur den Specs-Index
+    entries = [e for e in run_batch(items, specs, checkpoint, workers=args.workers) if not e.get("exported")]
+
+    store = ResultsStore(args.db)
+    written = store.append_many([results_to_row(e["question"], e["results"], e["origin"]) for e in entries],
+                                models=[e["results"][0].get("_meta", {}).get("model") for e in entries],
+                                keys=[result_key(e) for e in entries])
+    mark_exported(checkpoint, entries)
+    print(f"{written} Bewertungen nach {store.path} geschrieben, {len(entries) - written} bereits vorhanden "
+          f"(Checkpoint: {checkpoint})")
+    if args.csv:
+        print(f"{store.export_csv(args.csv)} Zeilen nach {args.csv} exportiert")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# Offline-Benchmark für Ingestion, Indexing, Retrieval und Bewertung – ohne Netz/OpenAI
+#
+#   python prototype/benchmark.py                                  # Ergebnis nach RUNS_DIR/benchmark_<ts>.json
+#   python prototype/benchmark.py --save-baseline                  # Ergebnis zusätzlich als Baseline ablegen
+#   python prototype/benchmark.py --fail-on-regression --tolerance 0.25
+#
+# Läuft auf den echten PDFs unter DATA_ROOT mit dem lokalen Hash-Embedder (EMBEDDING_BACKEND=local)
+# und einem Fake-Chat-Modell mit einstellbarer Latenz. Index, Embedding-/Judge-Cache und Ergebnis-Store
+# liegen in einem Temp-Verzeichnis, die vorhandenen Caches bleiben unberührt.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# Erhöhen, wenn sich Stufen/Messmethode ändern -> alte Baselines werden nicht mehr verglichen
+BENCH_FORMAT = 1
+
+SEARCH_QUERIES = [
+    "Operatoren Definitionen Beispiele Anforderungsbereiche Deutsch Abitur",
+    "Erwartungshorizont Bewertungshinweise Interpretation Gedicht",
+    "Materialgestütztes Verfassen argumentierender Texte",
+    "Auswahlhäufigkeit Themen Aufgabenwahl Schulen",
+    "Aufgabenarten Prinzipien Varianten materialgestützt",
+    "Erörterung pragmatischer Texte Kommentar",
+]
+
+
+class FakeChatModel:
+    """Stand-in für ChatOpenAI: feste Latenz (+ Jitter), deterministische Judge-Antworten im JSON-Format."""
+    def __init__(self, latency: float = 0.5, jitter: float = 0.1, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.model_name = "fake-chat"
+        self.top_p = 1.0
+        self._rng = random.Random(seed)
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+
+    def _answer(self, prompt: str) -> str:
+        score = 1 + sum(map(ord, prompt[-64:])) % 5
+        answer = {"score": score, "rationale": "Benchmark-Antwort (Fake-Modell)."}
+        crits = re.findall(r"^### Kriterium (\S+)", prompt, flags=re.M)  # Ein-Aufruf-Modus
+        return json.dumps({c: answer for c in crits} if crits else answer, ensure_ascii=False)
+
+    def bind(self, **kwargs) -> "FakeChatModel":
+        return self
+
+    def invoke(self, prompt: str) -> AIMessage:
+        time.sleep(self._delay())
+        return AIMessage(content=self._answer(prompt))
+
+    async def ainvoke(self, prompt: str) -> AIMessage:
+        await asyncio.sleep(self._delay())
+        return AIMessage(content=self._answer(prompt))
+
+    def stream(self, prompt: str):
+        words = self._answer(prompt).split(" ")
+        for w in words:
+            time.sleep(self._delay() / len(words))
+            yield AIMessageChunk(content=w + " ")
+
+
+class Timings:
+    """Sammelt Laufzeiten pro Stufe (Sekunden)."""
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    @contextmanager
+    def measure(self, stage: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(stage, []).append(time.perf_counter() - t0)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        out = {}
+        for stage, values in self.samples.items():
+            ms = np.asarray(values) * 1000.0
+            out[stage] = {
+                "n": int(len(ms)),
+                "mean_ms": round(float(ms.mean()), 3),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                "min_ms": round(float(ms.min()), 3),
+                "max_ms": round(float(ms.max()), 3),
+            }
+        return out
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(workdir: Path, repeat: int = 20, judge_latency: float = 0.5, judge_runs: int = 3,
+                  export_rows: int = 1000) -> Dict:
+    # Umgebung vor den Aufrufen setzen: alle Caches/Stores im Temp-Verzeichnis, keine Netzaufrufe
+    os.environ.update({
+        "EMBEDDING_BACKEND": "local",
+        "INDEX_DIR": str(workdir / "index"),
+        "EMBEDDING_CACHE_DIR": str(workdir / "embeddings"),
+        "JUDGE_CACHE_DB": str(workdir / "judge_cache.sqlite"),
+        "RESULTS_DB": str(workdir / "results.sqlite"),
+    })
+    import llm_judge
+    from indexing import DocFilter, build_faiss
+    from pdf_extract import extract_documents_from_dir
+    from rag_utils import (CORPORA, _corpus_dir, _prepare_corpora, get_generation_contexts,
+                           load_specs_for_evaluation, setup_vectorstores)
+    from results_store import ResultsStore
+
+    t = Timings()
+    meta: Dict = {"corpora": {}}
+
+    # 1) Ingestion + Chunking + Embedding/FAISS (ohne Index-Cache)
+    raw = {}
+    for label in CORPORA:
+        with t.measure(f"extract.{label}"):
+            raw[label] = extract_documents_from_dir(_corpus_dir(label), label)
+    with t.measure("chunking"):
+        chunks = _prepare_corpora(raw)
+    for label, docs in chunks.items():
+        meta["corpora"][label] = {"pages": len(raw[label]), "chunks": len(docs)}
+        if docs:
+            with t.measure(f"build_faiss.{label}"):
+                build_faiss(docs)
+
+    # 2) Persistenter Index: Erstaufbau (Embeddings bereits im Cache) und Laden
+    with t.measure("setup_vectorstores.cold"):
+        setup_vectorstores()
+    with t.measure("setup_vectorstores.warm"):
+        stores = setup_vectorstores()
+
+    # 3) Retrieval: ohne Cache (p50/p95/p99 über alle Queries), gefiltert, aus dem Cache
+    for store in stores.values():
+        for q in SEARCH_QUERIES:
+            store.search(q, use_cache=False)  # Aufwärmen (Query-Embeddings, Page-Cache)
+    for _ in range(repeat):
+        for key, store in stores.items():
+            for q in SEARCH_QUERIES:
+                with t.measure(f"search.{key}"):
+                    store.search(q, k=6, use_cache=False)
+        for q in SEARCH_QUERIES:
+            with t.measure("search.filtered"):
+                stores["specs"].search(q, k=12, where=DocFilter.of(pages=(1, 3)), use_cache=False)
+            stores["specs"].search(q, k=6)  # füllt den Cache
+            with t.measure("search.cached"):
+                stores["specs"].search(q, k=6)
+        for store in stores.values():
+            store.clear_cache()
+        with t.measure("generation_contexts"):
+            get_generation_contexts(stores)
+
+    t.samples["search"] = [x for key in stores for x in t.samples[f"search.{key}"]]
+
+    # 4) Specs-Snapshot: erste Berechnung, danach aus dem Artefakt
+    with t.measure("specs_snapshot.cold"):
+        specs = load_specs_for_evaluation(stores)
+    with t.measure("specs_snapshot.warm"):
+        load_specs_for_evaluation(stores)
+
+    # 5) Bewertung mit Fake-Modell (Latenz pro Aufruf = judge_latency)
+    llm_judge.get_llm_evaluator = lambda max_retries=None: FakeChatModel(latency=judge_latency)
+    question = "Interpretieren Sie das Gedicht unter Berücksichtigung der Epoche."
+    results = None
+    for i in range(judge_runs):
+        with t.measure("evaluate_question.concurrent"):
+            results = llm_judge.evaluate_question(f"{question} ({i})", specs=specs, concurrent=True,
+                                                  use_cache=False)
+        with t.measure("evaluate_question.sequential"):
+            llm_judge.evaluate_question(f"{question} ({i})", specs=specs, concurrent=False, use_cache=False)
+        with t.measure("evaluate_question.single"):
+            llm_judge.evaluate_question(f"{question} ({i})", specs=specs, mode="single", use_cache=False)
+    llm_judge.evaluate_question(question, specs=specs, use_cache=True)
+    with t.measure("evaluate_question.cached"):
+        llm_judge.evaluate_question(question, specs=specs, use_cache=True)
+    meta["judge_latency_s"] = judge_latency
+
+    # 6) Ergebnis-Store + CSV-Export
+    store = ResultsStore(legacy_csv=None)
+    row = llm_judge.results_to_row(question, results, "benchmark")
+    with t.measure("results.append"):
+        store.append_many([row] * export_rows)
+    with t.measure("results.export_csv"):
+        store.export_csv(str(workdir / "export.csv"))
+    meta["export_rows"] = export_rows
+
+    return {"meta": meta, "stages": t.summary()}
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float, floor_ms: float = 1.0) -> Dict[str, Dict]:
+    """
+    Vergleicht p50 und p95 pro Stufe mit der Baseline. Regression, wenn eine der beiden um mehr als
+    'tolerance' (relativ) *und* mehr als 'floor_ms' (absolut, Rauschen bei sehr kurzen Stufen) steigt.
+    """
+    out = {}
+    for stage, cur in current["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base:
+            continue
+        ratios, status = {}, "ok"
+        for metric in ("p50_ms", "p95_ms"):
+            b, c = base[metric], cur[metric]
+            ratios[metric] = round(c / b, 3) if b > 0 else None
+            if c > b * (1 + tolerance) and c - b > floor_ms:
+                status = "regression"
+            elif status == "ok" and c < b * (1 - tolerance) and b - c > floor_ms:
+                status = "improvement"
+        out[stage] = {"status": status, "baseline_p50_ms": base["p50_ms"], "p50_ms": cur["p50_ms"], **{
+            f"ratio_{m}": r for m, r in ratios.items()}}
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline-Benchmark (lokaler Embedder, Fake-Chat-Modell)")
+    parser.add_argument("--output", help="Standard: <RUNS_DIR>/benchmark_<ts>.json")
+    parser.add_argument("--baseline", default=os.getenv("BENCH_BASELINE", "benchmark_baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Ergebnis als neue Baseline speichern")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="erlaubte relative Verschlechterung")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit-Code 1 bei Regressionen")
+    parser.add_argument("--repeat", type=int, default=20, help="Wiederholungen der Suchanfragen")
+    parser.add_argument("--judge-latency", type=float, default=0.5, help="Sekunden pro Fake-LLM-Aufruf")
+    parser.add_argument("--judge-runs", type=int, default=3)
+    parser.add_argument("--export-rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="abibuddy_bench_") as tmp:
+        report = run_benchmark(Path(tmp), repeat=args.repeat, judge_latency=args.judge_latency,
+                               judge_runs=args.judge_runs, export_rows=args.export_rows)
+    report["meta"].update({
+        "format": BENCH_FORMAT,
+        "ts": int(time.time()),
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "data_root": os.getenv("DATA_ROOT", "data"),
+    })
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("meta", {}).get("format") != BENCH_FORMAT:
+            print(f"Baseline {args.baseline} hat ein anderes Format – kein Vergleich")
+            baseline = None
+    if baseline is not None:
+        report["comparison"] = {
+            "baseline": args.baseline,
+            "baseline_commit": baseline["meta"].get("commit"),
+            "tolerance": args.tolerance,
+            "stages": compare(report, baseline, args.tolerance),
+        }
+
+    output = Path(args.output or os.path.join(os.getenv("RUNS_DIR", "runs"), f"benchmark_{report['meta']['ts']}.json"))
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    comparison = report.get("comparison", {}).get("stages", {})
+    print(f"{'Stufe':34} {'n':>5} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}  Baseline")
+    for stage, s in report["stages"].items():
+        c = comparison.get(stage)
+        vs = f"{c['status']} (x{c['ratio_p50_ms']})" if c else "-"
+        print(f"{stage:34} {s['n']:>5} {s['p50_ms']:>10.2f} {s['p95_ms']:>10.2f} {s['p99_ms']:>10.2f}  {vs}")
+    print(f"Ergebnis: {output}" + (f" (Baseline gespeichert: {args.baseline})" if args.save_baseline else ""))
+
+    regressions = [s for s, c in comparison.items() if c["status"] == "regression"]
+    if regressions:
+        print("Regressionen: " + ", ".join(regressions))
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
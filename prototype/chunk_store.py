@@ -0,0 +1,222 @@
+# Spaltenorientierter Chunk-Store: Texte als ein UTF-8-Blob + Offsets, Metadaten als Integer-Codes
+import json
+from array import array
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain.schema import Document
+
+# Metadaten-Felder aus pdf_extract: Strings als Codes in eine Tabelle, Seiten direkt als int32
+STRING_FIELDS = ("source", "file", "section")
+PAGE_FIELDS = ("page_start", "page_end")
+_NO_PAGE = -1
+COLUMNS = STRING_FIELDS + PAGE_FIELDS + ("rel", "ord")
+
+
+def _encode(doc_id: str, d: Document, code: Callable[[str, str], int]) -> Tuple[bytes, Dict[str, int]]:
+    """Ein Chunk -> (UTF-8-Text, Spaltenwerte); 'code(feld, wert)' vergibt die String-Codes."""
+    row: Dict[str, int] = {}
+    for f in STRING_FIELDS:
+        row[f] = code(f, str(d.metadata.get(f) or ""))
+    for f in PAGE_FIELDS:
+        page = d.metadata.get(f)
+        row[f] = _NO_PAGE if page is None else int(page)
+    rel, sep, ord_ = doc_id.rpartition("::")
+    if not sep or not ord_.isdigit():
+        rel, ord_ = doc_id, "0"  # fremde IDs (z.B. UUIDs aus FAISS)
+    row["rel"] = code("rel", rel)
+    row["ord"] = int(ord_)
+    return d.page_content.encode("utf-8"), row
+
+
+class ChunkStore:
+    """
+    Alle Chunks eines Corpus in wenigen flachen Arrays statt je einem Document + Metadaten-Dict:
+    - text.bin: Chunk-Texte hintereinander (UTF-8), offsets.npy: Byte-Grenzen (n+1)
+    - file/source/section/rel.npy: int32-Codes in strings.json, page_start/page_end.npy: int32
+    - ord.npy: laufende Nummer des Chunks innerhalb seiner PDF (Vektor-ID = "rel::ord")
+    Geladen wird per Memory-Map; Documents entstehen erst beim Zugriff auf einzelne Treffer.
+    """
+    def __init__(self, text: np.ndarray, offsets: np.ndarray, columns: Dict[str, np.ndarray],
+                 tables: Dict[str, List[str]]):
+        self._text = text
+        self.offsets = offsets
+        self.columns = columns
+        self.tables = tables
+        self._rel_start: Optional[Dict[str, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    @classmethod
+    def from_documents(cls, ids: List[str], docs: List[Document]) -> "ChunkStore":
+        tables: Dict[str, List[str]] = {f: [] for f in STRING_FIELDS + ("rel",)}
+        codes: Dict[str, Dict[str, int]] = {f: {} for f in tables}
+        columns = {f: np.empty(len(docs), dtype=np.int32) for f in COLUMNS}
+        blobs, offsets = [], np.zeros(len(docs) + 1, dtype=np.int64)
+
+        def code(field: str, value: str) -> int:
+            if value not in codes[field]:
+                codes[field][value] = len(tables[field])
+                tables[field].append(value)
+            return codes[field][value]
+
+        for i, (doc_id, d) in enumerate(zip(ids, docs)):
+            raw, row = _encode(doc_id, d, code)
+            blobs.append(raw)
+            offsets[i + 1] = offsets[i] + len(raw)
+            for f, value in row.items():
+                columns[f][i] = value
+        text = np.frombuffer(b"".join(blobs), dtype=np.uint8)
+        return cls(text, offsets, columns, tables)
+
+    def save(self, folder: Path) -> None:
+        folder.mkdir(parents=True, exist_ok=True)
+        with open(folder / "text.bin", "wb") as f:
+            f.write(np.asarray(self._text).tobytes())
+        np.save(folder / "offsets.npy", np.asarray(self.offsets))
+        for name, col in self.columns.items():
+            np.save(folder / f"{name}.npy", np.asarray(col))
+        with open(folder / "strings.json", "w", encoding="utf-8") as f:
+            json.dump(self.tables, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, folder: Path, mmap: bool = True) -> "ChunkStore":
+        mode = "r" if mmap else None
+        offsets = np.load(folder / "offsets.npy", mmap_mode=mode)
+        with open(folder / "strings.json", encoding="utf-8") as f:
+            tables = json.load(f)
+        columns = {name: np.load(folder / f"{name}.npy", mmap_mode=mode) for name in COLUMNS}
+        size = int(offsets[-1])
+        if size == 0:
+            text = np.zeros(0, dtype=np.uint8)  # np.memmap kann keine leere Datei abbilden
+        elif mmap:
+            text = np.memmap(folder / "text.bin", dtype=np.uint8, mode="r", shape=(size,))
+        else:
+            text = np.fromfile(folder / "text.bin", dtype=np.uint8, count=size)
+        return cls(text, offsets, columns, tables)
+
+    # --- Zugriff auf einzelne Chunks
+
+    def text(self, i: int) -> str:
+        return bytes(self._text[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    def texts(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def value(self, field: str, i: int) -> Union[str, int, None]:
+        if field in PAGE_FIELDS:
+            page = int(self.columns[field][i])
+            return None if page == _NO_PAGE else page
+        return self.tables[field][self.columns[field][i]]
+
+    def metadata(self, i: int) -> Dict:
+        return {f: self.value(f, i) for f in STRING_FIELDS + PAGE_FIELDS}
+
+    def chunk_id(self, i: int) -> str:
+        return f"{self.tables['rel'][self.columns['rel'][i]]}::{int(self.columns['ord'][i])}"
+
+    def doc(self, i: int) -> Document:
+        return Document(id=self.chunk_id(i), page_content=self.text(i), metadata=self.metadata(i))
+
+    def docs(self, positions: List[int]) -> List[Document]:
+        return [self.doc(i) for i in positions]
+
+    @property
+    def ids(self) -> List[str]:
+        return [self.chunk_id(i) for i in range(len(self))]
+
+    def position(self, chunk_id: str) -> Optional[int]:
+        """Position eines Chunks über seine Vektor-ID (Chunks einer PDF liegen zusammenhängend)."""
+        if self._rel_start is None:
+            rels, first = np.unique(np.asarray(self.columns["rel"]), return_index=True)
+            self._rel_start = {self.tables["rel"][r]: int(i) for r, i in zip(rels, first)}
+        rel, _, ord_ = chunk_id.rpartition("::")
+        start = self._rel_start.get(rel)
+        if start is None or not ord_.isdigit():
+            return None
+        i = start + int(ord_)
+        return i if i < len(self) and self.chunk_id(i) == chunk_id else None
+
+    def location(self, i: int) -> Tuple[int, int]:
+        """(Datei-Code, Startseite) – Fundstelle für die Dublettenerkennung der Rank-Fusion."""
+        return int(self.columns["file"][i]), int(self.columns["page_start"][i])
+
+
+class ChunkStoreWriter:
+    """
+    Schreibt einen ChunkStore batchweise direkt in 'folder' (Format wie ChunkStore.save): Texte werden an
+    text.bin angehängt, bis close() liegen nur die Integer-Spalten und String-Tabellen im RAM.
+    Danach liest ChunkStore.load(folder) den Stand memory-mapped.
+    """
+    def __init__(self, folder: Path):
+        folder.mkdir(parents=True, exist_ok=True)
+        self.folder = folder
+        self._text = open(folder / "text.bin", "wb")
+        self._offsets = array("q", [0])
+        self._columns = {f: array("i") for f in COLUMNS}
+        self.tables: Dict[str, List[str]] = {f: [] for f in STRING_FIELDS + ("rel",)}
+        self._codes: Dict[str, Dict[str, int]] = {f: {} for f in self.tables}
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def _code(self, field: str, value: str) -> int:
+        if value not in self._codes[field]:
+            self._codes[field][value] = len(self.tables[field])
+            self.tables[field].append(value)
+        return self._codes[field][value]
+
+    def add(self, ids: List[str], docs: List[Document]) -> None:
+        for doc_id, d in zip(ids, docs):
+            raw, row = _encode(doc_id, d, self._code)
+            self._text.write(raw)
+            self._offsets.append(self._offsets[-1] + len(raw))
+            for f, value in row.items():
+                self._columns[f].append(value)
+
+    def close(self) -> None:
+        if self._text.closed:
+            return
+        self._text.close()
+        np.save(self.folder / "offsets.npy", np.frombuffer(self._offsets, dtype=np.int64))
+        for name, col in self._columns.items():
+            np.save(self.folder / f"{name}.npy", np.frombuffer(col, dtype=np.int32))
+        with open(self.folder / "strings.json", "w", encoding="utf-8") as f:
+            json.dump(self.tables, f, ensure_ascii=False)
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class ChunkDocstore(Docstore):
+    """Read-only Docstore für FAISS über einem ChunkStore (keine zweite Kopie der Chunks)."""
+    def __init__(self, chunks: ChunkStore):
+        self.chunks = chunks
+
+    def search(self, search: str) -> Union[str, Document]:
+        i = self.chunks.position(search)
+        return f"ID {search} not found." if i is None else self.chunks.doc(i)
+
+
+class ChunkIds(Mapping):
+    """FAISS-Position -> Vektor-ID, ohne ein Dict mit n Strings anzulegen (FAISS-Position == Chunk-Position)."""
+    def __init__(self, chunks: ChunkStore):
+        self.chunks = chunks
+
+    def __getitem__(self, i: int) -> str:
+        if not 0 <= i < len(self.chunks):
+            raise KeyError(i)
+        return self.chunks.chunk_id(i)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(len(self.chunks)))
+
+    def __len__(self) -> int:
+        return len(self.chunks)
@@ -0,0 +1,150 @@
+# Kontext-Packer: Treffer einer Suche -> Prompt-Abschnitt mit festem Token-Budget
+#
+# Chunks derselben Seite überlappen (chunk_overlap 100–120 Zeichen) oder grenzen direkt aneinander;
+# sie werden zu einem Segment zusammengefügt, doppelte Passagen fallen weg. Gekürzt wird erst,
+# wenn das Budget erreicht ist – und dann am Satzende statt mitten im Wort.
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+from langchain.schema import Document
+from tracing import count_tokens, truncate_tokens
+
+# Kontextfenster (Tokens) je Modell; unbekannte Modelle -> DEFAULT_CONTEXT_TOKENS
+MODEL_CONTEXT_TOKENS: Dict[str, int] = {
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+    "gpt-3.5-turbo": 16385,
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+_MIN_OVERLAP = 20    # kürzere Übereinstimmungen gelten als Zufall
+_MAX_OVERLAP = 400   # > chunk_overlap aller Corpora (siehe rag_utils.CORPORA)
+_MIN_TAIL = 40       # Rest-Budget, ab dem sich ein gekürztes Segment noch lohnt
+_SENTENCE_END = re.compile(r"[.!?:;](?=\s)|\n")
+
+
+def context_window(model: Optional[str] = None) -> int:
+    model = model or os.getenv("OPENAI_MODEL", "gpt-4")
+    # längster passender Präfix, z.B. "gpt-4o-2024-08-06" -> "gpt-4o"
+    names = sorted((m for m in MODEL_CONTEXT_TOKENS if model.startswith(m)), key=len, reverse=True)
+    return MODEL_CONTEXT_TOKENS[names[0]] if names else DEFAULT_CONTEXT_TOKENS
+
+
+def fit_budgets(budgets: Dict[str, int], reserve: int, model: Optional[str] = None) -> Dict[str, int]:
+    """
+    Budgets (Tokens je Abschnitt) für 'model': skaliert mit CONTEXT_BUDGET_SCALE und, falls nötig,
+    proportional verkleinert, sodass Abschnitte + 'reserve' (Template, Antwort) ins Kontextfenster passen.
+    """
+    scale = float(os.getenv("CONTEXT_BUDGET_SCALE", "1.0"))
+    scaled = {name: int(b * scale) for name, b in budgets.items()}
+    room = context_window(model) - reserve
+    total = sum(scaled.values())
+    if room <= 0:
+        raise RuntimeError(f"Kontextfenster von '{model}' zu klein für die Prompt-Reserve ({reserve} Tokens).")
+    if total > room:
+        scaled = {name: int(b * room / total) for name, b in scaled.items()}
+    return scaled
+
+
+def _overlap(a: str, b: str) -> int:
+    """Länge des längsten Suffixes von a, mit dem b beginnt (0, wenn kürzer als _MIN_OVERLAP)."""
+    tail = a[-_MAX_OVERLAP:]
+    probe = b[:_MIN_OVERLAP]
+    if len(probe) < _MIN_OVERLAP:
+        return 0
+    i = tail.find(probe)
+    while i >= 0:
+        if b.startswith(tail[i:]):
+            return len(tail) - i
+        i = tail.find(probe, i + 1)
+    return 0
+
+
+def _ord(d: Document) -> Optional[int]:
+    """Laufende Chunk-Nummer innerhalb der PDF aus der Vektor-ID ('rel::n'), falls vorhanden."""
+    _, sep, n = (getattr(d, "id", None) or "").rpartition("::")
+    return int(n) if sep and n.isdigit() else None
+
+
+class _Segment:
+    """Zusammenhängender Text einer Seite aus einem oder mehreren Chunks (lo/hi: Chunk-Nummern)."""
+    def __init__(self, key: Tuple[str, object], text: str, ord_: Optional[int]):
+        self.key = key
+        self.text = text
+        self.lo = self.hi = ord_
+
+    def absorb(self, other: "_Segment") -> bool:
+        """Übernimmt 'other' vorne/hinten, wenn es enthalten ist, überlappt oder direkt angrenzt."""
+        if other.text in self.text:
+            return True
+        k = _overlap(self.text, other.text)
+        if k or (other.lo is not None and self.hi is not None and other.lo == self.hi + 1):
+            self.text = self.text + (other.text[k:] if k else "\n" + other.text)
+            self.hi = other.hi if other.hi is not None else self.hi
+            return True
+        k = _overlap(other.text, self.text)
+        if k or (other.hi is not None and self.lo is not None and other.hi == self.lo - 1):
+            self.text = (other.text[:-k] if k else other.text + "\n") + self.text
+            self.lo = other.lo if other.lo is not None else self.lo
+            return True
+        return False
+
+
+def _add(segments: List[_Segment], seg: _Segment) -> None:
+    """Fügt 'seg' ein; ein gewachsenes Segment wird weiter mit seinen Nachbarn verschmolzen."""
+    pos = next((i for i, s in enumerate(segments) if s is seg), None)
+    for i, s in enumerate(segments):
+        if s is not seg and s.key == seg.key and s.absorb(seg):
+            if pos is not None:
+                segments.pop(pos)
+                if pos < i:  # Segment steht an der Stelle seines bestgerankten Chunks
+                    segments.insert(pos, segments.pop(i - 1))
+            _add(segments, s)
+            return
+    if pos is None:
+        segments.append(seg)
+
+
+def merge_chunks(docs: List[Document]) -> List[str]:
+    """
+    Treffer in Rang-Reihenfolge -> Segmente: Chunks derselben Datei/Seite werden zusammengefügt,
+    Duplikate (auch als Teilstring eines anderen Treffers) entfallen.
+    """
+    segments: List[_Segment] = []
+    for d in docs:
+        text = d.page_content.strip()
+        if not text or any(text in s.text for s in segments):
+            continue  # auch identische Passagen aus anderen Dateien/Seiten (z.B. Pool-Jahrgänge)
+        key = (d.metadata.get("file") or d.metadata.get("source") or "", d.metadata.get("page_start"))
+        _add(segments, _Segment(key, text, _ord(d)))
+    # ein gewachsenes Segment kann ein anderes (fremder Seite) jetzt vollständig enthalten
+    return [s.text for i, s in enumerate(segments)
+            if not any(j != i and s.text in o.text and (len(o.text) > len(s.text) or j < i)
+                       for j, o in enumerate(segments))]
+
+
+def _cut_at_sentence(text: str) -> str:
+    ends = [m.end() for m in _SENTENCE_END.finditer(text)]
+    cut = ends[-1] if ends and ends[-1] >= len(text) // 2 else len(text)
+    return text[:cut].rstrip() + " …"
+
+
+def pack_context(docs: List[Document], budget: int, model: Optional[str] = None) -> str:
+    """Segmente in Rang-Reihenfolge, bis 'budget' Tokens erreicht sind; das letzte ggf. am Satzende gekürzt."""
+    out: List[str] = []
+    used = 0
+    sep = count_tokens("\n\n", model)
+    for text in merge_chunks(docs):
+        cost = count_tokens(text, model) + (sep if out else 0)
+        if used + cost <= budget:
+            out.append(text)
+            used += cost
+            continue
+        room = budget - used - (sep if out else 0) - 1  # 1 Token für " …"
+        if room >= _MIN_TAIL:
+            out.append(_cut_at_sentence(truncate_tokens(text, room, model)))
+        break
+    return "\n\n".join(out)
@@ -0,0 +1,259 @@
+# Chunk-Embedding-Cache (Modell + normalisierter Text) mit gebatchten, rate-limitierten Backend-Aufrufen
+import hashlib
+import json
+import re
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+import openai
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from tracing import count_tokens, current_trace, span
+
+try:
+    import fcntl
+except ImportError:  # Windows: kein flock, dann nur ein schreibender Prozess je Cache-Verzeichnis
+    fcntl = None
+
+# wie llm_judge._RETRYABLE: alles andere (Auth, Bad Request, Programmfehler) sofort durchreichen
+_RETRYABLE = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError)
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace-Varianten (Zeilenumbrüche, Mehrfach-Leerzeichen aus PDFs) gelten als gleicher Chunk."""
+    return " ".join(text.split())
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class LocalHashEmbeddings(Embeddings):
+    """
+    Deterministischer, lokaler Embedder (Feature-Hashing über Wörter + Bigramme).
+    Kein Netz, keine Kosten – für Tests/Benchmarks anstelle von OpenAI.
+    """
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        tokens = re.findall(r"\w+", text.lower())
+        for feat in tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]:
+            h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) else -1.0
+        norm = float(np.linalg.norm(vec))
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class _VectorFile:
+    """
+    Append-only float32-Matrix (vectors.f32, per np.memmap gelesen) + Key-Index (keys.jsonl).
+    Zeile i in vectors.f32 gehört zur i-ten Zeile in keys.jsonl. Eine Instanz pro Verzeichnis und Prozess;
+    mehrere Prozesse schreiben nacheinander unter einem flock (Datei 'lock') und übernehmen vorher,
+    was die anderen angehängt haben.
+    """
+    def __init__(self, folder: Path):
+        self.folder = folder
+        self.lock = threading.Lock()
+        self.rows: Dict[str, int] = {}
+        self.dim: Optional[int] = None
+        self.matrix: Optional[np.memmap] = None
+        self._ends = array("q")  # Byte-Offset des Zeilenendes je Zeile in keys.jsonl
+        folder.mkdir(parents=True, exist_ok=True)
+        with self.lock, self._file_lock():
+            self._sync()
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        with open(self.folder / "lock", "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _read_dim(self) -> None:
+        if self.dim is None:
+            try:
+                with open(self.folder / "meta.json", encoding="utf-8") as f:
+                    self.dim = int(json.load(f)["dim"])
+            except (OSError, ValueError, KeyError):
+                pass
+
+    def _sync(self) -> None:
+        """
+        Nur unter dem Datei-Lock: neue Zeilen anderer Prozesse einlesen und beide Dateien auf die gemeinsame
+        Länge kürzen (abgebrochene Schreibvorgänge). Eine abgerissene letzte Key-Zeile fällt weg; eine
+        unlesbare vollständige Zeile belegt ihre Vektor-Zeile weiter, damit die Zuordnung stimmt.
+        """
+        self._read_dim()
+        keys_path, vec_path = self.folder / "keys.jsonl", self.folder / "vectors.f32"
+        size = keys_path.stat().st_size if keys_path.exists() else 0
+        offset = self._ends[-1] if self._ends else 0
+        if size < offset:  # extern gekürzt/ersetzt -> komplett neu einlesen
+            self.rows, self._ends, offset = {}, array("q"), 0
+        first = len(self._ends)
+        new_keys: List[Optional[str]] = []
+        if size > offset:
+            with open(keys_path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            pos = offset
+            for line in data.splitlines(keepends=True):
+                if not line.endswith(b"\n"):
+                    break
+                pos += len(line)
+                try:
+                    key = json.loads(line)
+                except ValueError:
+                    key = None
+                new_keys.append(key if isinstance(key, str) else None)
+                self._ends.append(pos)
+
+        vec_rows = vec_path.stat().st_size // (4 * self.dim) if self.dim and vec_path.exists() else 0
+        n = min(len(self._ends), vec_rows)
+        if len(self._ends) > n:
+            del self._ends[n:]
+            if n < first:
+                self.rows = {k: r for k, r in self.rows.items() if r < n}
+        keys_end = self._ends[-1] if self._ends else 0
+        if size != keys_end and keys_path.exists():
+            with open(keys_path, "r+b") as f:
+                f.truncate(keys_end)
+        if self.dim and vec_path.exists() and vec_path.stat().st_size != n * 4 * self.dim:
+            with open(vec_path, "r+b") as f:
+                f.truncate(n * 4 * self.dim)
+        # erst die Matrix vergrößern, dann die Keys sichtbar machen (lesende Threads ohne Lock)
+        self._remap(n)
+        for i, key in enumerate(new_keys[:max(0, n - first)]):
+            if key is not None:
+                self.rows[key] = first + i
+
+    def _remap(self, n: int) -> None:
+        self.matrix = (
+            np.memmap(self.folder / "vectors.f32", dtype=np.float32, mode="r", shape=(n, self.dim))
+            if n else None
+        )
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        row = self.rows.get(key)
+        return None if row is None or self.matrix is None else self.matrix[row]
+
+    def refresh(self) -> None:
+        """Übernimmt Einträge, die andere Prozesse inzwischen angehängt haben."""
+        with self.lock, self._file_lock():
+            self._sync()
+
+    def append(self, keys: List[str], vectors: np.ndarray) -> None:
+        with self.lock, self._file_lock():
+            self._read_dim()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.folder / "meta.json", "w", encoding="utf-8") as f:
+                    json.dump({"dim": self.dim}, f)
+            if vectors.shape[1] != self.dim:
+                raise RuntimeError(f"Embedding-Dimension {vectors.shape[1]} passt nicht zum Cache ({self.dim}).")
+            self._sync()
+            start = len(self._ends)
+            with open(self.folder / "vectors.f32", "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.folder / "keys.jsonl", "ab") as f:
+                pos = self._ends[-1] if self._ends else 0
+                for k in keys:
+                    line = (json.dumps(k) + "\n").encode("utf-8")
+                    f.write(line)
+                    pos += len(line)
+                    self._ends.append(pos)
+            self._remap(start + len(keys))
+            for i, k in enumerate(keys):
+                self.rows[k] = start + i
+
+
+_FILES: Dict[Path, _VectorFile] = {}
+_FILES_LOCK = threading.Lock()
+
+
+def _vector_file(folder: Path) -> _VectorFile:
+    folder = folder.resolve()
+    with _FILES_LOCK:
+        if folder not in _FILES:
+            _FILES[folder] = _VectorFile(folder)
+        return _FILES[folder]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings-Wrapper mit persistentem Cache pro (Modell, normalisierter Chunk-Text).
+    - identische Chunks (über Pool-Jahre / innerhalb eines Corpus) werden nur einmal eingebettet
+    - Cache-Misses gehen in Batches von 'batch_size' an das Backend
+    - max. 'requests_per_minute' Backend-Aufrufe, Retry mit exponentiellem Backoff
+    """
+    def __init__(self, backend: Embeddings, model_tag: str, cache_dir: str,
+                 batch_size: int = 256, requests_per_minute: int = 0, max_retries: int = 5):
+        self.backend = backend
+        self.model_tag = model_tag
+        self.batch_size = max(1, batch_size)
+        self.min_interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self.max_retries = max_retries
+        safe_tag = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_tag)
+        self.store = _vector_file(Path(cache_dir) / safe_tag)
+        self._last_call = 0.0
+        self._rate_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _call_backend(self, texts: List[str]) -> List[List[float]]:
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            with self._rate_lock:
+                wait = self._last_call + self.min_interval - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                self._last_call = time.monotonic()
+            try:
+                return self.backend.embed_documents(texts)
+            except _RETRYABLE:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 60.0)
+        return []  # unerreichbar
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(t) for t in texts]
+        missing: Dict[str, str] = {}
+        for k, t in zip(keys, texts):
+            if self.store.get(k) is None and k not in missing:
+                missing[k] = normalize_text(t)
+        if missing:
+            # evtl. hat ein anderer Prozess sie inzwischen eingebettet
+            self.store.refresh()
+            missing = {k: t for k, t in missing.items() if self.store.get(k) is None}
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        todo = list(missing.items())
+        for i in range(0, len(todo), self.batch_size):
+            batch = todo[i:i + self.batch_size]
+            with span("embedding.backend", model=self.model_tag, texts=len(batch)) as s:
+                if current_trace() is not None:
+                    s["tokens_in"] = sum(count_tokens(t, self.model_tag) for _, t in batch)
+                vectors = self._call_backend([t for _, t in batch])
+            self.store.append([k for k, _ in batch], np.asarray(vectors, dtype=np.float32))
+
+        return [self.store.get(k).tolist() for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
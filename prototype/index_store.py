@@ -0,0 +1,377 @@
+# Persistenter, inhaltsadressierter Index-Cache für die Vectorstores (specs/pool/eval)
+# inkl. inkrementeller Aktualisierung bei neuen, geänderten oder gelöschten PDFs
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import faiss as faiss_lib
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+from langchain.schema import Document
+from chunk_store import ChunkDocstore, ChunkIds, ChunkStore, ChunkStoreWriter
+from lexical import BM25Index
+
+try:
+    import fcntl
+except ImportError:  # Windows: kein flock, dann nur ein bauender Prozess je INDEX_DIR
+    fcntl = None
+
+# Erhöhen, sobald sich das Speicherformat ändert -> alte Caches werden verworfen
+INDEX_FORMAT = 4
+
+
+def index_root() -> Path:
+    return Path(os.getenv("INDEX_DIR", "index_cache"))
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_manifest(label: str) -> Optional[Dict]:
+    try:
+        with open(index_root() / label / "manifest.json", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def build_manifest(label: str, base_dir: str, chunk_size: int, overlap: int,
+                   embedding_model: str, index: Optional[Dict] = None) -> Dict:
+    """
+    Beschreibt den Inhalt eines Corpus: SHA-256 jeder PDF + Chunk-Parameter + Embedding-Modell
+    (+ Aufbau-Parameter eines ANN-Index, siehe indexing.IndexSpec; beim Flat-Index entfällt der Eintrag).
+    Hashes werden aus dem letzten Manifest übernommen, solange Größe und mtime gleich sind,
+    damit ein Start ohne Änderungen keine PDFs neu einlesen muss.
+    """
+    previous = (_read_manifest(label) or {}).get("files", {})
+    files: Dict[str, Dict] = {}
+    base = Path(base_dir)
+    if base.is_dir():
+        for pdf_path in sorted(base.rglob("*.pdf")):
+            rel = pdf_path.relative_to(base).as_posix()
+            st = pdf_path.stat()
+            old = previous.get(rel) or {}
+            if old.get("size") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns:
+                sha = old["sha256"]
+            else:
+                sha = file_sha256(pdf_path)
+            files[rel] = {"sha256": sha, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    manifest = {
+        "format": INDEX_FORMAT,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "embedding_model": embedding_model,
+        "files": files,
+    }
+    if index:
+        manifest["index"] = index
+    return manifest
+
+
+def manifest_key(manifest: Dict) -> str:
+    """Inhaltsadresse des Corpus: hängt nur von Inhalten und Parametern ab, nicht von mtimes."""
+    payload = {k: v for k, v in manifest.items() if k not in ("files", "key")}
+    payload["files"] = {rel: meta["sha256"] for rel, meta in manifest.get("files", {}).items()}
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def chunk_ids(rel: str, n: int) -> List[str]:
+    """Stabile Vektor-IDs pro Datei: '<relativer Pfad>::<Chunk-Nr.>'."""
+    return [f"{rel}::{i}" for i in range(n)]
+
+
+@dataclass
+class IndexUpdate:
+    """Was sich an einem Corpus seit dem letzten gespeicherten Index geändert hat."""
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    rebuilt: bool = False  # kompletter Neuaufbau (kein/inkompatibler Cache)
+    timings: Dict[str, float] = field(default_factory=dict)  # Extraktionszeit pro PDF (s)
+
+    def changed(self) -> bool:
+        return self.rebuilt or bool(self.added or self.modified or self.removed)
+
+    def summary(self) -> str:
+        if self.rebuilt:
+            return f"neu aufgebaut ({len(self.added)} PDFs)"
+        if not self.changed():
+            return "unverändert"
+        return f"+{len(self.added)} neu, ~{len(self.modified)} geändert, -{len(self.removed)} entfernt"
+
+    def slowest(self, n: int = 3) -> List[Tuple[str, float]]:
+        return sorted(self.timings.items(), key=lambda kv: -kv[1])[:n]
+
+
+def diff_manifests(old: Optional[Dict], new: Dict) -> IndexUpdate:
+    """Vergleicht zwei Manifeste dateiweise; andere Parameter erzwingen einen Neuaufbau."""
+    params = ("format", "chunk_size", "overlap", "embedding_model", "index")
+    if old is None or any(old.get(p) != new.get(p) for p in params):
+        return IndexUpdate(added=sorted(new["files"]), rebuilt=True)
+    old_files, new_files = old.get("files", {}), new["files"]
+    return IndexUpdate(
+        added=sorted(rel for rel in new_files if rel not in old_files),
+        modified=sorted(
+            rel for rel in new_files
+            if rel in old_files and old_files[rel]["sha256"] != new_files[rel]["sha256"]
+        ),
+        removed=sorted(rel for rel in old_files if rel not in new_files),
+    )
+
+
+@dataclass
+class StoredCorpus:
+    """Gespeicherter Stand eines Corpus: FAISS, Chunks (FAISS-Position == Chunk-Position), BM25-Index, Manifest."""
+    faiss: FAISS
+    chunks: ChunkStore
+    bm25: Optional[BM25Index]
+    manifest: Dict
+
+
+# IO_FLAG_MMAP bildet nur die invertierten Listen von IVF-Indizes ab, Flat- und HNSW-Codes landen trotzdem
+# als Kopie im RAM. Erst IO_FLAG_MMAP_IFC (neuere faiss-Versionen) mappt die Codes aller Index-Typen.
+_MMAP_FLAG = getattr(faiss_lib, "IO_FLAG_MMAP_IFC", faiss_lib.IO_FLAG_MMAP)
+
+
+def read_index(path: Path, mmap: bool) -> faiss_lib.Index:
+    """mmap=True: read-only memory-mapped (Seiten aus dem Page-Cache, von allen Prozessen geteilt)."""
+    return faiss_lib.read_index(str(path), (_MMAP_FLAG | faiss_lib.IO_FLAG_READ_ONLY) if mmap else 0)
+
+
+def _load_faiss(path: Path, embeddings: Embeddings, chunks: ChunkStore, mmap: bool, writable: bool) -> FAISS:
+    """
+    FAISS-Index aus 'path'; die Dokumente kommen aus dem Chunk-Store statt aus einem gepickelten Docstore.
+    mmap=True: read-only memory-mapped – mehrere Server-Prozesse teilen sich die Vektoren über den Page-Cache
+    (für Flat/HNSW nur mit IO_FLAG_MMAP_IFC, sonst je Prozess eine Kopie).
+    writable=True: Index im RAM, damit Vektoren entfernt werden können (nur für Updates).
+    """
+    index = read_index(path, mmap and not writable)
+    if index.ntotal != len(chunks):
+        raise RuntimeError(f"FAISS-Index ({index.ntotal}) und Chunk-Store ({len(chunks)}) passen nicht zusammen")
+    return FAISS(embeddings, index, ChunkDocstore(chunks), ChunkIds(chunks))
+
+
+def load_store(label: str, embeddings: Embeddings, mmap: bool = False,
+               writable: bool = False) -> Optional[StoredCorpus]:
+    """
+    Lädt den zuletzt gespeicherten Stand eines Corpus (None, wenn keiner/kaputt/altes Format).
+    mmap=True: FAISS-Index und Chunk-Store memory-mapped (nur zum Suchen);
+    writable=True: FAISS-Index im RAM (veränderbar), Chunk-Store memory-mapped (für inkrementelle Updates).
+    """
+    folder = index_root() / label
+    stored = _read_manifest(label)
+    if stored is None or stored.get("format") != INDEX_FORMAT:
+        return None
+    try:
+        chunks = ChunkStore.load(folder / "chunks", mmap=mmap or writable)
+        faiss = _load_faiss(folder / "faiss.index", embeddings, chunks, mmap, writable)
+        bm25 = BM25Index.load(folder / "bm25") if len(chunks) else None
+    except Exception:
+        return None  # kaputter Cache -> Neuaufbau
+    return StoredCorpus(faiss, chunks, bm25, stored)
+
+
+def _mmap_enabled() -> bool:
+    return os.getenv("INDEX_MMAP", "1") != "0"
+
+
+def _staging_dir(label: str) -> Path:
+    """Eigenes Temp-Verzeichnis je Build neben dem Corpus-Verzeichnis; wird erst mit _publish zum gültigen Cache."""
+    root = index_root()
+    root.mkdir(parents=True, exist_ok=True)
+    return Path(tempfile.mkdtemp(dir=root, prefix=f".{label}."))
+
+
+@contextmanager
+def _swap_lock(label: str) -> Iterator[None]:
+    """Serialisiert das Austauschen des Corpus-Verzeichnisses über Prozesse (und Threads) hinweg."""
+    with open(index_root() / f".{label}.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _publish(label: str, tmp: Path, manifest: Dict) -> None:
+    # Manifest zuletzt: ohne passendes Manifest gilt der Cache als ungültig
+    with open(tmp / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump({**manifest, "key": manifest_key(manifest)}, f, ensure_ascii=False, indent=2)
+    folder = index_root() / label
+    with _swap_lock(label):
+        # alten Stand erst beiseite, dann umbenennen: das Corpus-Verzeichnis fehlt nur zwischen zwei renames
+        old = Path(tempfile.mkdtemp(dir=index_root(), prefix=f".{label}.old."))
+        if folder.exists():
+            os.replace(folder, old / label)
+        os.replace(tmp, folder)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def save_store(label: str, corpus: StoredCorpus) -> None:
+    """
+    Schreibt Index + Chunks + BM25 + Manifest. Erst in ein Temp-Verzeichnis, dann Umbenennen,
+    damit ein abgebrochener Build keinen halbfertigen Cache hinterlässt.
+    """
+    tmp = _staging_dir(label)
+    faiss_lib.write_index(corpus.faiss.index, str(tmp / "faiss.index"))
+    corpus.chunks.save(tmp / "chunks")
+    if corpus.bm25 is not None:
+        corpus.bm25.save(tmp / "bm25")
+    _publish(label, tmp, corpus.manifest)
+
+
+def load_artifact(label: str, name: str, key: str) -> Optional[Dict]:
+    """
+    Liest ein abgeleitetes Artefakt (z.B. Specs-Snapshot), das neben dem Index eines Corpus liegt.
+    Nur gültig, wenn 'key' passt; bei jedem Index-Update verschwindet es mit dem alten Verzeichnis.
+    """
+    try:
+        with open(index_root() / label / f"{name}.json", encoding="utf-8") as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stored.get("payload") if stored.get("key") == key else None
+
+
+def save_artifact(label: str, name: str, key: str, payload: Dict) -> None:
+    folder = index_root() / label
+    if not folder.is_dir():
+        return  # ohne gespeicherten Index kein Artefakt
+    tmp = folder / f".{name}.json.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "payload": payload}, f, ensure_ascii=False)
+    os.replace(tmp, folder / f"{name}.json")
+
+
+def sync_store(
+    label: str,
+    manifest: Dict,
+    embeddings: Embeddings,
+    chunk_files: Callable[[List[str], Dict[str, float]], Iterable[Tuple[str, List[Document]]]],
+    batch_size: int = 512,
+    finalize: Optional[Callable[[faiss_lib.Index, Optional[faiss_lib.Index]], faiss_lib.Index]] = None,
+) -> Tuple[StoredCorpus, IndexUpdate]:
+    """
+    Bringt den gespeicherten Index eines Corpus auf den Stand von 'manifest':
+    - nichts geändert  -> Index wird nur geladen
+    - Dateien geändert -> nur neue/geänderte PDFs werden extrahiert + eingebettet,
+                          Vektoren entfernter/geänderter PDFs werden aus FAISS und BM25-Corpus gelöscht
+    - Parameter/Format geändert oder kein Cache -> kompletter Neuaufbau
+    'chunk_files(rels, timings)' liefert (rel, chunks) pro PDF (relativer Pfad) in Eingabereihenfolge.
+    Gebaut wird ein Flat-Index (L2); 'finalize(index, bisheriger_index)' macht daraus nach allen Änderungen
+    den konfigurierten ANN-Index. ANN-Indizes können keine Vektoren löschen – bei Updates wird dann ein
+    Flat-Index aus den verbleibenden Chunks aufgebaut (Embeddings aus dem Cache) und neu indexiert.
+    Extraktion -> Chunking -> Embedding -> FAISS laufen gestreamt in Batches von 'batch_size' Chunks; jeder
+    Batch geht sofort in den Chunk-Store auf der Platte (ChunkStoreWriter) und wird danach verworfen –
+    im RAM liegen nur die Vektoren, nie alle Chunk-Texte. Der BM25-Index wird danach aus dem
+    memory-mapped Chunk-Store neu berechnet (lokal, ohne Embeddings).
+    """
+    update = diff_manifests(_read_manifest(label), manifest)
+    if not update.changed():
+        # unverändert: nur lesen -> memory-mapped laden (INDEX_MMAP=0 schaltet das ab)
+        loaded = load_store(label, embeddings, mmap=_mmap_enabled())
+        if loaded is not None:
+            return loaded, update
+        update = diff_manifests(None, manifest)  # Cache unlesbar -> Neuaufbau
+    else:
+        loaded = load_store(label, embeddings, writable=True) if not update.rebuilt else None
+
+    tmp = _staging_dir(label)
+    try:
+        index, trained = None, None  # trained: bisheriger ANN-Index (Zentroiden/Codebücher) für 'finalize'
+        with ChunkStoreWriter(tmp / "chunks") as writer:
+            if loaded is None or update.rebuilt:
+                update = IndexUpdate(added=sorted(manifest["files"]), rebuilt=True)
+                todo = update.added
+            else:
+                index, old = loaded.faiss.index, loaded.chunks
+                stale = set(update.removed) | set(update.modified)
+                stale_codes = [c for c, rel in enumerate(old.tables["rel"]) if rel in stale]
+                drop = np.isin(np.asarray(old.columns["rel"]), stale_codes)
+                if not isinstance(index, faiss_lib.IndexFlat):
+                    # HNSW/IVF: kein Löschen -> Flat aus den verbleibenden Chunks, 'finalize' indexiert neu
+                    trained, index = index, None
+                elif drop.any():
+                    index.remove_ids(np.flatnonzero(drop).astype(np.int64))
+                keep = np.flatnonzero(~drop).tolist()
+                for start in range(0, len(keep), batch_size):
+                    positions = keep[start:start + batch_size]
+                    b_docs = old.docs(positions)
+                    writer.add([d.id for d in b_docs], b_docs)
+                    if trained is not None:
+                        index = _add_vectors(index, embeddings, b_docs)
+                    del b_docs
+                if index is None and trained is not None:
+                    index = faiss_lib.IndexFlatL2(trained.d)
+                todo = update.added + update.modified
+            del loaded
+
+            for batch in _iter_batches(chunk_files(todo, update.timings), batch_size):
+                b_ids, b_docs = [i for i, _ in batch], [d for _, d in batch]
+                writer.add(b_ids, b_docs)
+                index = _add_vectors(index, embeddings, b_docs)
+                del batch, b_ids, b_docs  # Batch nicht bis zur Extraktion des nächsten festhalten
+        if index is None:
+            raise RuntimeError(f"Corpus '{label}' enthält keine Chunks – kein Index")
+
+        if finalize is not None:
+            index = finalize(index, trained)
+        faiss_lib.write_index(index, str(tmp / "faiss.index"))
+        del index, trained
+        chunks = ChunkStore.load(tmp / "chunks", mmap=True)
+        if len(chunks):
+            BM25Index.build(chunks.texts()).save(tmp / "bm25")
+        _publish(label, tmp, _with_chunk_counts(manifest, chunks))
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    corpus = load_store(label, embeddings, mmap=_mmap_enabled())
+    if corpus is None:
+        raise RuntimeError(f"Gerade gespeicherter Index '{label}' ist nicht lesbar")
+    return corpus, update
+
+
+def _add_vectors(index: Optional[faiss_lib.Index], embeddings: Embeddings,
+                 docs: List[Document]) -> faiss_lib.Index:
+    """Bettet 'docs' ein (über den Embedding-Cache) und hängt sie an den Flat-Index an (wie FAISS.from_documents)."""
+    vectors = np.asarray(embeddings.embed_documents([d.page_content for d in docs]), dtype=np.float32)
+    if index is None:
+        index = faiss_lib.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return index
+
+
+def _iter_batches(chunk_stream: Iterable[Tuple[str, List[Document]]],
+                  batch_size: int) -> Iterable[List[Tuple[str, Document]]]:
+    """(rel, chunks) pro PDF -> Batches von (vektor_id, chunk) fester Größe."""
+    batch: List[Tuple[str, Document]] = []
+    for rel, chunks in chunk_stream:
+        for doc_id, d in zip(chunk_ids(rel, len(chunks)), chunks):
+            batch.append((doc_id, d))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _with_chunk_counts(manifest: Dict, chunks: ChunkStore) -> Dict:
+    per_code = np.bincount(np.asarray(chunks.columns["rel"]), minlength=len(chunks.tables["rel"]))
+    counts = {rel: int(n) for rel, n in zip(chunks.tables["rel"], per_code)}
+    files = {rel: {**meta, "chunks": counts.get(rel, 0)} for rel, meta in manifest["files"].items()}
+    return {**manifest, "files": files}
@@ -1,53 +1,553 @@
-# FAISS-Build, optionaler Hybrid-Retriever (BM25), einfacher Rank-Fusion
-from typing import List, Optional
+# FAISS-Build, Hybrid-Retriever (FAISS + BM25, siehe lexical.py), einfache Rank-Fusion
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+import numpy as np
+import faiss as faiss_lib
+from faiss import IDSelectorBatch, SearchParameters, SearchParametersHNSW, SearchParametersIVF
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 from langchain_openai import OpenAIEmbeddings
 from langchain.schema import Document
+from chunk_store import ChunkStore
+from embedding_cache import CachedEmbeddings, LocalHashEmbeddings
+from lexical import BM25Index
+from index_store import load_artifact, save_artifact
+from tracing import record, span
 
-try:
-    from langchain_community.retrievers import BM25Retriever  # nutzt rank-bm25
-except Exception:
-    BM25Retriever = None
 
+def embedding_model_name() -> str:
+    """Modell-Tag für Index-Manifest und Embedding-Cache (EMBEDDING_BACKEND=openai|local)."""
+    if os.getenv("EMBEDDING_BACKEND", "openai") == "local":
+        return "local-hash-384"
+    return os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-ada-002")
 
-def build_faiss(docs: List[Document]) -> FAISS:
-    emb = OpenAIEmbeddings()
-    return FAISS.from_documents(docs, emb)
+
+_EMBEDDINGS: Dict[Tuple, CachedEmbeddings] = {}
+_EMBEDDINGS_LOCK = threading.Lock()
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """
+    Embeddings mit persistentem Chunk-Cache (siehe embedding_cache.py).
+    Backend: OpenAI oder – für Tests ohne Netz – ein deterministischer lokaler Embedder.
+    Eine Instanz pro Konfiguration und Prozess: alle Stores teilen sich Rate-Limit und
+    Query-Batches (siehe rag_utils.search_batch).
+    """
+    cache_dir = os.getenv("EMBEDDING_CACHE_DIR") or os.path.join(os.getenv("INDEX_DIR", "index_cache"), "embeddings")
+    config = (
+        embedding_model_name(), cache_dir,
+        int(os.getenv("EMBED_BATCH_SIZE", "256")),
+        int(os.getenv("EMBED_RPM", "0")),
+        int(os.getenv("EMBED_MAX_RETRIES", "5")),
+    )
+    with _EMBEDDINGS_LOCK:
+        if config not in _EMBEDDINGS:
+            if os.getenv("EMBEDDING_BACKEND", "openai") == "local":
+                backend = LocalHashEmbeddings(dim=384)
+            else:
+                # Retries/Batching übernimmt CachedEmbeddings
+                backend = OpenAIEmbeddings(model=embedding_model_name(), max_retries=0)
+            model_tag, cache_dir, batch_size, rpm, retries = config
+            _EMBEDDINGS[config] = CachedEmbeddings(
+                backend,
+                model_tag=model_tag,
+                cache_dir=cache_dir,
+                batch_size=batch_size,
+                requests_per_minute=rpm,
+                max_retries=retries,
+            )
+        return _EMBEDDINGS[config]
+
+
+# ANN-Index (FAISS_INDEX=flat|hnsw|ivf|ivfpq): Aufbau über faiss.index_factory, trainiert auf allen
+# Vektoren des Corpus. Trainierte Zentroiden/Codebücher landen mit write_index im Index-Cache.
+
+INDEX_KINDS = ("flat", "hnsw", "ivf", "ivfpq")
+_TRAIN_PER_CENTROID = 39  # faiss-k-means: darunter warnt es und die Zentroiden streuen
+_MIN_PQ_BITS = 6  # darunter zu grob: Recall bleibt auch bei großem nprobe weit unter IVF-Flat
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    """
+    Art und Parameter des FAISS-Index. Aufbau-Parameter (Teil des Index-Manifests, Änderung -> Neuaufbau)
+    und Suchbreite (ef_search/nprobe, wirkt ohne Neuaufbau). nlist/pq_m=0: automatisch aus Corpus-Größe/Dimension.
+    """
+    kind: str = "flat"
+    hnsw_m: int = 32
+    ef_construction: int = 80
+    nlist: int = 0
+    pq_m: int = 0
+    pq_bits: int = 8
+    ef_search: int = 64
+    nprobe: int = 8
+    fallback: str = ""  # gesetzt von resolve(): warum vom konfigurierten Index abgewichen wurde
+
+    @classmethod
+    def from_env(cls) -> "IndexSpec":
+        kind = os.getenv("FAISS_INDEX", "flat").strip().lower()
+        if kind not in INDEX_KINDS:
+            raise RuntimeError(f"Unbekannter FAISS_INDEX '{kind}' (erlaubt: {', '.join(INDEX_KINDS)})")
+        return cls(
+            kind=kind,
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", "32")),
+            ef_construction=int(os.getenv("FAISS_EF_CONSTRUCTION", "80")),
+            nlist=int(os.getenv("FAISS_NLIST", "0")),
+            pq_m=int(os.getenv("FAISS_PQ_M", "0")),
+            pq_bits=int(os.getenv("FAISS_PQ_BITS", "8")),
+            ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+            nprobe=int(os.getenv("FAISS_NPROBE", "8")),
+        )
+
+    def build_params(self) -> Dict:
+        """Parameter, die den gespeicherten Index bestimmen ({} für flat -> Manifest wie bisher)."""
+        if self.kind == "hnsw":
+            return {"kind": self.kind, "hnsw_m": self.hnsw_m, "ef_construction": self.ef_construction}
+        if self.kind == "ivf":
+            return {"kind": self.kind, "nlist": self.nlist}
+        if self.kind == "ivfpq":
+            return {"kind": self.kind, "nlist": self.nlist, "pq_m": self.pq_m, "pq_bits": self.pq_bits}
+        return {}
+
+    def nlist_for(self, n: int) -> int:
+        # ~4·√n Listen, aber mind. 39 Trainingspunkte je Zentroid (sonst warnt/streut k-means)
+        return self.nlist or max(1, min(int(4 * np.sqrt(n)), n // _TRAIN_PER_CENTROID))
+
+    def pq_m_for(self, dim: int) -> int:
+        # ~8 Dimensionen je Subquantisierer; muss die Dimension teilen
+        return self.pq_m or next(m for m in range(max(1, dim // 8), 0, -1) if dim % m == 0)
+
+    def resolve(self, n: int) -> "IndexSpec":
+        """
+        Effektive Parameter für n Vektoren. Jeder PQ-Subquantisierer trainiert 2^pq_bits Zentroiden auf allen
+        n Vektoren -> braucht 39·2^pq_bits Punkte; sonst weniger Bits (mind. 6), sonst IVF-Flat ('fallback').
+        """
+        if self.kind != "ivfpq" or n >= _TRAIN_PER_CENTROID * 2 ** self.pq_bits:
+            return self
+        reason = f"PQ x{self.pq_bits} braucht {_TRAIN_PER_CENTROID * 2 ** self.pq_bits} Trainingspunkte, vorhanden {n}"
+        bits = next((b for b in range(self.pq_bits - 1, _MIN_PQ_BITS - 1, -1)
+                     if n >= _TRAIN_PER_CENTROID * 2 ** b), None)
+        if bits is None:
+            return replace(self, kind="ivf", fallback=f"{reason} -> IVF-Flat")
+        return replace(self, pq_bits=bits, fallback=f"{reason} -> x{bits}")
+
+    def factory(self, dim: int, n: int) -> str:
+        """faiss.index_factory-String für n Vektoren (nach resolve); zu wenige Trainingspunkte -> 'Flat'."""
+        spec = self.resolve(n)
+        if spec.kind == "hnsw":
+            return f"HNSW{spec.hnsw_m},Flat"
+        if spec.kind in ("ivf", "ivfpq"):
+            nlist = spec.nlist_for(n)
+            if n < nlist:
+                return "Flat"
+            if spec.kind == "ivf":
+                return f"IVF{nlist},Flat"
+            return f"IVF{nlist},PQ{spec.pq_m_for(dim)}x{spec.pq_bits}"
+        return "Flat"
+
+
+def index_kind(index: faiss_lib.Index) -> str:
+    if isinstance(index, faiss_lib.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss_lib.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss_lib.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def configure_search(index: faiss_lib.Index, spec: IndexSpec) -> None:
+    """Suchbreite als Default des Index (für Aufrufe ohne SearchParameters, z.B. LangChain)."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        index.hnsw.efSearch = spec.ef_search
+    elif kind != "flat":
+        index.nprobe = min(spec.nprobe, index.nlist)
+
+
+def search_params(index: faiss_lib.Index, spec: IndexSpec, k: int,
+                  sel: Optional[IDSelectorBatch] = None) -> Optional[SearchParameters]:
+    """SearchParameters passend zum Index-Typ (IVF/HNSW lehnen die Basisklasse ab); None = Defaults."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        return SearchParametersHNSW(sel=sel, efSearch=max(spec.ef_search, k))
+    if kind != "flat":
+        return SearchParametersIVF(sel=sel, nprobe=min(spec.nprobe, index.nlist))
+    return None if sel is None else SearchParameters(sel=sel)
+
+
+def _reusable(trained: Optional[faiss_lib.Index], spec: IndexSpec, dim: int, n: int) -> bool:
+    """Trainierter Quantisierer des bisherigen Index noch passend (gleiche Art, nlist im Rahmen)?"""
+    if trained is None or trained.d != dim or index_kind(trained) != spec.kind or spec.kind not in ("ivf", "ivfpq"):
+        return False
+    if spec.kind == "ivfpq" and (trained.pq.M != spec.pq_m_for(dim) or trained.pq.nbits != spec.pq_bits):
+        return False
+    ideal = spec.nlist_for(n)
+    return trained.nlist == ideal if spec.nlist else ideal / 2 <= trained.nlist <= ideal * 2
+
+
+def make_index(vectors: np.ndarray, spec: IndexSpec,
+               trained: Optional[faiss_lib.Index] = None) -> faiss_lib.Index:
+    """
+    Index über 'vectors' (float32, n×d). Mit passendem 'trained' (bisheriger Index desselben Corpus)
+    werden Zentroiden/Codebücher übernommen statt neu trainiert – inkrementelle Updates bleiben billig.
+    """
+    n, dim = vectors.shape
+    spec = spec.resolve(n)
+    if _reusable(trained, spec, dim, n):
+        index = faiss_lib.clone_index(trained)
+        index.reset()
+    else:
+        index = faiss_lib.index_factory(dim, spec.factory(dim, n), faiss_lib.METRIC_L2)
+        if index_kind(index) == "hnsw":
+            index.hnsw.efConstruction = spec.ef_construction
+        elif index_kind(index) == "ivfpq":
+            index.do_polysemous_training = False  # Default an, kostet Minuten; Polysemous-Suche nutzen wir nicht
+        if not index.is_trained:
+            with span("index.train", factory=spec.factory(dim, n), vectors=n) as s:
+                if spec.fallback:
+                    s["fallback"] = spec.fallback
+                index.train(vectors)
+    index.add(vectors)
+    if index_kind(index) in ("ivf", "ivfpq"):
+        # reconstruct() für MMR (bei PQ nur näherungsweise)
+        faiss_lib.extract_index_ivf(index).make_direct_map()
+    configure_search(index, spec)
+    return index
+
+
+def convert_index(index: faiss_lib.Index, spec: Optional[IndexSpec] = None,
+                  trained: Optional[faiss_lib.Index] = None) -> faiss_lib.Index:
+    """Flat-Index -> konfigurierter Index (gleiche Positionen)."""
+    spec = spec or IndexSpec.from_env()
+    if spec.kind == "flat" or index.ntotal == 0:
+        return index
+    return make_index(index.reconstruct_n(0, index.ntotal), spec, trained)
+
+
+def apply_index_spec(faiss: FAISS, spec: Optional[IndexSpec] = None,
+                     trained: Optional[faiss_lib.Index] = None) -> FAISS:
+    """Ersetzt den Flat-Index eines FAISS-Stores durch den konfigurierten Index (gleiche Positionen)."""
+    faiss.index = convert_index(faiss.index, spec, trained)
+    return faiss
+
+
+def build_faiss(docs: List[Document], ids: Optional[List[str]] = None,
+                spec: Optional[IndexSpec] = None) -> FAISS:
+    """FAISS über 'docs' mit dem konfigurierten Index (FAISS_INDEX); ANN-Indizes auf allen Vektoren trainiert."""
+    emb = get_embeddings()
+    return apply_index_spec(FAISS.from_documents(docs, emb, ids=ids), spec)
+
+
+@dataclass(frozen=True)
+class DocFilter:
+    """
+    Metadaten-Prädikat für HybridEnsemble.search (None = keine Einschränkung).
+    files/sections werden case-insensitiv verglichen, files als Basename.
+    """
+    files: Optional[FrozenSet[str]] = None
+    sources: Optional[FrozenSet[str]] = None
+    sections: Optional[FrozenSet[str]] = None
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+
+    @classmethod
+    def of(cls, files: Optional[Iterable[str]] = None, sources: Optional[Iterable[str]] = None,
+           sections: Optional[Iterable[str]] = None, pages: Optional[Tuple[int, int]] = None) -> "DocFilter":
+        def _norm(values):
+            return frozenset(os.path.basename(str(v)).strip().lower() for v in values) if values else None
+        return cls(
+            files=_norm(files),
+            sources=frozenset(sources) if sources else None,
+            sections=frozenset(str(v).strip().lower() for v in sections) if sections else None,
+            page_min=pages[0] if pages else None,
+            page_max=pages[1] if pages else None,
+        )
+
+    def key(self) -> str:
+        """Stabile Textform (unabhängig von Set-Reihenfolge/Hash-Seed), z.B. für Cache-Keys."""
+        return json.dumps([
+            sorted(self.files) if self.files is not None else None,
+            sorted(self.sources) if self.sources is not None else None,
+            sorted(self.sections) if self.sections is not None else None,
+            self.page_min, self.page_max,
+        ])
+
+    def mask(self, chunks: ChunkStore) -> np.ndarray:
+        """Wie matches(), aber vektorisiert über die Integer-Spalten eines Chunk-Stores."""
+        mask = np.ones(len(chunks), dtype=bool)
+
+        def allowed(field: str, accept) -> np.ndarray:
+            codes = [c for c, v in enumerate(chunks.tables[field]) if accept(v)]
+            return np.isin(chunks.columns[field], np.array(codes, dtype=np.int32))
+
+        if self.files is not None:
+            mask &= allowed("file", lambda v: os.path.basename(v).strip().lower() in self.files)
+        if self.sources is not None:
+            mask &= allowed("source", lambda v: v in self.sources)
+        if self.sections is not None:
+            mask &= allowed("section", lambda v: v.strip().lower() in self.sections)
+        # fehlende Seite (-1) verhält sich wie 0 in matches()
+        if self.page_min is not None:
+            mask &= np.maximum(chunks.columns["page_end"], 0) >= self.page_min
+        if self.page_max is not None:
+            mask &= np.maximum(chunks.columns["page_start"], 0) <= self.page_max
+        return mask
+
+    def matches(self, md: Dict) -> bool:
+        if self.files is not None and os.path.basename(str(md.get("file", ""))).strip().lower() not in self.files:
+            return False
+        if self.sources is not None and md.get("source") not in self.sources:
+            return False
+        if self.sections is not None and str(md.get("section") or "").strip().lower() not in self.sections:
+            return False
+        # Seitenbereich: Abschnitt muss sich mit [page_min, page_max] überschneiden
+        if self.page_min is not None and (md.get("page_end") or 0) < self.page_min:
+            return False
+        if self.page_max is not None and (md.get("page_start") or 0) > self.page_max:
+            return False
+        return True
+
+
+# schreibt die Such-Caches der Stores auf die Platte (ein Thread, beim Beenden werden offene Aufträge abgearbeitet)
+_CACHE_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="search-cache")
 
 
 class HybridEnsemble:
     """
-    Ensemble über FAISS (semantisch) + optional BM25 (lexikalisch).
+    Ensemble über FAISS (semantisch) + BM25 (lexikalisch, vektorisiert über eine Sparse-Matrix).
     - MMR für Diversität (reduziert Dopplungen)
     - einfache Rank-Fusion (FAISS bevorzugt, BM25 ergänzt)
+    - optionaler Metadaten-Filter (DocFilter): eingeschränkt wird *vor* dem Scoring
+      (FAISS per IDSelector, BM25 per Positionsmaske), nicht durch Nachfiltern der Top-k
+    - LRU-Cache für Suchergebnisse (Query, k, mmr, Filter, Index-Version); mit 'label' zusätzlich
+      auf der Platte neben dem Index, sodass auch ein Neustart die festen RAG-Queries nicht neu rechnet
+      (geschrieben im Hintergrund und nur nach Änderungen, siehe save_cache)
+    Gerechnet wird nur mit Chunk-Positionen im ChunkStore; Documents entstehen erst für die Treffer.
+    Ohne 'chunks' werden die Chunks aus dem FAISS-Docstore übernommen (dann ohne BM25, außer 'bm25' ist gesetzt).
     """
-    def __init__(self, faiss: FAISS, docs_for_bm25: Optional[List[Document]] = None):
+    def __init__(self, faiss: FAISS, chunks: Optional[ChunkStore] = None, version: str = "",
+                 bm25: Optional[BM25Index] = None, label: str = "", cache_size: int = 256):
         self.faiss = faiss
-        self.docs = docs_for_bm25 or []
-        self.bm25 = BM25Retriever.from_documents(self.docs) if (BM25Retriever and self.docs) else None
-
-    def search(self, query: str, k: int = 6, mmr: bool = True) -> List[Document]:
-        faiss_hits = (
-            self.faiss.max_marginal_relevance_search(query, k=k)
-            if mmr else
-            self.faiss.similarity_search(query, k=k)
-        )
+        self.label = label
+        # Suchbreite (FAISS_EF_SEARCH/FAISS_NPROBE) gilt auch für gespeicherte ANN-Indizes ohne Neuaufbau
+        self.index_spec = IndexSpec.from_env()
+        configure_search(faiss.index, self.index_spec)
+        self.version = version  # Index-Version (Manifest-Key), z.B. für abgeleitete Caches
+        # FAISS-Position -> Chunk-Position (None: identisch, der Normalfall beim Index-Cache)
+        self._faiss_pos: Optional[np.ndarray] = None
+        if chunks is None:
+            ids = [faiss.index_to_docstore_id[i] for i in range(faiss.index.ntotal)]
+            self.chunks = ChunkStore.from_documents(ids, [faiss.docstore.search(i) for i in ids])
+            self.bm25 = bm25
+        else:
+            self.chunks = chunks
+            # vorberechneter Index (aus dem Index-Cache) oder on-the-fly aus den Chunks
+            self.bm25 = bm25 if bm25 is not None else (BM25Index.build(chunks.texts()) if len(chunks) else None)
+            if getattr(faiss.index_to_docstore_id, "chunks", None) is not chunks:
+                found = (chunks.position(faiss.index_to_docstore_id[i]) for i in range(faiss.index.ntotal))
+                self._faiss_pos = np.fromiter((-1 if p is None else p for p in found), dtype=np.int64)
+        self._positions: Dict[DocFilter, Tuple[np.ndarray, np.ndarray]] = {}
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[str, List[int]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache_dirty = False  # seit dem letzten Schreiben geändert
+        self._cache_write: Optional[Future] = None  # laufendes/ausstehendes Schreiben
+        if label and version:
+            stored = load_artifact(label, "search_cache", version) or {}
+            self._cache.update((k, v) for k, v in list(stored.items())[-cache_size:])
+
+    def _filter_positions(self, where: DocFilter) -> Tuple[np.ndarray, np.ndarray]:
+        """(FAISS-Positionen, Chunk-Positionen) aller Chunks, die 'where' erfüllen (gecacht pro Filter)."""
+        if where not in self._positions:
+            # Race zweier Threads ist harmlos: beide berechnen dasselbe Ergebnis
+            mask = where.mask(self.chunks)
+            faiss_mask = mask if self._faiss_pos is None else (self._faiss_pos >= 0) & mask[self._faiss_pos]
+            self._positions[where] = (np.flatnonzero(faiss_mask), np.flatnonzero(mask))
+        return self._positions[where]
+
+    def _faiss_candidates(self, requests: List["SearchRequest"], vectors: np.ndarray) -> List[List[int]]:
+        """
+        FAISS-Kandidaten (FAISS-Positionen) je Anfrage: fetch_k=max(20, k) für MMR, sonst k – wie
+        FAISS.max_marginal_relevance_search bzw. similarity_search. Anfragen mit gleichem Filter
+        gehen als *eine* Matrix-Anfrage an den Index (bis zum größten fetch_k, dann gekürzt).
+        """
+        groups: Dict[Optional[DocFilter], List[int]] = {}
+        for i, r in enumerate(requests):
+            groups.setdefault(r.where, []).append(i)
+        out: List[List[int]] = [[] for _ in requests]
+        for where, idxs in groups.items():
+            ids = None if where is None else self._filter_positions(where)[0]
+            n = self.faiss.index.ntotal if ids is None else len(ids)
+            if n == 0:
+                continue
+            fetch = [int(min(n, max(20, requests[i].k) if requests[i].mmr else requests[i].k)) for i in idxs]
+            params = search_params(self.faiss.index, self.index_spec, max(fetch),
+                                   None if ids is None else IDSelectorBatch(ids))
+            _, found = self.faiss.index.search(vectors[idxs], max(fetch), params=params)
+            for i, f, row in zip(idxs, fetch, found):
+                out[i] = [int(p) for p in row[:f] if p != -1]
+        return out
+
+    def _rank(self, request: "SearchRequest", vector: np.ndarray, candidates: List[int]) -> List[int]:
+        """MMR über die FAISS-Kandidaten, BM25 und Rank-Fusion für eine Anfrage (Chunk-Positionen)."""
+        pos = candidates
+        if request.mmr and pos:
+            vectors = [self.faiss.index.reconstruct(i) for i in pos]
+            pos = [pos[j] for j in maximal_marginal_relevance(vector[None, :], vectors, k=min(request.k, len(pos)))]
+        faiss_hits = pos[:request.k]
+        if self._faiss_pos is not None:
+            faiss_hits = [int(self._faiss_pos[i]) for i in faiss_hits if self._faiss_pos[i] >= 0]
         if not self.bm25:
             return faiss_hits
 
-        bm25_hits = self.bm25.get_relevant_documents(query)
+        bm25_positions = None if request.where is None else self._filter_positions(request.where)[1]
+        bm25_hits = self.bm25.top_k(request.query, request.k, positions=bm25_positions)
 
         # gewichtete Rank-Fusion: FAISS (0.7) > BM25 (0.3)
         pool, seen = [], set()
         weighted = []
-        for i,d in enumerate(faiss_hits):
-            weighted.append((0.7/(i+1), d))
-        for j,d in enumerate(bm25_hits):
-            weighted.append((0.3/(j+1), d))
-        for _, d in sorted(weighted, key=lambda x: -x[0]):
-            key = (d.metadata.get("file"), d.metadata.get("page_start"))
+        for i,p in enumerate(faiss_hits):
+            weighted.append((0.7/(i+1), p))
+        for j,p in enumerate(bm25_hits):
+            weighted.append((0.3/(j+1), p))
+        for _, p in sorted(weighted, key=lambda x: -x[0]):
+            key = self.chunks.location(p)
             if key in seen:
                 continue
             seen.add(key)
-            pool.append(d)
-        return pool[:k]
+            pool.append(p)
+        return pool[:request.k]
+
+    def _timed_rank(self, request: "SearchRequest", vector: np.ndarray,
+                    candidates: List[int]) -> Tuple[List[int], float]:
+        t0 = time.perf_counter()
+        return self._rank(request, vector, candidates), time.perf_counter() - t0
+
+    def _cache_key(self, request: "SearchRequest") -> str:
+        r = request
+        key = [self.version, r.query, r.k, r.mmr, r.where.key() if r.where else None]
+        if index_kind(self.faiss.index) != "flat":
+            key.append([self.index_spec.ef_search, self.index_spec.nprobe])  # Treffer hängen von der Suchbreite ab
+        raw = json.dumps(key, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def cache_stats(self) -> Dict[str, int]:
+        return {"hits": self.cache_hits, "misses": self.cache_misses, "size": len(self._cache)}
+
+    def clear_cache(self) -> None:
+        """Leert den Such-Cache im Speicher (gespeicherte Einträge bleiben auf der Platte)."""
+        with self._cache_lock:
+            self._cache.clear()
+
+    def save_cache(self) -> None:
+        """
+        Schreibt den Such-Cache neben den Index, solange er sich seit dem letzten Schreiben geändert hat.
+        Einträge anderer Prozesse mit demselben Index bleiben erhalten (eigene, neuere gewinnen).
+        """
+        try:
+            while True:
+                with self._cache_lock:
+                    if not self._cache_dirty:
+                        self._cache_write = None
+                        return
+                    self._cache_dirty = False
+                    entries = dict(self._cache)
+                stored = load_artifact(self.label, "search_cache", self.version) or {}
+                merged = {**{k: v for k, v in stored.items() if k not in entries}, **entries}
+                save_artifact(self.label, "search_cache", self.version,
+                              dict(list(merged.items())[-self._cache_size:]))
+        except Exception:
+            with self._cache_lock:
+                self._cache_write = None
+            raise
+
+    def _schedule_cache_write(self) -> None:
+        # unter _cache_lock: höchstens ein Schreibauftrag je Store, weitere Änderungen schreibt er mit
+        self._cache_dirty = True
+        if self._cache_write is None:
+            self._cache_write = _CACHE_WRITER.submit(self.save_cache)
+
+    def cached(self, request: "SearchRequest") -> Optional[List[Document]]:
+        """Treffer aus dem Such-Cache oder None (zählt Treffer/Fehlschläge)."""
+        key = self._cache_key(request)
+        with self._cache_lock:
+            positions = self._cache.get(key)
+            if positions is None:
+                self.cache_misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+        return self.chunks.docs(positions)
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Alle Queries in einem Embedding-Aufruf (Duplikate nur einmal)."""
+        unique = list(dict.fromkeys(queries))
+        with span("embedding.query", queries=len(unique)):
+            vectors = dict(zip(unique, self.faiss.embedding_function.embed_documents(unique)))
+        return np.array([vectors[q] for q in queries], dtype=np.float32).reshape(len(queries), -1)
+
+    def search_vectors(self, requests: List["SearchRequest"], vectors: np.ndarray,
+                       executor: Optional[Executor] = None, use_cache: bool = True) -> List[List[Document]]:
+        """
+        Suche mit bereits eingebetteten Queries (Zeile i von 'vectors' gehört zu requests[i]):
+        FAISS gebatcht, MMR/BM25/Fusion je Anfrage – mit 'executor' parallel. Ergebnisse landen im Cache.
+        """
+        with span("retrieval.faiss", store=self.label, requests=len(requests)):
+            candidates = self._faiss_candidates(requests, vectors)
+        jobs = list(zip(requests, vectors, candidates))
+        if executor is not None and len(jobs) > 1:
+            timed = list(executor.map(lambda job: self._timed_rank(*job), jobs))
+        else:
+            timed = [self._timed_rank(*job) for job in jobs]
+        ranked = [positions for positions, _ in timed]
+        # Threads sehen den aktiven Trace nicht -> Dauer hier eintragen
+        for r, (_, secs) in zip(requests, timed):
+            record("retrieval.rank", secs, store=self.label, query=r.query, k=r.k, filtered=r.where is not None)
+        if use_cache:
+            with self._cache_lock:
+                for r, positions in zip(requests, ranked):
+                    self._cache[self._cache_key(r)] = positions
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+                if self.label and self.version:
+                    self._schedule_cache_write()  # nicht auf dem Suchpfad: JSON + rename im Hintergrund
+        return [self.chunks.docs(positions) for positions in ranked]
+
+    def search_many(self, requests: List["SearchRequest"], executor: Optional[Executor] = None,
+                    use_cache: bool = True) -> List[List[Document]]:
+        """Mehrere Suchen: Cache-Treffer direkt, alle übrigen Queries in einem Embedding-Aufruf."""
+        with span("retrieval.search", store=self.label, requests=len(requests)) as stats:
+            results: List[Optional[List[Document]]] = [
+                self.cached(r) if use_cache else None for r in requests
+            ]
+            todo = [i for i, res in enumerate(results) if res is None]
+            stats["cache_hits"] = len(requests) - len(todo)
+            if todo:
+                reqs = [requests[i] for i in todo]
+                vectors = self.embed_queries([r.query for r in reqs])
+                for i, docs in zip(todo, self.search_vectors(reqs, vectors, executor, use_cache)):
+                    results[i] = docs
+            return results
+
+    def search(self, query: str, k: int = 6, mmr: bool = True,
+               where: Optional[DocFilter] = None, use_cache: bool = True) -> List[Document]:
+        return self.search_many([SearchRequest(query, k, mmr, where)], use_cache=use_cache)[0]
+
+
+@dataclass(frozen=True)
+class SearchRequest:
+    """Eine Suchanfrage an HybridEnsemble.search_many / rag_utils.search_batch."""
+    query: str
+    k: int = 6
+    mmr: bool = True
+    where: Optional[DocFilter] = None
@@ -0,0 +1,145 @@
+# Übereinstimmung Ein-Aufruf-Judge (JUDGE_MODE=single) vs. Einzel-Prompts je Kriterium
+#
+#   python prototype/judge_agreement.py fragen.csv --limit 30
+#   python prototype/judge_agreement.py --from-results 30        # Fragen aus dem Ergebnis-Store
+#
+# Bewertet jede Frage in beiden Modi (Judge-Cache wird genutzt, bereits bewertete Fragen kosten im
+# Einzel-Modus nichts) und vergleicht die Scores je Kriterium: exakte Übereinstimmung, ±1, mittlere
+# Abweichung, Bias und quadratisch gewichtetes Kappa. Dazu Requests und Prompt-Tokens je Modus.
+# Bericht als Artefakt "judge_agreement" im RunStore (RUNS_DIR) und optional als JSON-Datei.
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+from batch_judge import read_questions
+from llm_judge import evaluate_question
+from rag_utils import LazyStores, load_specs_for_evaluation
+from results_store import ResultsStore
+from run_store import RunStore, new_run_id
+from tracing import Trace
+
+MODES = ("concurrent", "single")  # Referenz, Kandidat
+
+
+def weighted_kappa(a: np.ndarray, b: np.ndarray, levels: int = 6) -> float:
+    """Quadratisch gewichtetes Cohen-Kappa für Scores 0..levels-1 (1.0 = perfekt, 0 = Zufall)."""
+    observed = np.zeros((levels, levels))
+    np.add.at(observed, (a, b), 1)
+    expected = np.outer(observed.sum(1), observed.sum(0)) / max(observed.sum(), 1)
+    idx = np.arange(levels)
+    weights = (idx[:, None] - idx[None, :]) ** 2 / (levels - 1) ** 2
+    denom = (weights * expected).sum()
+    return 1.0 if denom == 0 else float(1 - (weights * observed).sum() / denom)
+
+
+def _agreement(ref: np.ndarray, cand: np.ndarray) -> Dict[str, float]:
+    diff = cand - ref
+    return {
+        "n": int(len(ref)),
+        "exact": round(float(np.mean(diff == 0)), 3),
+        "within_1": round(float(np.mean(np.abs(diff) <= 1)), 3),
+        "mae": round(float(np.mean(np.abs(diff))), 3),
+        "bias": round(float(np.mean(diff)), 3),
+        "kappa_quadratic": round(weighted_kappa(ref, cand), 3),
+    }
+
+
+def _evaluate(question: str, specs: Dict[int, str], mode: str) -> Tuple[Dict[str, int], Dict[str, int], str]:
+    """
+    Scores je Kriterium, Verbrauch und Modell-Tag eines Modus. requests/tokens_in zählen auch Antworten
+    aus dem Judge-Cache (Kosten ohne Cache), api_requests nur tatsächlich gesendete.
+    """
+    trace = Trace("agreement", mode)
+    with trace.activate():
+        results = evaluate_question(question, specs=specs, mode=mode)
+    spans = trace.to_dict()["spans"]
+    calls = [s for s in spans if s["name"] == "llm.judge"]
+    usage = {"requests": len(calls), "api_requests": sum(1 for s in calls if not s.get("cached")),
+             "tokens_in": sum(s.get("tokens_in", 0) for s in spans if s["name"] == "prompt.render"),
+             "tokens_out": sum(s.get("tokens_out", 0) for s in calls)}
+    scores = {cid: ev["score"] for cid, ev in results[0]["evaluations"].items()}
+    return scores, usage, results[0]["_meta"]["model"]
+
+
+def agreement_report(questions: List[str], specs: Dict[int, str], workers: int = 4,
+                     min_kappa: float = 0.8, max_bias: float = 0.25) -> Dict:
+    def both(q: str):
+        return {mode: _evaluate(q, specs, mode) for mode in MODES}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+        runs = list(ex.map(both, questions))
+    ref_mode, cand_mode = MODES
+    crits = sorted({c for r in runs for c in r[ref_mode][0]}, key=lambda c: (len(c), c))
+    per_crit = {}
+    for c in crits:
+        pairs = [(r[ref_mode][0][c], r[cand_mode][0][c]) for r in runs if c in r[ref_mode][0] and c in r[cand_mode][0]]
+        ref, cand = (np.array(x, dtype=int) for x in zip(*pairs))
+        per_crit[c] = _agreement(ref, cand)
+    ref_all = np.array([r[ref_mode][0][c] for r in runs for c in crits], dtype=int)
+    cand_all = np.array([r[cand_mode][0][c] for r in runs for c in crits], dtype=int)
+    overall = _agreement(ref_all, cand_all)
+    usage = {mode: {k: int(sum(r[mode][1][k] for r in runs))
+                    for k in ("requests", "api_requests", "tokens_in", "tokens_out")}
+             for mode in MODES}
+    safe = overall["kappa_quadratic"] >= min_kappa and abs(overall["bias"]) <= max_bias and all(
+        abs(m["bias"]) <= max_bias for m in per_crit.values())
+    return {
+        "model": runs[0][ref_mode][2] if runs else "",
+        "questions": len(questions),
+        "reference": ref_mode,
+        "candidate": cand_mode,
+        "criteria": per_crit,
+        "overall": overall,
+        "usage": usage,
+        "thresholds": {"min_kappa": min_kappa, "max_bias": max_bias},
+        "safe_to_switch": bool(safe),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Übereinstimmung Ein-Aufruf-Judge vs. Einzel-Prompts")
+    parser.add_argument("input", nargs="?", help="CSV oder JSONL mit Fragen (wie batch_judge.py)")
+    parser.add_argument("--from-results", type=int, metavar="N",
+                        help="stattdessen die letzten N Fragen aus dem Ergebnis-Store")
+    parser.add_argument("--limit", type=int, default=30)
+    parser.add_argument("--question-col", default="question")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--min-kappa", type=float, default=0.8)
+    parser.add_argument("--max-bias", type=float, default=0.25)
+    parser.add_argument("--output", help="Bericht zusätzlich als JSON-Datei")
+    args = parser.parse_args()
+
+    load_dotenv(find_dotenv(), override=True)
+    if args.from_results:
+        rows = ResultsStore(legacy_csv=None).rows()[-args.from_results:]
+        questions = list(dict.fromkeys(r["question"] for r in rows if r.get("question")))
+    elif args.input:
+        questions = [q for _, _, q in read_questions(args.input, args.question_col)]
+    else:
+        parser.error("Eingabedatei oder --from-results angeben")
+    questions = questions[:args.limit]
+
+    specs = load_specs_for_evaluation(LazyStores())  # lädt nur den Specs-Index
+    report = agreement_report(questions, specs, args.workers, args.min_kappa, args.max_bias)
+    run_id = new_run_id()
+    RunStore().put(run_id, "judge_agreement", report, kind="agreement", model=report["model"])
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"{report['questions']} Fragen, Modell {report['model']} (Run {run_id})")
+    print(f"{'Kriterium':<10} {'n':>4} {'exakt':>6} {'±1':>6} {'MAE':>6} {'Bias':>6} {'Kappa':>6}")
+    for c, m in list(report["criteria"].items()) + [("gesamt", report["overall"])]:
+        print(f"{c:<10} {m['n']:>4} {m['exact']:>6} {m['within_1']:>6} {m['mae']:>6} {m['bias']:>6} "
+              f"{m['kappa_quadratic']:>6}")
+    for mode, u in report["usage"].items():
+        print(f"{mode:<10} {u['requests']:>4} Requests ({u['api_requests']} gesendet), "
+              f"{u['tokens_in']} Prompt-Tokens, {u['tokens_out']} Antwort-Tokens")
+    print("Umstellung unbedenklich" if report["safe_to_switch"] else "Umstellung NICHT empfohlen",
+          f"(Kappa >= {args.min_kappa}, |Bias| <= {args.max_bias})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Persistenter Cache für Judge-Antworten: (Modell, Temperatur, top_p, Kriterium, Prompt-Hash) -> Antworttext
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS judge_cache (
+    key         TEXT PRIMARY KEY,
+    response    TEXT NOT NULL,
+    created     REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS judge_cache_lru ON judge_cache (last_access);
+"""
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def cache_enabled() -> bool:
+    return os.getenv("JUDGE_CACHE", "1") not in ("0", "false", "off")
+
+
+class JudgeCache:
+    """
+    SQLite-Cache (WAL) mit LRU-Verdrängung: bei mehr als 'max_entries' Einträgen
+    werden die am längsten nicht gelesenen entfernt.
+    """
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = path or os.getenv("JUDGE_CACHE_DB", "judge_cache.sqlite")
+        self.max_entries = max_entries or int(os.getenv("JUDGE_CACHE_MAX_ENTRIES", "5000"))
+        with closing(self._connect()) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute("PRAGMA busy_timeout=30000")
+        return con
+
+    @staticmethod
+    def key(model: str, temperature: float, top_p: float, crit_id, prompt: str) -> str:
+        raw = json.dumps([model, float(temperature), float(top_p), str(crit_id), prompt_hash(prompt)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with closing(self._connect()) as con, con:
+            row = con.execute("SELECT response FROM judge_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            con.execute("UPDATE judge_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        with closing(self._connect()) as con, con:
+            con.execute(
+                "INSERT OR REPLACE INTO judge_cache (key, response, created, last_access) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            n = con.execute("SELECT COUNT(*) FROM judge_cache").fetchone()[0]
+            if n > self.max_entries:
+                con.execute(
+                    "DELETE FROM judge_cache WHERE key IN "
+                    "(SELECT key FROM judge_cache ORDER BY last_access ASC LIMIT ?)",
+                    (n - self.max_entries,),
+                )
+
+    def clear(self) -> None:
+        with closing(self._connect()) as con, con:
+            con.execute("DELETE FROM judge_cache")
@@ -0,0 +1,154 @@
+# Lexikalische Suche: BM25 über eine dünn besetzte Term-Dokument-Matrix (SciPy), deutsche Tokenisierung
+import json
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+from scipy import sparse
+
+GERMAN_STOPWORDS = frozenset("""
+aber alle allem allen aller alles als also am an ander andere anderem anderen anderer anderes auch auf aus
+bei bin bis bist da damit dann das dass dasselbe dazu dein deine deinem deinen deiner dem demselben den
+denn denselben der derer derselbe derselben des desselben dessen dich die dies diese dieselbe dieselben
+diesem diesen dieser dieses dir doch dort du durch ein eine einem einen einer eines einig einige einigem
+einigen einiger einiges einmal er es etwas euch euer eure eurem euren eurer eures fuer gegen gewesen hab
+habe haben hat hatte hatten hier hin hinter ich ihm ihn ihnen ihr ihre ihrem ihren ihrer ihres im in
+indem ins ist jede jedem jeden jeder jedes jene jenem jenen jener jenes jetzt kann kein keine keinem
+keinen keiner keines koennen koennte machen man manche manchem manchen mancher manches mein meine meinem
+meinen meiner meines mich mir mit muss musste nach nicht nichts noch nun nur ob oder ohne sehr sein
+seine seinem seinen seiner seines selbst sich sie sind so solche solchem solchen solcher solches soll
+sollte sondern sonst ueber um und uns unsere unserem unseren unser unseres unter viel vom von vor
+waehrend war waren warst was weg weil weiter welche welchem welchen welcher welches wenn werde werden
+wie wieder will wir wird wirst wo wollen wollte wuerde wuerden zu zum zur zwar zwischen
+""".split())
+
+_UMLAUTS = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss", "é": "e", "è": "e"})
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# leichte Suffix-Reduktion (längste zuerst), damit Flexionsformen zusammenfallen
+_SUFFIXES = ("ungen", "heiten", "keiten", "innen", "ern", "em", "en", "er", "es", "e", "n", "s")
+_MIN_PART = 4  # minimale Länge eines Kompositum-Bestandteils
+
+
+def normalize(text: str) -> str:
+    return text.lower().translate(_UMLAUTS)
+
+
+def _stem(token: str) -> str:
+    for suf in _SUFFIXES:
+        if len(token) - len(suf) >= _MIN_PART and token.endswith(suf):
+            return token[: -len(suf)]
+    return token
+
+
+def _words(text: str) -> List[str]:
+    """Normalisierte Wörter ohne Stoppwörter; Bindestrich-Komposita zerfallen in ihre Teile."""
+    return [w for w in _TOKEN_RE.findall(normalize(text)) if len(w) > 1 and w not in GERMAN_STOPWORDS]
+
+
+def _decompound(word: str, heads: Set[str]) -> Optional[str]:
+    """Längstes bekanntes Grundwort am Wortende (dt. Komposita: Kopf steht rechts), z.B. 'erwartungshorizont' -> 'horizont'."""
+    for i in range(_MIN_PART - 1, len(word) - _MIN_PART + 1):
+        head = word[i:]
+        if head in heads:
+            return head
+    return None
+
+
+def _tokens(words: List[str], heads: Optional[Set[str]]) -> List[str]:
+    out: List[str] = []
+    for w in words:
+        out.append(_stem(w))
+        if heads and len(w) >= 2 * _MIN_PART:
+            head = _decompound(w, heads)
+            if head:
+                out.append(_stem(head))
+    return out
+
+
+def tokenize(text: str, heads: Optional[Set[str]] = None) -> List[str]:
+    """Stems der Wörter; für Komposita zusätzlich der Stem des Grundworts (falls 'heads' bekannt)."""
+    return _tokens(_words(text), heads)
+
+
+class BM25Index:
+    """
+    Okapi-BM25 mit vorberechneten Gewichten: W[d, t] = idf(t) * tf*(k1+1) / (tf + k1*(1-b+b*|d|/avgdl)).
+    Eine Anfrage ist damit eine Spaltensumme über die Query-Terme (ein vektorisierter Durchlauf)
+    plus Top-k per argpartition – ohne Python-Schleife über Dokumente.
+    """
+    def __init__(self, weights: sparse.csc_matrix, vocab: Dict[str, int], heads: Set[str]):
+        self.weights = weights
+        self.vocab = vocab
+        self.heads = heads
+
+    @property
+    def n_docs(self) -> int:
+        return self.weights.shape[0]
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        words_per_doc = [_words(t) for t in texts]
+        # bekannte Einzelwörter als mögliche Grundwörter für die Kompositum-Zerlegung
+        heads = {w for words in words_per_doc for w in words if _MIN_PART <= len(w) <= 12}
+        vocab: Dict[str, int] = {}
+        rows, cols, vals = [], [], []
+        lengths = np.zeros(len(words_per_doc), dtype=np.float32)
+        for d, words in enumerate(words_per_doc):
+            counts: Dict[int, int] = {}
+            for tok in _tokens(words, heads):
+                t = vocab.setdefault(tok, len(vocab))
+                counts[t] = counts.get(t, 0) + 1
+            lengths[d] = sum(counts.values())
+            rows.extend([d] * len(counts))
+            cols.extend(counts.keys())
+            vals.extend(counts.values())
+        n = len(words_per_doc)
+        tf = sparse.csr_matrix((np.asarray(vals, dtype=np.float32), (rows, cols)),
+                               shape=(n, max(1, len(vocab))))
+        df = np.bincount(tf.indices, minlength=tf.shape[1]).astype(np.float32)
+        idf = np.log((n - df + 0.5) / (df + 0.5) + 1.0).astype(np.float32)
+        avgdl = float(lengths.mean()) if n else 1.0
+        norm = k1 * (1 - b + b * lengths / max(avgdl, 1e-6))
+        # tf -> BM25-Gewicht, elementweise auf den Nicht-Null-Einträgen
+        row_of = np.repeat(np.arange(n), np.diff(tf.indptr))
+        data = tf.data
+        tf.data = idf[tf.indices] * data * (k1 + 1) / (data + norm[row_of])
+        return cls(tf.tocsc(), vocab, heads)
+
+    def scores(self, query: str) -> np.ndarray:
+        terms: Dict[int, int] = {}
+        for tok in tokenize(query, self.heads):
+            t = self.vocab.get(tok)
+            if t is not None:
+                terms[t] = terms.get(t, 0) + 1
+        if not terms:
+            return np.zeros(self.n_docs, dtype=np.float32)
+        cols = np.fromiter(terms.keys(), dtype=np.int64)
+        qtf = np.fromiter(terms.values(), dtype=np.float32)
+        return np.asarray(self.weights[:, cols] @ qtf).ravel()
+
+    def top_k(self, query: str, k: int, positions: Optional[np.ndarray] = None) -> List[int]:
+        """Dokument-Positionen der k besten Treffer (Score > 0), optional nur innerhalb 'positions'."""
+        scores = self.scores(query)
+        if positions is not None:
+            scores = scores[positions]
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        return [int(positions[i]) if positions is not None else int(i) for i in top]
+
+    def save(self, folder: Path) -> None:
+        folder.mkdir(parents=True, exist_ok=True)
+        sparse.save_npz(folder / "weights.npz", self.weights)
+        with open(folder / "vocab.json", "w", encoding="utf-8") as f:
+            json.dump({"vocab": self.vocab, "heads": sorted(self.heads)}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, folder: Path) -> "BM25Index":
+        weights = sparse.load_npz(folder / "weights.npz").tocsc()
+        with open(folder / "vocab.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(weights, meta["vocab"], set(meta["heads"]))
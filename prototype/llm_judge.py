@@ -1,80 +1,362 @@
-import pandas as pd
-import json, re, time, os
-from pathlib import Path
-from typing import List, Dict, Any, List, Optional
+import asyncio, json, random, re, time, os, warnings
+from typing import List, Dict, Any, List, Optional, Tuple
+import openai
 from langchain_core.messages import AIMessage
 from langchain_openai import ChatOpenAI
 from rag_utils import load_specs_for_evaluation
-from prompts import EVAL_PROMPTS
+from prompts import EVAL_PROMPTS, MULTI_EVAL_PROMPT, MULTI_EVAL_RUBRIC
+from results_store import ResultsStore
+from judge_cache import JudgeCache, cache_enabled
+from tracing import count_tokens, record, span
 
-def get_llm_evaluator():
-    model = os.getenv("OPENAI_MODEL", "gpt-4")
-    temp = float(os.getenv("OPENAI_TEMPERATURE", "0.0"))
-    return ChatOpenAI(temperature=temp, top_p=1.0, model=model)
+def _model_params() -> Tuple[str, float, float]:
+    """(Modell, Temperatur, top_p) des Judges – auch Teil des Cache-Keys."""
+    return os.getenv("OPENAI_MODEL", "gpt-4"), float(os.getenv("OPENAI_TEMPERATURE", "0.0")), 1.0
 
-def evaluate_question(
-    question: str,
-    specs: Optional[Dict[int, str]] = None,
-    stores: Optional[Dict[str, Any]] = None,
-) -> List[Dict]:
-    """
-    Entweder 'specs' (fertige Rubrik-Kontexte) übergeben ODER 'stores' angeben,
-    damit die specs on-the-fly gebaut werden. Kein stiller Fallback mehr.
-    """
-    llm_evaluator = get_llm_evaluator()
+
+def get_llm_evaluator(max_retries: Optional[int] = None):
+    model, temp, top_p = _model_params()
+    kwargs = {} if max_retries is None else {"max_retries": max_retries}
+    return ChatOpenAI(temperature=temp, top_p=top_p, model=model, **kwargs)
+
+
+def _render_prompt(crit_id: int, doc: str, question: str) -> str:
+    return EVAL_PROMPTS[crit_id] \
+        .replace("{{context}}", doc) \
+        .replace("{{question}}", question)
+
+
+def _response_text(response: Any) -> str:
+    return response.content if isinstance(response, AIMessage) else str(response)
+
+
+def _read_judge_response(text: str) -> Tuple[Optional[int], str]:
+    # Erwartet JSON {"score": int, "rationale": str}; robuster Fallback bei Freitext. Score None: nicht lesbar
+    score, reason = None, ""
+    try:
+        payload = json.loads(text)
+        raw = payload.get("score")
+        score = None if raw is None else int(raw)
+        reason = str(payload.get("rationale", "")).strip()
+    except Exception:
+        m = re.search(r'"score"\s*:\s*(\d+)', text)
+        if m:
+            score = int(m.group(1))
+        m2 = re.search(r'"rationale"\s*:\s*"([^"]+)"', text, flags=re.S)
+        if m2:
+            reason = m2.group(1).strip()
+        # letzter Fallback: Heuristik
+        if reason == "":
+            reason_line = next((line for line in text.splitlines() if "Begründung:" in line), "")
+            reason = reason_line.replace("Begründung:", "").strip() if reason_line else ""
+    return score, reason
+
+
+def _parse_judge_response(text: str) -> Tuple[int, str]:
+    score, reason = _read_judge_response(text)
+    return max(0, min(5, score or 0)), reason
+
+
+def _cacheable(text: str) -> bool:
+    """Nur Antworten mit lesbarem Score (0–5) cachen – sonst käme die kaputte Bewertung bei jedem Lauf wieder."""
+    score = _read_judge_response(text)[0]
+    return score is not None and 0 <= score <= 5
+
+
+def _resolve_specs(specs: Optional[Dict[int, str]], stores: Optional[Dict[str, Any]]) -> Dict[int, str]:
     if specs is not None:
-        documents = specs
-    elif stores is not None:
-        documents = load_specs_for_evaluation(stores)
-    else:
-        raise RuntimeError("evaluate_question: 'specs' fehlt. Übergib entweder 'specs' oder 'stores'.")
-    result = {"question": question, "evaluations": {}}
+        return specs
+    if stores is not None:
+        return load_specs_for_evaluation(stores)
+    raise RuntimeError("evaluate_question: 'specs' fehlt. Übergib entweder 'specs' oder 'stores'.")
 
-    for crit_id, doc in documents.items():
-        prompt = EVAL_PROMPTS[crit_id] \
-            .replace("{{context}}", doc) \
-            .replace("{{question}}", question)
-
-        response = llm_evaluator.invoke(prompt)
-        text = response.content if isinstance(response, AIMessage) else str(response)
-        # Erwartet JSON {"score": int, "rationale": str}; robuster Fallback bei Freitext
-        score, reason = 0, ""
-        try:
-            payload = json.loads(text)
-            score = int(payload.get("score", 0))
-            reason = str(payload.get("rationale", "")).strip()
-        except Exception:
-            m = re.search(r'"score"\s*:\s*(\d+)', text)
-            if m:
-                score = int(m.group(1))
-            m2 = re.search(r'"rationale"\s*:\s*"([^"]+)"', text, flags=re.S)
-            if m2:
-                reason = m2.group(1).strip()
-            # letzter Fallback: Heuristik
-            if reason == "":
-                reason_line = next((line for line in text.splitlines() if "Begründung:" in line), "")
-                reason = reason_line.replace("Begründung:", "").strip() if reason_line else ""
-        score = max(0, min(5, score))
 
+def _result(question: str, texts: Dict[Any, str], cached: Optional[set] = None) -> List[Dict]:
+    cached = cached or set()
+    result = {"question": question, "evaluations": {}}
+    for crit_id, text in texts.items():
+        score, reason = _parse_judge_response(text)
         # Score + Begründung speichern
         result["evaluations"][str(crit_id)] = {
             "score": score,
             "reason": reason,
-            "text": text  
+            "text": text,
+            "cached": crit_id in cached,
         }
-
-    mdl = os.getenv("OPENAI_MODEL", "gpt-4")
-    tmp = float(os.getenv("OPENAI_TEMPERATURE", "0.0"))
-    result["_meta"] = {"model": f"{mdl}_t{tmp}_p1.0", "ts": int(time.time())}
+    mdl, tmp, top_p = _model_params()
+    result["_meta"] = {
+        "model": f"{mdl}_t{tmp}_p{top_p}",
+        "ts": int(time.time()),
+        "cache_hits": [str(c) for c in texts if c in cached],
+    }
     return [result]
 
 
-def export_results_to_csv(question, results, origin="AbiBuddy", path="evaluation_results.csv"):
+def _cached_texts(prompts: Dict[Any, str], use_cache: Optional[bool]) -> Tuple[Optional[JudgeCache], Dict[Any, str], Dict[Any, str]]:
+    """Liefert (cache, bereits gecachte Antworten, Cache-Keys) für die gerenderten Kriterien-Prompts."""
+    if use_cache is None:
+        use_cache = cache_enabled()
+    if not use_cache:
+        return None, {}, {}
+    cache = JudgeCache()
+    params = _model_params()
+    keys = {cid: JudgeCache.key(*params, cid, p) for cid, p in prompts.items()}
+    hits = {}
+    for cid, key in keys.items():
+        text = cache.get(key)
+        if text is not None:
+            hits[cid] = text
+    return cache, hits, keys
+
+
+# Fehler, bei denen ein erneuter Versuch sinnvoll ist (Rate-Limit, Timeout, Verbindungsabbruch)
+_RETRYABLE = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)
+
+
+async def _judge_criterion_async(llm, prompt: str, sem: asyncio.Semaphore,
+                                 timeout: float, max_retries: int, crit_id: Any = None) -> str:
+    delay = 1.0
+    with span("llm.judge", crit=str(crit_id), tokens_in=count_tokens(prompt)) as s:
+        for attempt in range(max_retries + 1):
+            s["attempts"] = attempt + 1
+            try:
+                async with sem:
+                    response = await asyncio.wait_for(llm.ainvoke(prompt), timeout=timeout)
+                text = _response_text(response)
+                s["tokens_out"] = count_tokens(text)
+                return text
+            except _RETRYABLE:
+                if attempt == max_retries:
+                    raise
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+                delay = min(delay * 2, 30.0)
+    return ""  # unerreichbar
+
+
+def _render_prompts(documents: Dict[Any, str], question: str) -> Dict[Any, str]:
+    with span("prompt.render", prompts=len(documents)) as s:
+        prompts = {cid: _render_prompt(cid, doc, question) for cid, doc in documents.items()}
+        s["tokens_in"] = sum(count_tokens(p) for p in prompts.values())
+    return prompts
+
+
+def _record_cache_hits(hits: Dict[Any, str]) -> None:
+    for cid, text in hits.items():
+        record("llm.judge", 0.0, crit=str(cid), cached=True, tokens_out=count_tokens(text))
+
+
+async def evaluate_question_async(
+    question: str,
+    specs: Optional[Dict[int, str]] = None,
+    stores: Optional[Dict[str, Any]] = None,
+    concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    use_cache: Optional[bool] = None,
+) -> List[Dict]:
     """
-    Hängt die Bewertungsergebnisse einer Frage an eine CSV-Datei an.
-    Falls die Datei noch nicht existiert, wird sie neu erstellt.
-    Enthält Origin, Frage, Kriteriums-Scores, Kriteriums-Begründungen und Average-Score.
+    Wie evaluate_question, aber alle Kriterien-Prompts gehen gleichzeitig raus
+    (max. 'concurrency' parallel, Timeout pro Aufruf, Retry mit Backoff bei Rate-Limits).
+    Laufzeit ≈ langsamstes Kriterium statt Summe aller Kriterien.
     """
+    documents = _resolve_specs(specs, stores)
+    prompts = _render_prompts(documents, question)
+    cache, texts, keys = _cached_texts(prompts, use_cache)
+    _record_cache_hits(texts)
+    missing = [cid for cid in prompts if cid not in texts]
+    if not missing:
+        return _result(question, texts, cached=set(texts))
+    concurrency = concurrency or int(os.getenv("JUDGE_CONCURRENCY", "5"))
+    timeout = timeout or float(os.getenv("JUDGE_TIMEOUT", "120"))
+    max_retries = int(os.getenv("JUDGE_MAX_RETRIES", "4")) if max_retries is None else max_retries
+    llm_evaluator = get_llm_evaluator(max_retries=0)  # Retries übernimmt _judge_criterion_async
+    sem = asyncio.Semaphore(max(1, concurrency))
+    fresh = await asyncio.gather(*(
+        _judge_criterion_async(llm_evaluator, prompts[cid], sem, timeout, max_retries, crit_id=cid)
+        for cid in missing
+    ))
+    cached = set(texts)
+    for cid, text in zip(missing, fresh):
+        texts[cid] = text
+        if cache is not None and _cacheable(text):
+            cache.put(keys[cid], text)
+    return _result(question, {cid: texts[cid] for cid in prompts}, cached=cached)
+
+
+# Ein-Aufruf-Modus: alle Kriterien in einem Request mit strukturierter (JSON-Schema-)Antwort
+
+# Modelle mit response_format=json_schema; für andere wird das Format nur im Prompt vorgegeben
+STRUCTURED_OUTPUT_MODELS = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+
+def _rubric_parts(crit_id: Any) -> Tuple[str, str]:
+    """(Dokument-Beschreibung, Arbeitsauftrag) aus dem Einzel-Prompt einer Rubrik."""
+    text = EVAL_PROMPTS[crit_id]
+    try:
+        head, rest = text.split("{{context}}")
+        _, rest = rest.split("{{question}}")
+    except ValueError:
+        raise RuntimeError(f"EVAL_PROMPTS[{crit_id}] hat nicht die erwartete Form (context vor question).")
+    description = head.replace("Du bist Fachprüfer:in im Deutschabitur.", "").strip()
+    return description, rest.split("Bitte gib am Ende")[0].strip()
+
+
+def _render_multi_prompt(documents: Dict[Any, str], question: str) -> str:
+    with span("prompt.render", prompts=1, criteria=len(documents)) as s:
+        rubrics = []
+        for cid, doc in documents.items():
+            description, instruction = _rubric_parts(cid)
+            rubrics.append(MULTI_EVAL_RUBRIC.replace("{{crit}}", str(cid)).replace("{{description}}", description)
+                           .replace("{{context}}", doc).replace("{{instruction}}", instruction).strip())
+        fmt = json.dumps({str(cid): {"rationale": "<kurze Begründung>", "score": "<0-5 Ganzzahl>"}
+                          for cid in documents}, ensure_ascii=False)
+        prompt = MULTI_EVAL_PROMPT.replace("{{question}}", question) \
+            .replace("{{rubrics}}", "\n\n".join(rubrics)) \
+            .replace("{{format}}", fmt)
+        s["tokens_in"] = count_tokens(prompt)
+    return prompt
+
+
+def _response_format(crit_ids: List[Any]) -> Optional[Dict[str, Any]]:
+    """response_format für den Ein-Aufruf-Modus (JUDGE_RESPONSE_FORMAT=json_schema|json_object|text)."""
+    model = _model_params()[0]
+    kind = os.getenv("JUDGE_RESPONSE_FORMAT") or (
+        "json_schema" if model.startswith(STRUCTURED_OUTPUT_MODELS) else "text")
+    if kind == "text":
+        return None
+    if kind == "json_object":
+        return {"type": "json_object"}
+    criterion = {
+        "type": "object",
+        "properties": {"rationale": {"type": "string"}, "score": {"type": "integer", "enum": [0, 1, 2, 3, 4, 5]}},
+        "required": ["rationale", "score"],
+        "additionalProperties": False,
+    }
+    schema = {
+        "type": "object",
+        "properties": {str(cid): criterion for cid in crit_ids},
+        "required": [str(cid) for cid in crit_ids],
+        "additionalProperties": False,
+    }
+    return {"type": "json_schema", "json_schema": {"name": "rubric_scores", "strict": True, "schema": schema}}
+
+
+def _parse_multi_response(text: str, crit_ids: List[Any]) -> Tuple[Dict[Any, str], List[Any]]:
+    """
+    Validiert die Antwort des Ein-Aufruf-Modus. Liefert je gültigem Kriterium einen Antworttext im
+    Format der Einzel-Prompts ({"score", "rationale"}) sowie die ungültigen/fehlenden Kriterien.
+    """
+    m = re.search(r"\{.*\}", text, flags=re.S)  # toleriert ```json-Zäune o.ä.
+    try:
+        payload = json.loads(m.group(0)) if m else {}
+    except ValueError:
+        payload = {}
+    texts, invalid = {}, []
+    for cid in crit_ids:
+        entry = payload.get(str(cid)) if isinstance(payload, dict) else None
+        score = entry.get("score") if isinstance(entry, dict) else None
+        if isinstance(score, str) and score.strip().isdigit():
+            score = int(score)  # Modelle ohne JSON-Schema liefern die Zahl gelegentlich als String
+        if isinstance(score, bool) or not isinstance(score, int) or not 0 <= score <= 5 \
+                or not isinstance(entry.get("rationale"), str):
+            invalid.append(cid)
+            continue
+        texts[cid] = json.dumps({"score": score, "rationale": entry["rationale"].strip()}, ensure_ascii=False)
+    return texts, invalid
+
+
+async def evaluate_question_single_async(
+    question: str,
+    specs: Optional[Dict[int, str]] = None,
+    stores: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    use_cache: Optional[bool] = None,
+) -> List[Dict]:
+    """
+    Alle Kriterien in einem Request: Frage einmal, jede Rubrik mit ihrem Spec-Kontext einmal,
+    Antwort als JSON-Objekt je Kriterium (JSON-Schema, wo das Modell es unterstützt).
+    Ungültige/fehlende Kriterien werden einzeln nachbewertet (_meta["fallback"]).
+    Ergebnisformat wie evaluate_question.
+    """
+    documents = _resolve_specs(specs, stores)
+    crit_ids = list(documents)
+    prompt = _render_multi_prompt(documents, question)
+    cache, hits, keys = _cached_texts({"multi": prompt}, use_cache)
+    text = hits.get("multi")
+    if text is not None:
+        record("llm.judge", 0.0, crit="multi", cached=True, tokens_out=count_tokens(text))
+    else:
+        timeout = timeout or float(os.getenv("JUDGE_TIMEOUT", "120"))
+        max_retries = int(os.getenv("JUDGE_MAX_RETRIES", "4")) if max_retries is None else max_retries
+        llm_evaluator = get_llm_evaluator(max_retries=0)
+        fmt = _response_format(crit_ids)
+        if fmt is not None:
+            llm_evaluator = llm_evaluator.bind(response_format=fmt)
+        text = await _judge_criterion_async(llm_evaluator, prompt, asyncio.Semaphore(1), timeout, max_retries,
+                                            crit_id="multi")
+    texts, invalid = _parse_multi_response(text, crit_ids)
+    if cache is not None and not invalid and "multi" not in hits:
+        cache.put(keys["multi"], text)
+    if invalid:
+        fallback = await evaluate_question_async(question, specs={cid: documents[cid] for cid in invalid},
+                                                 timeout=timeout, max_retries=max_retries, use_cache=use_cache)
+        for cid in invalid:
+            texts[cid] = fallback[0]["evaluations"][str(cid)]["text"]
+    result = _result(question, {cid: texts[cid] for cid in crit_ids},
+                     cached=set(crit_ids) if "multi" in hits else set())
+    result[0]["_meta"]["judge_mode"] = "single"
+    result[0]["_meta"]["fallback"] = [str(cid) for cid in invalid]
+    return result
+
+
+def evaluate_question(
+    question: str,
+    specs: Optional[Dict[int, str]] = None,
+    stores: Optional[Dict[str, Any]] = None,
+    concurrent: Optional[bool] = None,
+    use_cache: Optional[bool] = None,
+    mode: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Entweder 'specs' (fertige Rubrik-Kontexte) übergeben ODER 'stores' angeben,
+    damit die specs on-the-fly gebaut werden. Kein stiller Fallback mehr.
+    mode (Standard: JUDGE_MODE): "concurrent" bewertet alle Kriterien gleichzeitig, "sequential"
+    nacheinander, "single" alle Kriterien in einem Request (evaluate_question_single_async).
+    concurrent=True/False erzwingt wie bisher "concurrent" bzw. "sequential".
+    use_cache=False (oder JUDGE_CACHE=0) umgeht den Judge-Cache; gecachte Kriterien sind in
+    evaluations[..]["cached"] bzw. _meta["cache_hits"] markiert.
+    """
+    mode = mode or os.getenv("JUDGE_MODE", "concurrent")
+    if concurrent is not None:
+        mode = "concurrent" if concurrent else "sequential"
+    if mode not in ("concurrent", "sequential", "single"):
+        raise RuntimeError(f"Unbekannter JUDGE_MODE: {mode}")
+    if mode == "single":
+        return asyncio.run(evaluate_question_single_async(question, specs=specs, stores=stores, use_cache=use_cache))
+    if mode == "concurrent":
+        return asyncio.run(evaluate_question_async(question, specs=specs, stores=stores, use_cache=use_cache))
+
+    documents = _resolve_specs(specs, stores)
+    prompts = _render_prompts(documents, question)
+    cache, texts, keys = _cached_texts(prompts, use_cache)
+    _record_cache_hits(texts)
+    cached = set(texts)
+    llm_evaluator = get_llm_evaluator()
+    for crit_id, prompt in prompts.items():
+        if crit_id in texts:
+            continue
+        with span("llm.judge", crit=str(crit_id), tokens_in=count_tokens(prompt)) as s:
+            response = llm_evaluator.invoke(prompt)
+            texts[crit_id] = _response_text(response)
+            s["tokens_out"] = count_tokens(texts[crit_id])
+        if cache is not None and _cacheable(texts[crit_id]):
+            cache.put(keys[crit_id], texts[crit_id])
+    return _result(question, {cid: texts[cid] for cid in prompts}, cached=cached)
+
+
+def results_to_row(question, results, origin="AbiBuddy") -> Dict[str, Any]:
+    """Eine CSV-Zeile: Origin, Frage, Kriteriums-Scores, -Begründungen, -Rohtexte und Average-Score."""
     score_data = {"origin": origin, "question": question}
     total_score = 0
     
@@ -85,15 +367,22 @@ def export_results_to_csv(question, results, origin="AbiBuddy", path="evaluation
         total_score += evaluation["score"]
         score_data[f"Kriterium {crit_id} Text"] = evaluation["text"].replace("\n", " ").strip()
     score_data["average_score"] = round(total_score / len(results[0]["evaluations"]), 2) if results[0]["evaluations"] else 0
+    return score_data
 
-    df_new = pd.DataFrame([score_data])
-    file_path = Path(path)
-    if file_path.exists():
-        try:
-            df_old = pd.read_csv(file_path)
-        except Exception as e:
-            df_old = pd.DataFrame() 
-        df = pd.concat([df_old, df_new], ignore_index=True)
-    else:
-        df = df_new
-    df.to_csv(file_path, index=False)
+
+def export_results_to_csv(question, results, origin="AbiBuddy", path: Optional[str] = None,
+                          store: Optional[ResultsStore] = None):
+    """
+    Hängt die Bewertungsergebnisse einer Frage an den Ergebnis-Store an (O(1), siehe results_store.py).
+    Spaltenlayout wie bisher; die CSV entsteht per ResultsStore.export_csv().
+    Enthält Origin, Frage, Kriteriums-Scores, Kriteriums-Begründungen und Average-Score.
+    'path' (veraltet): schreibt danach zusätzlich alle Ergebnisse als CSV dorthin – liest dafür den ganzen
+    Store, also nicht pro Bewertung verwenden.
+    """
+    model = results[0].get("_meta", {}).get("model")
+    store = store or ResultsStore()
+    store.append(results_to_row(question, results, origin), model=model)
+    if path is not None:
+        warnings.warn("export_results_to_csv(path=...) ist veraltet: Ergebnisse liegen im Ergebnis-Store, "
+                      "CSV per ResultsStore.export_csv(path)", DeprecationWarning, stacklevel=2)
+        store.export_csv(path)
@@ -2,11 +2,18 @@ from dotenv import load_dotenv, find_dotenv
 import streamlit as st
 import pandas as pd
 import os
+import hashlib
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from prompts import QUESTION_GENERATION_PROMPT
-from rag_utils import setup_vectorstores, get_generation_contexts, load_specs_for_evaluation
+from rag_utils import LazyStores, load_vectorstore, get_generation_contexts, load_specs_for_evaluation, cache_stats
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from llm_judge import evaluate_question, export_results_to_csv
+from results_store import ResultsStore
+from tracing import Trace, count_tokens, span, load_traces, summarize, tokens_exact
+from run_store import RunStore, new_run_id
 from rag_utils import load_specs_for_evaluation
 from typing import Dict
 
@@ -28,20 +35,65 @@ def _is_valid_specs(s) -> bool:
         return False
     return all(isinstance(v, str) and v.strip() for v in s.values())
 
-def ensure_specs_snapshot():
-    """Baut einen gültigen specs-Snapshot, falls er fehlt/inkonsistent ist."""
+def ensure_specs_snapshot(snapshot=None):
+    """
+    Baut einen gültigen specs-Snapshot, falls er fehlt/inkonsistent ist.
+    'snapshot': bereits (z.B. parallel) berechneter Snapshot, wird nur noch übernommen.
+    """
     if "stores" not in st.session_state or not st.session_state.stores:
         return  # stores werden an anderer Stelle gebaut
     if "specs" not in st.session_state or not _is_valid_specs(st.session_state.specs):
-        s = load_specs_for_evaluation(st.session_state.stores)
+        s = snapshot if snapshot is not None else load_specs_for_evaluation(st.session_state.stores)
         if _is_valid_specs(s):
             st.session_state.specs = s
 
+@st.cache_resource
+def audit_executor() -> ThreadPoolExecutor:
+    """Ein Hintergrund-Thread pro Server-Prozess für die Audit-Dateien unter RUNS_DIR."""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="audit")
+
+@st.cache_resource
+def run_store() -> RunStore:
+    return RunStore(RUNS_DIR)
+
+def write_audit(run_id: str, name: str, payload, **meta) -> None:
+    """Legt ein Artefakt des Runs im Hintergrund im RunStore ab – die UI wartet nicht auf die Platte."""
+    audit_executor().submit(run_store().put, run_id, name, payload, **meta)
+
+@st.cache_resource(show_spinner=False)
+def shared_stores() -> LazyStores:
+    """
+    Stores einmal pro Server-Prozess und von allen Sessions gemeinsam (read-only) genutzt; die FAISS-Indizes
+    sind memory-mapped, mehrere Prozesse teilen sie über den Page-Cache. Geladen wird im Hintergrund
+    (specs zuerst) – die Seite ist sofort bedienbar, ein Zugriff auf einen noch fehlenden Store wartet nur auf diesen.
+    """
+    executor, runs = audit_executor(), run_store()  # Hintergrund-Thread hat keinen Streamlit-Kontext
+
+    def load(key: str):
+        trace = Trace(new_run_id(), "setup")
+        with trace.activate():
+            result = load_vectorstore(key)
+        executor.submit(runs.put, trace.run_id, trace.name, trace.to_dict(), kind=trace.kind)
+        return result
+
+    stores = LazyStores(load)
+    stores.start()
+    return stores
+
+def wait_for_stores(*keys: str) -> None:
+    """Wartet mit Spinner auf noch nicht geladene Stores (Ladefehler erscheinen als Exception)."""
+    stores = st.session_state.stores
+    missing = [k for k in keys if not stores.ready(k)]
+    if missing:
+        with st.spinner(f"Warte auf Index {', '.join(missing)} ..."):
+            for k in missing:
+                stores[k]  # wartet auf den Hintergrund-Thread bzw. lädt selbst
+
 st.title("AbiBuddy – Abituraufgaben Generator & Evaluator")
 
 # Initialisiere Session State für Robustheit bei Refresh
 if "stores" not in st.session_state:
-    st.session_state.stores = setup_vectorstores()
+    st.session_state.stores = shared_stores()
 if "generated_question" not in st.session_state:
     st.session_state.generated_question = ""
     st.session_state.generated_origin = ""
@@ -54,46 +106,104 @@ if "evaluated_questions" not in st.session_state:
 if "contexts" not in st.session_state:
     st.session_state.contexts = None
 
+STATUS_ICONS = {"bereit": "✅", "lädt": "⏳", "wartet": "🕓", "Fehler": "❌"}
+
+def loading(stores: LazyStores) -> bool:
+    return any(state in ("lädt", "wartet") for state in stores.status().values())
+
+def index_status(stores: LazyStores) -> None:
+    st.caption("Index-Status")
+    for key, state in stores.status().items():
+        line = f"{STATUS_ICONS[state]} {key}: {state}"
+        if state == "bereit":
+            u = stores.report[key]
+            line += f" ({stores.seconds[key]:.1f}s) · {u.summary()}" + "".join(
+                f" · {f}: {t:.1f}s" for f, t in u.slowest(1))
+        elif state == "Fehler":
+            line += f" – {stores.errors[key]}"
+        st.caption(line)
+    st.caption("Cache (Treffer/Fehlschläge)")
+    for key, c in cache_stats(stores.loaded()).items():
+        st.caption(f"{key}: {c['hits']}/{c['misses']}")
+
+@st.fragment(run_every=1.0)
+def index_status_live() -> None:
+    """Aktualisiert sich jede Sekunde, bis alle Stores geladen sind; danach einmal die ganze Seite neu."""
+    stores = st.session_state.stores
+    if not loading(stores):
+        st.rerun()
+    index_status(stores)
+
+with st.sidebar:
+    if loading(st.session_state.stores):
+        index_status_live()
+    else:
+        index_status(st.session_state.stores)
+
 llm = ChatOpenAI(temperature=OPENAI_TEMPERATURE, top_p=1.0, model=OPENAI_MODEL)
 MODEL_TAG = f"{getattr(llm, 'model_name', OPENAI_MODEL)}_t{OPENAI_TEMPERATURE}_p{getattr(llm, 'top_p', 1.0)}"
 
+def stream_llm(prompt: str, stats: Dict):
+    """Token-Stream des LLM; trägt Time-to-first-Token und Output-Tokens in 'stats' (Span) ein."""
+    t0 = time.perf_counter()
+    parts = []
+    for chunk in llm.stream(prompt):
+        if not parts:
+            stats["ttft_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        parts.append(chunk.content)
+        yield chunk.content
+    stats["tokens_out"] = count_tokens("".join(parts))
+
 st.subheader("🧠 Eigene Abituraufgabe generieren")
 if st.button("Neue Abituraufgabe generieren"):
-    ensure_specs_snapshot()  # vor Generierung absichern
-    contexts = get_generation_contexts(st.session_state.stores)
-    st.session_state.contexts = contexts
+    wait_for_stores("specs", "pool", "eval")
+    run_id = new_run_id()
+    trace = Trace(run_id, "generation")
+    # Specs-Snapshot wird für den Prompt nicht gebraucht -> läuft parallel zu Retrieval + Generierung
+    with trace.activate(), ThreadPoolExecutor(max_workers=1) as pool:
+        specs_future = pool.submit(contextvars.copy_context().run, load_specs_for_evaluation,
+                                   st.session_state.stores)
+        with st.spinner("Kontexte werden gesucht ..."):
+            contexts = get_generation_contexts(st.session_state.stores)
+        st.session_state.contexts = contexts
 
 # Baue vollständigen Prompt mit Template
-    full_prompt = QUESTION_GENERATION_PROMPT.format(
-    specs=contexts["specs"],
-    pool=contexts["pool"],
-    evals=contexts["evals"]
-        )
-    st.session_state.full_prompt = full_prompt
-
-# Schicke an LLM 
-    response = llm.invoke(full_prompt)
-    st.session_state.generated_question = response.content.strip()
-    st.session_state.generated_origin = "AbiBuddy"
+        with span("prompt.render") as s:
+            full_prompt = QUESTION_GENERATION_PROMPT.format(
+            specs=contexts["specs"],
+            pool=contexts["pool"],
+            evals=contexts["evals"]
+                )
+            s["tokens_in"] = count_tokens(full_prompt)
+        st.session_state.full_prompt = full_prompt
+
+# Schicke an LLM – Tokens erscheinen, sobald sie ankommen
+        live = st.empty()
+        with span("llm.generate", model=MODEL_TAG, tokens_in=count_tokens(full_prompt)) as s, live.container():
+            text = st.write_stream(stream_llm(full_prompt, s))
+        live.empty()  # Endfassung steht gleich im Textfeld unten
+        st.session_state.generated_question = text.strip()
+        st.session_state.generated_origin = "AbiBuddy"
+        ensure_specs_snapshot(specs_future.result())  # vor Bewertung absichern
     st.success("Neue Aufgabe wurde generiert.")
+    st.session_state.last_trace = trace.to_dict()
 
-# Audit-Log: Kontexte + Prompt + Params + Specs-Snapshot
-    import json, hashlib, time, os
-    os.makedirs(RUNS_DIR, exist_ok=True)
-    run_id = str(int(time.time()))
+# Audit-Log: Kontexte + Prompt + Params + Specs-Snapshot (im Hintergrund, Texte dedupliziert im RunStore)
+    prompt_hash = hashlib.sha256(full_prompt.encode("utf-8")).hexdigest()
+    meta = {"kind": "generation", "model": MODEL_TAG, "origin": st.session_state.generated_origin,
+            "prompt_hash": prompt_hash}
+    write_audit(run_id, trace.name, st.session_state.last_trace, **meta)
     # speichere specs_map (Snapshot)
-    with open(f"{RUNS_DIR}/{run_id}_specs_map.json", "w", encoding="utf-8") as f:
-        json.dump(st.session_state.specs, f, ensure_ascii=False, indent=2)
+    write_audit(run_id, "specs_map", st.session_state.get("specs"))
     # speichere Kontexte + Prompt + Hash
     blob = {
         "model": MODEL_TAG,
         "prompt_template": "QUESTION_GENERATION_PROMPT",
         "contexts": {k: st.session_state.contexts[k] for k in ["specs","pool","evals"]},
         "full_prompt": full_prompt,
+        "prompt_hash": prompt_hash,
     }
-    blob["prompt_hash"] = hashlib.sha256(full_prompt.encode("utf-8")).hexdigest()
-    with open(f"{RUNS_DIR}/{run_id}_generation_context.json", "w", encoding="utf-8") as f:
-        json.dump(blob, f, ensure_ascii=False, indent=2)
+    write_audit(run_id, "generation_context", blob)
     st.session_state.last_run_id = run_id
 
 if st.session_state.generated_question:
@@ -110,6 +220,7 @@ if st.button("Externe Frage zur Bewertung übernehmen"):
     else:
         st.session_state.generated_question = external_question
         st.session_state.generated_origin = external_origin
+        st.session_state.last_run_id = None  # externe Frage gehört zu keinem Generierungs-Run
         st.success(f"Frage aus '{external_origin}' übernommen.")
 
 st.divider()
@@ -117,18 +228,20 @@ st.divider()
 if "generated_question" in st.session_state and st.session_state.generated_question:
     st.subheader("📊 Frage bewerten und exportieren")
     if st.button("Evaluieren & CSV exportieren"):
-        with st.spinner("Bewertung läuft..."):
+        # jede Bewertung ist ein eigener Run; die Generierung der Frage (falls aus AbiBuddy) als parent
+        run_id, parent = new_run_id(), st.session_state.get("last_run_id")
+        trace = Trace(run_id, "evaluation")
+        wait_for_stores("specs")  # Bewertung braucht nur den Specs-Index
+        with st.spinner("Bewertung läuft..."), trace.activate():
             ensure_specs_snapshot()  # vor Bewertung absichern
             # LLM-as-a-Judge Bewertung durchführen
             results = evaluate_question(
                 question=st.session_state.generated_question,
                 specs=st.session_state.specs
             )
-            # Audit: Rohantworten des Judges sichern
-            import json, os
-            os.makedirs(RUNS_DIR, exist_ok=True)
-            with open(f"{RUNS_DIR}/{st.session_state.last_run_id}_judge_raw.json", "w", encoding="utf-8") as f:
-                json.dump(results, f, ensure_ascii=False, indent=2)
+            # Audit: Rohantworten des Judges sichern (im Hintergrund)
+            write_audit(run_id, "judge_raw", results, kind="evaluation", model=MODEL_TAG,
+                        origin=st.session_state.generated_origin, parent=parent)
             # Resultate (Scores) in Session-State speichern
             eval_dict = {
                 "question": st.session_state.generated_question,
@@ -139,13 +252,18 @@ if "generated_question" in st.session_state and st.session_state.generated_quest
                 eval_dict[f"Kriterium {crit_id} Begründung"] = eval_result["reason"]
 
             st.session_state.evaluated_questions.append(eval_dict)
-            # In CSV-Datei schreiben (anhängen)
+            # In Ergebnis-Store schreiben (anhängen)
             export_results_to_csv(
                 question=st.session_state.generated_question,
                 results=results,
                 origin=st.session_state.generated_origin
             )
-        st.success("Bewertung abgeschlossen & gespeichert als evaluation_results.csv")
+        st.session_state.last_trace = trace.to_dict()
+        write_audit(run_id, trace.name, st.session_state.last_trace)
+        st.success("Bewertung abgeschlossen & im Ergebnis-Store gespeichert")
+        hits = results[0]["_meta"].get("cache_hits", [])
+        if hits:
+            st.caption("Aus dem Judge-Cache: Kriterium " + ", ".join(hits))
 
 # Ergebnisse anzeigen (Tabelle mit Scores pro Kriterium)
 if st.session_state.evaluated_questions:
@@ -165,3 +283,31 @@ if st.session_state.evaluated_questions:
     "Begründung 5": eq.get("Kriterium 5 Begründung", "")
 } for eq in st.session_state.evaluated_questions])
     st.dataframe(df)
+
+if st.button("Alle Ergebnisse als CSV exportieren"):
+    trace = Trace(new_run_id(), "export")
+    with trace.activate():
+        n = ResultsStore().export_csv("evaluation_results.csv")
+    write_audit(trace.run_id, trace.name, trace.to_dict(), kind=trace.kind)
+    st.success(f"{n} Bewertungen nach evaluation_results.csv exportiert")
+
+# Diagnose: Laufzeiten pro Stufe (letzter Run) und Perzentile über alle Runs im RunStore
+@st.cache_data(ttl=30, show_spinner=False)
+def trace_summary() -> pd.DataFrame:
+    return pd.DataFrame(summarize(load_traces()))
+
+with st.expander("🩺 Diagnose (Laufzeiten & Tokens)"):
+    last = st.session_state.get("last_trace")
+    if last:
+        st.markdown(f"**Letzter Run** `{last['run_id']}` ({last['kind']}): {last['total_ms'] / 1000:.2f} s")
+        spans = pd.DataFrame(last["spans"])
+        st.bar_chart(spans.groupby("name")["ms"].sum().sort_values(ascending=False))
+        st.dataframe(spans.drop(columns=["id"]), hide_index=True)
+    summary = trace_summary()
+    if summary.empty:
+        st.caption("Noch keine Traces im RunStore (RUNS_DIR).")
+    else:
+        st.markdown("**Alle Runs** (Perzentile in ms, Tokens im Mittel)")
+        st.dataframe(summary, hide_index=True)
+    if not tokens_exact():
+        st.caption("Token-Zahlen geschätzt (~4 Zeichen/Token) – tiktoken-Encoding nicht verfügbar.")
@@ -0,0 +1,81 @@
+# Analyse der Bewertungen: Mittelwerte, Score-Verteilungen und Drift je Origin/Modell/Kriterium.
+# Liest ausschließlich die vorab aggregierten Tabellen des Ergebnis-Stores (results_store.py),
+# nie die Begründungs-/Rohtext-Spalten.
+import time
+from datetime import date
+from dotenv import load_dotenv, find_dotenv
+import pandas as pd
+import streamlit as st
+from results_store import AVERAGE, SCORE_BINS, ResultsStore
+
+load_dotenv(find_dotenv(), override=True)
+st.title("📈 Analyse der Bewertungen")
+
+
+@st.cache_resource
+def results_store() -> ResultsStore:
+    return ResultsStore()
+
+
+def crit_label(crit: str) -> str:
+    return "Ø" if crit == AVERAGE else f"Kriterium {crit}"
+
+
+store = results_store()
+elapsed = []  # Zeit in den Store-Abfragen (ohne Rendering)
+
+
+def query(**kwargs) -> pd.DataFrame:
+    t0 = time.perf_counter()
+    df = store.summary(**kwargs)
+    elapsed.append(time.perf_counter() - t0)
+    return df
+
+
+dims = store.dimensions()
+if not dims["day"]:
+    st.info("Noch keine Bewertungen im Ergebnis-Store.")
+    st.stop()
+
+c1, c2, c3 = st.columns(3)
+origins = c1.multiselect("Origin", dims["origin"], default=dims["origin"])
+models = c2.multiselect("Modell (Judge)", dims["model"], default=dims["model"])
+period = c3.date_input("Zeitraum", (date.fromisoformat(dims["day"][0]), date.fromisoformat(dims["day"][-1])))
+since, until = (period[0], period[-1]) if isinstance(period, (list, tuple)) and period else (None, None)
+filters = {
+    "origins": origins or None, "models": models or None,
+    "since": since.isoformat() if since else None, "until": until.isoformat() if until else None,
+}
+
+# Mittelwerte je Origin und Kriterium
+st.subheader("Mittelwerte")
+means = query(by=("origin", "crit"), **filters)
+if means.empty:
+    st.info("Keine Bewertungen für diese Auswahl.")
+    st.stop()
+table = means.pivot(index="origin", columns="crit", values="mean")
+table = table[sorted(table.columns, key=lambda c: (c == AVERAGE, len(c), c))].rename(columns=crit_label)
+table["n"] = means[means["crit"] == AVERAGE].set_index("origin")["n"]
+st.dataframe(table.style.format("{:.2f}", subset=[c for c in table.columns if c != "n"]))
+
+# Score-Verteilung für ein Kriterium
+st.subheader("Verteilung")
+crits = sorted(dims["crit"], key=lambda c: (c != AVERAGE, len(c), c))
+crit = st.selectbox("Kriterium", crits, format_func=crit_label)
+dist = query(by=("origin",), crits=[crit], **filters).set_index("origin")
+hist = dist[[f"h{i}" for i in SCORE_BINS]].div(dist["n"], axis=0)
+hist.columns = [str(i) for i in SCORE_BINS]
+st.bar_chart(hist.T, stack=False)
+st.caption("Anteil der Bewertungen je Score (0–5); beim Ø auf ganze Punkte gerundet.")
+
+# Drift über die Zeit
+st.subheader("Verlauf")
+d1, d2 = st.columns(2)
+bucket = d1.radio("Raster", ["day", "week", "month"], horizontal=True,
+                  format_func={"day": "Tag", "week": "Woche", "month": "Monat"}.get)
+series = d2.radio("Linien je", ["origin", "model"], horizontal=True,
+                  format_func={"origin": "Origin", "model": "Modell"}.get)
+drift = query(by=("day", series), crits=[crit], bucket=bucket, **filters)
+st.line_chart(drift.pivot(index="day", columns=series, values="mean"))
+
+st.caption(f"{len(elapsed)} Abfragen, zusammen {sum(elapsed) * 1000:.1f} ms")
@@ -1,6 +1,10 @@
 # Direct PDF parsing (PyMuPDF) mit Abschnitts-/Seiten-Metadaten
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
 from langchain.schema import Document
 
 try:
@@ -8,18 +12,22 @@ try:
 except ImportError as e:
     raise ImportError("Bitte 'pymupdf' installieren: pip install pymupdf") from e
 
+# Große PDFs werden in Seitenblöcke dieser Größe auf mehrere Worker verteilt
+PAGES_PER_TASK = 24
 
-def _iter_pdf_sections(pdf_path: Path) -> Iterable[Tuple[str, str, int, int]]:
+
+def _iter_pdf_sections(pdf_path: Path, first: int = 0,
+                       last: Optional[int] = None) -> Iterable[Tuple[str, str, int, int]]:
     """
     Baseline-Heuristik:
-    - liest alle Seiten der PDF
+    - liest die Seiten [first, last) der PDF (Standard: alle)
     - bildet pro Seite einen Abschnitt (Section)
     - liefert (section_title, text, page_start, page_end)
     Später kannst du hier Header-/Listen-Erkennung verfeinern.
     """
     doc = fitz.open(str(pdf_path))
     try:
-        for i in range(len(doc)):
+        for i in range(first, len(doc) if last is None else min(last, len(doc))):
             page = doc.load_page(i)
             text = page.get_text("text").strip()
             if not text:
@@ -30,7 +38,112 @@ def _iter_pdf_sections(pdf_path: Path) -> Iterable[Tuple[str, str, int, int]]:
         doc.close()
 
 
-def extract_documents_from_dir(base_dir: str, source_label: str) -> List[Document]:
+def _page_count(pdf_path: Path) -> int:
+    doc = fitz.open(str(pdf_path))
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def _extract_task(pdf_path: Path, first: int, last: Optional[int]) -> Tuple[List[Tuple[str, str, int, int]], float]:
+    """Worker-Funktion (muss top-level sein, damit sie in den Prozess-Pool gepickelt werden kann)."""
+    t0 = time.perf_counter()
+    sections = list(_iter_pdf_sections(pdf_path, first, last))
+    return sections, time.perf_counter() - t0
+
+
+def _to_documents(pdf_path: Path, sections: Iterable[Tuple[str, str, int, int]],
+                  source_label: str) -> List[Document]:
+    return [
+        Document(
+            page_content=text,
+            metadata={
+                "source": source_label,
+                "file": pdf_path.name,
+                "section": section_title,
+                "page_start": p0,
+                "page_end": p1,
+            },
+        )
+        for section_title, text, p0, p1 in sections
+    ]
+
+
+def default_workers() -> int:
+    return int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+
+def extract_documents_from_file(pdf_path: Path, source_label: str) -> List[Document]:
+    """Extrahiert eine einzelne PDF (Metadaten wie in extract_documents_from_dir)."""
+    return _to_documents(pdf_path, _iter_pdf_sections(pdf_path), source_label)
+
+
+def iter_documents_from_files(
+    paths: List[Path],
+    source_label: str,
+    workers: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+    root: Optional[Path] = None,
+) -> Iterable[Tuple[Path, List[Document]]]:
+    """
+    Extrahiert mehrere PDFs parallel in einem Prozess-Pool (workers<=1: sequentiell).
+    Große PDFs werden seitenblockweise verteilt. Generator: neue Dateien werden erst
+    eingereicht, wenn der Aufrufer Ergebnisse abholt (begrenzter Speicher). Liefert (pfad, documents) in der
+    Reihenfolge von 'paths' – unabhängig davon, welcher Worker zuerst fertig ist.
+    'timings' erhält pro Datei die Extraktionszeit in Sekunden (Summe ihrer Seitenblöcke), Schlüssel ist
+    der Pfad relativ zu 'root' (Corpus-Verzeichnis, wie IndexUpdate.timings) – gleichnamige PDFs in
+    verschiedenen Unterordnern überschreiben sich nicht.
+    """
+    def timing_key(p: Path) -> str:
+        return p.relative_to(root).as_posix() if root is not None else p.as_posix()
+
+    workers = default_workers() if workers is None else workers
+    if workers <= 1 or not paths:
+        for p in paths:
+            sections, secs = _extract_task(p, 0, None)
+            if timings is not None:
+                timings[timing_key(p)] = secs
+            yield p, _to_documents(p, sections, source_label)
+        return
+
+    # Backpressure: höchstens 2*workers Dateien gleichzeitig in Arbeit bzw. ungelesen im Speicher
+    max_inflight = 2 * workers
+    todo = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        pending: Deque[Tuple[Path, list]] = deque()
+
+        def submit_next() -> bool:
+            p = next(todo, None)
+            if p is None:
+                return False
+            n = _page_count(p)
+            ranges = [(i, i + PAGES_PER_TASK) for i in range(0, n, PAGES_PER_TASK)] or [(0, None)]
+            pending.append((p, [ex.submit(_extract_task, p, a, b) for a, b in ranges]))
+            return True
+
+        while len(pending) < max_inflight and submit_next():
+            pass
+        while pending:
+            p, parts = pending.popleft()
+            sections: List[Tuple[str, str, int, int]] = []
+            secs = 0.0
+            for fut in parts:
+                part, t = fut.result()
+                sections.extend(part)
+                secs += t
+            submit_next()
+            if timings is not None:
+                timings[timing_key(p)] = secs
+            yield p, _to_documents(p, sections, source_label)
+
+
+def extract_documents_from_dir(
+    base_dir: str,
+    source_label: str,
+    workers: Optional[int] = None,
+    timings: Optional[Dict[str, float]] = None,
+) -> List[Document]:
     """
     Liest *rekursiv* alle PDFs unter base_dir und erzeugt LangChain-Documents mit Metadaten.
     metadata:
@@ -38,20 +151,11 @@ def extract_documents_from_dir(base_dir: str, source_label: str) -> List[Documen
       - file:   Pfad zur PDF
       - section: Titel (hier: 'Seite X' – kann später echter Header sein)
       - page_start / page_end: Seitenbereich des Abschnitts
+    Dateien werden sortiert verarbeitet (deterministische Reihenfolge), parallel über
+    'workers' Prozesse (Standard: PDF_WORKERS bzw. Anzahl CPUs).
     """
     docs: List[Document] = []
-    for pdf_path in Path(base_dir).rglob("*.pdf"):
-        for section_title, text, p0, p1 in _iter_pdf_sections(pdf_path):
-            docs.append(
-                Document(
-                    page_content=text,
-                    metadata={
-                        "source": source_label,
-                        "file": pdf_path.name,
-                        "section": section_title,
-                        "page_start": p0,
-                        "page_end": p1,
-                    },
-                )
-            )
+    paths = sorted(Path(base_dir).rglob("*.pdf"))
+    for _, file_docs in iter_documents_from_files(paths, source_label, workers, timings, root=Path(base_dir)):
+        docs.extend(file_docs)
     return docs
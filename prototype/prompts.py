@@ -178,4 +178,35 @@ Bitte gib am Ende deiner Analyse eine Bewertung auf einer Skala von 1 bis 5 ab:
 Gib die Ausgabe **ausschließlich** als JSON-Objekt im Format:
 {"score": <0-5 Ganzzahl>, "rationale": "<kurze Begründung>"}
 """
-}
\ No newline at end of file
+}
+# Ein-Aufruf-Modus (JUDGE_MODE=single): alle Rubriken in einem Prompt, Frage nur einmal.
+# Rubrik-Beschreibung und Arbeitsschritte stammen aus EVAL_PROMPTS (siehe llm_judge._rubric_parts).
+MULTI_EVAL_PROMPT = """
+Du bist Fachprüfer:in im Deutschabitur und bewertest die folgende Abituraufgabe nach mehreren Kriterien.
+
+Aufgabe:
+{{question}}
+
+{{rubrics}}
+
+Bewerte jedes Kriterium unabhängig von den anderen und ausschließlich anhand des zugehörigen Dokuments.
+Skala je Kriterium:
+
+1 = nicht erfüllt  
+2 = unzureichend erfüllt  
+3 = teilweise erfüllt  
+4 = weitgehend erfüllt  
+5 = vollständig erfüllt  
+
+Gib die Ausgabe **ausschließlich** als JSON-Objekt mit genau einem Eintrag pro Kriterium aus:
+{{format}}
+"""
+
+MULTI_EVAL_RUBRIC = """
+### Kriterium {{crit}}
+{{description}}
+
+{{context}}
+
+{{instruction}}
+"""
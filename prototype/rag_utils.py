@@ -1,14 +1,39 @@
+import hashlib
+import json
 import os
-from typing import Dict, List, Optional
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-from pdf_extract import extract_documents_from_dir
-from indexing import build_faiss, HybridEnsemble
+from pdf_extract import extract_documents_from_dir, iter_documents_from_files
+from indexing import (convert_index, embedding_model_name, get_embeddings, DocFilter, HybridEnsemble, IndexSpec,
+                      SearchRequest)
+from index_store import build_manifest, manifest_key, sync_store, load_artifact, save_artifact, IndexUpdate
+from context_packer import fit_budgets, pack_context
+from tracing import record, span
 
 
 # 1) Datenaufnahme aus PDFs
 
+# Corpus-Label -> (Unterverzeichnis unter DATA_ROOT, chunk_size, overlap)
+CORPORA = {
+    "specs": ("spezifikationen", 550, 100),     # fein
+    "pool": ("pool", 1000, 120),                # größer
+    "evaluation": ("evaluation", 1000, 120),
+}
+# Store-Key in setup_vectorstores -> Corpus-Label
+STORE_CORPORA = {"specs": "specs", "pool": "pool", "eval": "evaluation"}
+
+
+def _corpus_dir(label: str) -> str:
+    return os.path.join(os.getenv("DATA_ROOT", "data"), CORPORA[label][0])
+
+
 def _load_all_pdfs() -> Dict[str, List[Document]]:
     """
     Erwartete Verzeichnisstruktur (rekursiv):
@@ -16,14 +41,9 @@ def _load_all_pdfs() -> Dict[str, List[Document]]:
       data/evaluation/**.pdf
       data/spezifikationen/**.pdf
     """
-    base = os.getenv("DATA_ROOT", "data")
-    roots = {
-        "pool": os.path.join(base, "pool"),
-        "evaluation": os.path.join(base, "evaluation"),
-        "specs": os.path.join(base, "spezifikationen"),
-    }
     out: Dict[str, List[Document]] = {}
-    for label, base in roots.items():
+    for label in CORPORA:
+        base = _corpus_dir(label)
         if os.path.isdir(base):
             out[label] = extract_documents_from_dir(base, label)
         else:
@@ -34,61 +54,232 @@ def _load_all_pdfs() -> Dict[str, List[Document]]:
 
 # Chunking (domänenspezifisch)
 
-def _chunk_docs(docs: List[Document], chunk_size: int, overlap: int) -> List[Document]:
+def _iter_chunks(docs: Iterable[Document], chunk_size: int, overlap: int) -> Iterator[Document]:
     splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=overlap)
-    out: List[Document] = []
     for d in docs:
         for chunk in splitter.split_text(d.page_content):
-            out.append(Document(page_content=chunk, metadata=d.metadata.copy()))
-    return out
+            yield Document(page_content=chunk, metadata=d.metadata.copy())
 
 
-def _prepare_corpora(raw: Dict[str, List[Document]]) -> Dict[str, List[Document]]:
-    specs = _chunk_docs(raw.get("specs", []), chunk_size=550, overlap=100)     # fein
-    pool  = _chunk_docs(raw.get("pool", []),  chunk_size=1000, overlap=120)    # größer
-    evals = _chunk_docs(raw.get("evaluation", []), chunk_size=1000, overlap=120)
-    return {"specs": specs, "pool": pool, "evaluation": evals}
-
+def _chunk_docs(docs: List[Document], chunk_size: int, overlap: int) -> List[Document]:
+    return list(_iter_chunks(docs, chunk_size, overlap))
 
-# Getrennte Vectorstores
 
-def setup_vectorstores() -> Dict[str, HybridEnsemble]:
-    raw = _load_all_pdfs()
-    corpora = _prepare_corpora(raw)
-    vs_specs = build_faiss(corpora["specs"])
-    vs_pool  = build_faiss(corpora["pool"])
-    vs_eval  = build_faiss(corpora["evaluation"])
+def _prepare_corpora(raw: Dict[str, List[Document]]) -> Dict[str, List[Document]]:
     return {
-        "specs": HybridEnsemble(vs_specs, corpora["specs"]),
-        "pool":  HybridEnsemble(vs_pool,  corpora["pool"]),
-        "eval":  HybridEnsemble(vs_eval,  corpora["evaluation"]),
+        label: _chunk_docs(raw.get(label, []), chunk_size=size, overlap=overlap)
+        for label, (_, size, overlap) in CORPORA.items()
     }
 
 
+# Getrennte Vectorstores (persistent unter INDEX_DIR, siehe index_store.py)
+
+def _load_or_build_store(label: str) -> Tuple[HybridEnsemble, IndexUpdate]:
+    """
+    Lädt den Corpus aus dem Index-Cache und gleicht ihn mit den PDFs unter DATA_ROOT ab:
+    nur neue/geänderte PDFs werden extrahiert, gechunkt und eingebettet, entfernte gelöscht.
+    Geänderte Chunk-Parameter, ein anderes Embedding-Modell oder ein anderer Index-Typ (FAISS_INDEX)
+    erzwingen einen Neuaufbau.
+    """
+    _, size, overlap = CORPORA[label]
+    base = _corpus_dir(label)
+    spec = IndexSpec.from_env()
+    manifest = build_manifest(label, base, size, overlap, embedding_model_name(), spec.build_params())
+
+    def chunk_files(rels: List[str], timings: Dict[str, float]):
+        paths = [Path(base) / rel for rel in rels]
+        extracted = iter_documents_from_files(paths, label, timings=timings, root=Path(base))
+        for rel, (_, raw) in zip(rels, extracted):
+            with span("chunking", file=rel) as s:
+                chunks = _chunk_docs(raw, chunk_size=size, overlap=overlap)
+                s["chunks"] = len(chunks)
+            yield rel, chunks
+
+    with span(f"index.{label}") as s:
+        # gestreamt als Flat-Index, ANN-Training einmal am Ende über alle Vektoren
+        corpus, update = sync_store(label, manifest, get_embeddings(), chunk_files,
+                                    batch_size=int(os.getenv("INDEX_BATCH_SIZE", "512")),
+                                    finalize=lambda index, trained: convert_index(index, spec, trained))
+        s.update(summary=update.summary(), chunks=len(corpus.chunks))
+        # Extraktion läuft in Worker-Prozessen -> Dauer pro PDF nachträglich eintragen
+        for rel, secs in update.timings.items():
+            record("pdf.load", secs, file=rel)
+    return HybridEnsemble(corpus.faiss, corpus.chunks, version=manifest_key(manifest), bm25=corpus.bm25,
+                          label=label), update
+
+
+def load_vectorstore(key: str) -> Tuple[HybridEnsemble, IndexUpdate]:
+    """Ein Store nach Store-Key (specs/pool/eval), siehe _load_or_build_store."""
+    return _load_or_build_store(STORE_CORPORA[key])
+
+
+def setup_vectorstores(report: Optional[Dict[str, IndexUpdate]] = None) -> Dict[str, HybridEnsemble]:
+    """Baut/lädt alle Stores; optional landen die Änderungen pro Store in 'report'."""
+    stores: Dict[str, HybridEnsemble] = {}
+    for key in STORE_CORPORA:
+        stores[key], update = load_vectorstore(key)
+        if report is not None:
+            report[key] = update
+    return stores
+
+
+# Reihenfolge beim Laden im Hintergrund: kleine Stores zuerst, specs reicht für die Bewertung
+BACKGROUND_ORDER = ("specs", "eval", "pool")
+
+
+class LazyStores(Mapping):
+    """
+    Store-Dict wie setup_vectorstores, aber jeder Corpus wird erst beim ersten Zugriff geladen/gebaut –
+    oder vorab per start() in einem Hintergrund-Thread. Wer auf einen Store zugreift, den gerade ein
+    anderer Thread lädt, wartet auf dessen Ergebnis. Ein Ladefehler wird an alle Wartenden weitergereicht;
+    der nächste Zugriff versucht es erneut.
+    """
+    def __init__(self, loader: Optional[Callable[[str], Tuple[HybridEnsemble, IndexUpdate]]] = None):
+        self._loader = loader or load_vectorstore
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.report: Dict[str, IndexUpdate] = {}
+        self.seconds: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        """(Future des Stores, True wenn der Aufrufer ihn laden soll)."""
+        with self._lock:
+            if key in self._futures:
+                return self._futures[key], False
+            future = self._futures[key] = Future()
+            future.set_running_or_notify_cancel()
+            return future, True
+
+    def _load(self, key: str, future: Future) -> None:
+        t0 = time.perf_counter()
+        try:
+            store, update = self._loader(key)
+        except Exception as e:
+            self.errors[key] = f"{type(e).__name__}: {e}"
+            with self._lock:
+                del self._futures[key]
+            future.set_exception(e)
+            return
+        self.report[key] = update
+        self.seconds[key] = time.perf_counter() - t0
+        self.errors.pop(key, None)
+        future.set_result(store)
+
+    def __getitem__(self, key: str) -> HybridEnsemble:
+        if key not in STORE_CORPORA:
+            raise KeyError(key)
+        future, mine = self._claim(key)
+        if mine:
+            self._load(key, future)
+        return future.result()
+
+    def __contains__(self, key) -> bool:
+        return key in STORE_CORPORA  # ohne zu laden (Mapping.__contains__ ginge über __getitem__)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(STORE_CORPORA)
+
+    def __len__(self) -> int:
+        return len(STORE_CORPORA)
+
+    def start(self, keys: Iterable[str] = BACKGROUND_ORDER) -> threading.Thread:
+        """Lädt 'keys' nacheinander in einem Daemon-Thread; bereits geladene/ladende werden übersprungen."""
+        def run():
+            for key in keys:
+                future, mine = self._claim(key)
+                if mine:
+                    self._load(key, future)
+        thread = threading.Thread(target=run, name="store-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def ready(self, key: str) -> bool:
+        future = self._futures.get(key)
+        return future is not None and future.done() and future.exception() is None
+
+    def loaded(self) -> Dict[str, HybridEnsemble]:
+        """Nur die bereits fertig geladenen Stores (löst kein Laden aus)."""
+        return {key: self._futures[key].result() for key in STORE_CORPORA if self.ready(key)}
+
+    def status(self) -> Dict[str, str]:
+        """Je Store: 'bereit', 'lädt', 'wartet' oder 'Fehler'."""
+        out = {}
+        for key in STORE_CORPORA:
+            future = self._futures.get(key)
+            if self.ready(key):
+                out[key] = "bereit"
+            elif future is not None:
+                out[key] = "lädt"
+            else:
+                out[key] = "Fehler" if key in self.errors else "wartet"
+        return out
+
+
 
 # Retrieval-Utilities
 
-def _concat(docs: List[Document], limit_chars: int) -> str:
-    out, total = [], 0
-    for d in docs:
-        t = d.page_content.strip()
-        if not t:
-            continue
-        if total + len(t) > limit_chars:
-            out.append(t[: max(0, limit_chars - total)])
-            break
-        out.append(t)
-        total += len(t)
-    return "\n\n".join(out)
+def cache_stats(stores: Dict[str, HybridEnsemble]) -> Dict[str, Dict[str, int]]:
+    """Treffer/Fehlschläge der Such-Caches pro Store sowie des Query-Embedding-Caches."""
+    stats = {key: store.cache_stats() for key, store in stores.items()}
+    embs = {id(e): e for e in (s.faiss.embedding_function for s in stores.values()) if hasattr(e, "hits")}
+    if embs:
+        stats["embeddings"] = {"hits": sum(e.hits for e in embs.values()),
+                               "misses": sum(e.misses for e in embs.values())}
+    return stats
+
+
+def search_batch(stores: Dict[str, HybridEnsemble],
+                 requests: List[Tuple[str, SearchRequest]]) -> List[List[Document]]:
+    """
+    Mehrere Suchen (Store-Key, Anfrage) über alle Stores in einem Durchgang:
+    Cache-Treffer direkt, alle übrigen Queries in *einem* Embedding-Aufruf pro Embedding-Instanz
+    (die Stores teilen sich normalerweise eine), FAISS als Matrix-Anfrage pro Store,
+    MMR/BM25/Fusion der einzelnen Anfragen parallel. Ergebnisse in Eingabereihenfolge.
+    """
+    with span("retrieval.batch", requests=len(requests)) as stats:
+        return _search_batch(stores, requests, stats)
+
+
+def _search_batch(stores: Dict[str, HybridEnsemble], requests: List[Tuple[str, SearchRequest]],
+                  stats: Dict) -> List[List[Document]]:
+    results: List[Optional[List[Document]]] = [stores[key].cached(req) for key, req in requests]
+    todo = [i for i, res in enumerate(results) if res is None]
+    stats["cache_hits"] = len(requests) - len(todo)
+    if not todo:
+        return results
+
+    by_embedding: Dict[int, List[int]] = {}
+    for i in todo:
+        by_embedding.setdefault(id(stores[requests[i][0]].faiss.embedding_function), []).append(i)
+    vectors: Dict[int, np.ndarray] = {}
+    for idxs in by_embedding.values():
+        store = stores[requests[idxs[0]][0]]
+        vectors.update(zip(idxs, store.embed_queries([requests[i][1].query for i in idxs])))
+
+    by_store: Dict[str, List[int]] = {}
+    for i in todo:
+        by_store.setdefault(requests[i][0], []).append(i)
+    with ThreadPoolExecutor(max_workers=min(8, len(todo))) as ex:
+        for key, idxs in by_store.items():
+            found = stores[key].search_vectors([requests[i][1] for i in idxs],
+                                               np.stack([vectors[i] for i in idxs]), executor=ex)
+            for i, docs in zip(idxs, found):
+                results[i] = docs
+    return results
+
+
+def _specs_request(query: str, k: int = 6, section_whitelist: Optional[set[str]] = None,
+                   files: Optional[set[str]] = None) -> SearchRequest:
+    """Filter (Abschnitte, Datei-Basenames) wirken direkt im Index, nicht auf den Top-k."""
+    where = DocFilter.of(files=files, sections=section_whitelist) if (section_whitelist or files) else None
+    return SearchRequest(query, k=k, mmr=True, where=where)
 
 
 def retrieve_specs(query: str, stores: Dict[str, HybridEnsemble], k: int = 6,
-                   section_whitelist: Optional[set[str]] = None) -> List[Document]:
-    docs = stores["specs"].search(query, k=k, mmr=True)
-    if section_whitelist:
-        allow = {s.lower() for s in section_whitelist}
-        docs = [d for d in docs if (d.metadata.get("section") or "").lower() in allow]
-    return docs
+                   section_whitelist: Optional[set[str]] = None,
+                   files: Optional[set[str]] = None) -> List[Document]:
+    return stores["specs"].search_many([_specs_request(query, k, section_whitelist, files)])[0]
 
 
 def retrieve_pool(query: str, stores: Dict[str, HybridEnsemble], k: int = 6) -> List[Document]:
@@ -99,95 +290,122 @@ def retrieve_eval(query: str, stores: Dict[str, HybridEnsemble], k: int = 6) ->
     return stores["eval"].search(query, k=k, mmr=True)
 
 
-def _short(text: str, limit: int = 2200) -> str:
-    return text if len(text) <= limit else text[:limit] + " …"
+# Token-Budgets je Prompt-Abschnitt (siehe context_packer.fit_budgets); Reserve = Template + Antwort
+GENERATION_BUDGETS = {"operators": 250, "formats": 250, "specs": 900, "pool": 650, "evals": 280}
+GENERATION_RESERVE = 3000
+JUDGE_BUDGETS = {"specs": 800}
+JUDGE_RESERVE = 2500  # Template + Frage + Antwort
+
+
+# „Always-on“-Kurzkanon (Operatoren + Format)
+CANON_REQUESTS = [
+    ("specs", SearchRequest("Operatoren Liste Definitionen Deutsch Abitur", k=3)),
+    ("specs", SearchRequest("Formatvorgaben Struktur Aufgaben Aufgabentypen", k=3)),
+]
 
 
 def build_specs_canon(stores: Dict[str, HybridEnsemble]) -> str:
-    # „Always-on“-Kurzkanon (Operatoren + Format)
-    op = retrieve_specs("Operatoren Liste Definitionen Deutsch Abitur", stores, k=3)
-    fm = retrieve_specs("Formatvorgaben Struktur Aufgaben Aufgabentypen", stores, k=3)
-    return _short(
-        "### Operatoren (Kurzkanon)\n" + _concat(op, 1200) +
-        "\n\n### Formatvorgaben (Kurzkanon)\n" + _concat(fm, 1200),
-        2200
+    return _specs_canon(*search_batch(stores, CANON_REQUESTS), fit_budgets(GENERATION_BUDGETS, GENERATION_RESERVE))
+
+
+def _specs_canon(op: List[Document], fm: List[Document], budgets: Dict[str, int]) -> str:
+    return (
+        "### Operatoren (Kurzkanon)\n" + pack_context(op, budgets["operators"]) +
+        "\n\n### Formatvorgaben (Kurzkanon)\n" + pack_context(fm, budgets["formats"])
     )
 
 
 
 # High-level Kontexte (Generierung)
 
+GENERATION_REQUESTS = [
+    ("specs", SearchRequest("Deutsch Abitur Aufgabenbau Operatoren Kompetenzbereiche Erwartungshorizont", k=6)),
+    ("pool", SearchRequest("Beispiele Abituraufgaben Deutsch Interpretation Erörterung materialgestützt", k=6)),
+    ("eval", SearchRequest("Statistische Auswertung Auswahlhäufigkeit Themen Aufgabenwahl Schulen", k=6)),
+]
+
+
 def get_generation_contexts(stores: Dict[str, HybridEnsemble]) -> Dict[str, str]:
-    canon = build_specs_canon(stores)
-    spec_docs = retrieve_specs(
-        "Deutsch Abitur Aufgabenbau Operatoren Kompetenzbereiche Erwartungshorizont",
-        stores, k=6
-    )
-    pool_docs = retrieve_pool(
-        "Beispiele Abituraufgaben Deutsch Interpretation Erörterung materialgestützt",
-        stores, k=6
-    )
-    eval_docs = retrieve_eval(
-        "Statistische Auswertung Auswahlhäufigkeit Themen Aufgabenwahl Schulen",
-        stores, k=6
-    )
-    return {
-        "specs": canon + "\n\n" + _concat(spec_docs, 4000),
-        "pool": _concat(pool_docs, 2800),
-        "evals": _concat(eval_docs, 1200),
-    }
+    # Kanon + Kontexte: alle fünf Suchen in einem Batch (ein Embedding-Aufruf)
+    op, fm, spec_docs, pool_docs, eval_docs = search_batch(stores, CANON_REQUESTS + GENERATION_REQUESTS)
+    budgets = fit_budgets(GENERATION_BUDGETS, GENERATION_RESERVE)
+    with span("context.pack") as s:
+        contexts = {
+            "specs": _specs_canon(op, fm, budgets) + "\n\n" + pack_context(spec_docs, budgets["specs"]),
+            "pool": pack_context(pool_docs, budgets["pool"]),
+            "evals": pack_context(eval_docs, budgets["evals"]),
+        }
+        s["budget"] = sum(budgets.values())
+    return contexts
 
 
 
 # Bewertung: rubrik-spezifische Specs
 
+SPEC_QUERIES: Dict[int, str] = {
+    1: "Prüfungsschwerpunkte Deutsch 2025 Leistungskurs Aufgabenarten Bewertung Dauer der Prüfung",
+    2: "Operatoren Definitionen Beispiele Anforderungsbereiche Deutsch Abitur",
+    3: "Beschreibung der Struktur Arbeitszeit Auswahlzeit Erwartungshorizont Bewertungshinweise",
+    4: "Erläuterungen zur Konstruktion Aufgabenarten Prinzipien Varianten materialgestützt",
+    5: "Kriterien für Aufgaben Erwartungshorizont Bewertungshinweise Domänenspezifik Materialgrundlage",
+}
+REQUIRED_DOCS: Dict[int, str] = {
+    1: "ps_deutsch_2025_lk.pdf",
+    2: "D_Grundstock_von_Operatoren.pdf",
+    3: "D_Beschreibung_der_Struktur_der_Aufgaben.pdf",
+    4: "D_Erlaeuterungen_zur_Konstruktion_der_Aufgaben.pdf",
+    5: "D_Kriterien_fuer_Aufgaben_Erwartungshorizonte_und_Bewertungshinweise.pdf",
+}
+# Erhöhen, wenn sich die Berechnung (k, Packen, Filter) ändert
+SPECS_SNAPSHOT_FORMAT = 3
+
+
+def specs_snapshot_key(stores: Dict[str, HybridEnsemble]) -> str:
+    """Hängt nur von Specs-Index-Version (PDFs + Chunking + Embedding), Queries, Zieldokumenten und Budget ab."""
+    raw = json.dumps([SPECS_SNAPSHOT_FORMAT, stores["specs"].version, SPEC_QUERIES, REQUIRED_DOCS,
+                      fit_budgets(JUDGE_BUDGETS, JUDGE_RESERVE)],
+                     sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _compute_specs_for_evaluation(stores: Dict[str, HybridEnsemble]) -> Dict[int, str]:
+    out: Dict[int, str] = {}
+    budget = fit_budgets(JUDGE_BUDGETS, JUDGE_RESERVE)["specs"]
+    for cid in SPEC_QUERIES:
+        if not REQUIRED_DOCS.get(cid, ""):
+            raise RuntimeError(f"REQUIRED_DOCS fehlt für Rubrik {cid}.")
+    # Suche nur innerhalb des geforderten PDFs (Basename) – kein Nachfiltern großer Trefferlisten
+    found = search_batch(stores, [
+        ("specs", _specs_request(q, k=12, files={REQUIRED_DOCS[cid]})) for cid, q in SPEC_QUERIES.items()
+    ])
+    for (cid, _), segs in zip(SPEC_QUERIES.items(), found):
+        req_file = REQUIRED_DOCS[cid]
+        if not segs:
+            raise RuntimeError(
+                f"Keine Segmente für Rubrik {cid} aus '{req_file}'. "
+                "Prüfe REQUIRED_DOCS (Basename) & metadata['file'] beim Indexing."
+            )
+        out[cid] = pack_context(segs, budget)
+
+    return out
+
+
 def load_specs_for_evaluation(stores: Dict[str, HybridEnsemble]) -> Dict[int, str]:
     """
     Ruft pro Kriterium gezielt passende Spezifikationssegmente ab, ausschließlich
     aus den PDF-basierten Vectorstores.
     Pro Rubrik wird strikt nur ein vordefiniertes PDF als Quelle akzeptiert.
+    Das Ergebnis wird einmal pro Index-Version neben dem Specs-Index gespeichert
+    (siehe specs_snapshot_key) und danach nur noch geladen.
     """
     if not stores or "specs" not in stores:
         raise RuntimeError("Specs-Store nicht initialisiert. Bitte zunächst die PDF-basierten Vectorstores erstellen.")
 
-    queries = {
-        1: "Prüfungsschwerpunkte Deutsch 2025 Leistungskurs Aufgabenarten Bewertung Dauer der Prüfung",
-        2: "Operatoren Definitionen Beispiele Anforderungsbereiche Deutsch Abitur",
-        3: "Beschreibung der Struktur Arbeitszeit Auswahlzeit Erwartungshorizont Bewertungshinweise",
-        4: "Erläuterungen zur Konstruktion Aufgabenarten Prinzipien Varianten materialgestützt",
-        5: "Kriterien für Aufgaben Erwartungshorizont Bewertungshinweise Domänenspezifik Materialgrundlage",
-    }
-    REQUIRED_DOCS: Dict[int, str] = {
-        1: "ps_deutsch_2025_lk.pdf",
-        2: "D_Grundstock_von_Operatoren.pdf",
-        3: "D_Beschreibung_der_Struktur_der_Aufgaben.pdf",
-        4: "D_Erlaeuterungen_zur_Konstruktion_der_Aufgaben.pdf",
-        5: "D_Kriterien_fuer_Aufgaben_Erwartungshorizonte_und_Bewertungshinweise.pdf",
-    }
-    
-    def _only_from_required_file(docs: List[Document], req_file: str) -> List[Document]:
-        """Akzeptiert nur Segmente, deren 'file'-Basename exakt dem geforderten PDF entspricht."""
-        rf = (req_file or "").strip().lower()
-        out = []
-        for d in docs:
-            f = str((d.metadata or {}).get("file", "")).strip()
-            base = os.path.basename(f).lower()
-            if base == rf:
-                out.append(d)
-        return out
-    out: Dict[int, str] = {}
-    for cid, q in queries.items():
-        segs = retrieve_specs(q, stores, k=48)  # etwas höher, damit das Ziel-PDF sicher in den Treffern ist
-        req_file = REQUIRED_DOCS.get(cid, "")
-        if not req_file:
-            raise RuntimeError(f"REQUIRED_DOCS fehlt für Rubrik {cid}.")
-        filtered = _only_from_required_file(segs, req_file)
-        if not filtered:
-            
-            raise RuntimeError(
-                f"Keine Segmente für Rubrik {cid} aus '{req_file}'. "
-                "Prüfe REQUIRED_DOCS (Basename) & metadata['file'] beim Indexing."
-            )
-        out[cid] = _concat(filtered, 3500)
-
-    return out
\ No newline at end of file
+    key = specs_snapshot_key(stores)
+    cached = load_artifact("specs", "specs_snapshot", key) if stores["specs"].version else None
+    if cached:
+        return {int(cid): text for cid, text in cached.items()}
+    out = _compute_specs_for_evaluation(stores)
+    if stores["specs"].version:
+        save_artifact("specs", "specs_snapshot", key, {str(cid): text for cid, text in out.items()})
+    return out
@@ -0,0 +1,317 @@
+# Append-only Ergebnis-Store (SQLite/WAL) statt CSV-Komplett-Rewrite pro Bewertung
+#
+#   python prototype/results_store.py export evaluation_results.csv
+#   python prototype/results_store.py import evaluation_results.csv
+#
+# Für Auswertungen (Seite „Analyse“) gibt es neben den vollständigen Zeilen (row_json mit Begründungen
+# und Rohtexten) eine schmale Score-Tabelle und vorab aggregierte Tages-Summen je Origin/Modell/Kriterium,
+# die beim Anhängen in derselben Transaktion fortgeschrieben werden.
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, Optional
+import pandas as pd
+from tracing import span
+
+# Bestehende CSV, die beim ersten Öffnen eines leeren Stores übernommen wird (einmalig, Marker in store_meta)
+LEGACY_CSV = "evaluation_results.csv"
+_LEGACY_MARKER = "legacy_csv_imported"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts            INTEGER NOT NULL,
+    origin        TEXT,
+    question      TEXT,
+    average_score REAL,
+    row_json      TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS store_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Schema-Version (PRAGMA user_version): 1 = model-Spalte + Score-Tabellen, 2 = result_key (idempotente Übernahme)
+_SCHEMA_VERSION = 2
+_ANALYTICS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS scores (
+    result_id INTEGER NOT NULL,
+    ts        INTEGER NOT NULL,
+    origin    TEXT NOT NULL,
+    model     TEXT NOT NULL,
+    crit      TEXT NOT NULL,
+    score     REAL NOT NULL,
+    PRIMARY KEY (result_id, crit)
+);
+CREATE INDEX IF NOT EXISTS scores_origin ON scores (origin, crit, ts);
+CREATE INDEX IF NOT EXISTS scores_model ON scores (model, crit, ts);
+CREATE TABLE IF NOT EXISTS score_agg (
+    day      TEXT NOT NULL,
+    origin   TEXT NOT NULL,
+    model    TEXT NOT NULL,
+    crit     TEXT NOT NULL,
+    n        INTEGER NOT NULL,
+    total    REAL NOT NULL,
+    total_sq REAL NOT NULL,
+    h0 INTEGER NOT NULL, h1 INTEGER NOT NULL, h2 INTEGER NOT NULL,
+    h3 INTEGER NOT NULL, h4 INTEGER NOT NULL, h5 INTEGER NOT NULL,
+    PRIMARY KEY (day, origin, model, crit)
+);
+"""
+AVERAGE = "average"   # Pseudo-Kriterium für average_score
+SCORE_BINS = range(6)  # Judge-Scores 0..5 (Histogramm-Spalten h0..h5)
+UNKNOWN_MODEL = "unbekannt"
+_UPSERT_AGG = """
+INSERT INTO score_agg (day, origin, model, crit, n, total, total_sq, h0, h1, h2, h3, h4, h5)
+VALUES (date(?, 'unixepoch', 'localtime'), ?, ?, ?, 1, ?, ? * ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (day, origin, model, crit) DO UPDATE SET
+    n = n + 1, total = total + excluded.total, total_sq = total_sq + excluded.total_sq,
+    h0 = h0 + excluded.h0, h1 = h1 + excluded.h1, h2 = h2 + excluded.h2,
+    h3 = h3 + excluded.h3, h4 = h4 + excluded.h4, h5 = h5 + excluded.h5
+"""
+
+
+def _row_scores(row: Dict[str, Any]) -> List[tuple]:
+    """(Kriterium, Score) einer Ergebniszeile, inkl. average_score."""
+    out = []
+    for key, value in row.items():
+        parts = key.split()
+        if len(parts) == 2 and parts[0] == "Kriterium" and value is not None:
+            out.append((parts[1], float(value)))
+    if row.get("average_score") is not None:
+        out.append((AVERAGE, float(row["average_score"])))
+    return out
+
+
+def _bins(score: float) -> List[int]:
+    b = min(max(int(round(score)), SCORE_BINS[0]), SCORE_BINS[-1])
+    return [int(b == i) for i in SCORE_BINS]
+
+
+def column_order(columns: Iterable[str]) -> List[str]:
+    """
+    CSV-Spaltenlayout wie bisher: origin, question, je Kriterium 'Kriterium N' + 'Kriterium N Text',
+    average_score, danach die 'Kriterium N Begründung'-Spalten; Unbekanntes hinten dran.
+    """
+    cols = list(dict.fromkeys(columns))
+    crits = sorted({c.split()[1] for c in cols if c.startswith("Kriterium ") and len(c.split()) >= 2},
+                   key=lambda x: (len(x), x))
+    order = ["origin", "question"]
+    for n in crits:
+        order += [f"Kriterium {n}", f"Kriterium {n} Text"]
+    order.append("average_score")
+    order += [f"Kriterium {n} Begründung" for n in crits]
+    known = [c for c in order if c in cols]
+    return known + [c for c in cols if c not in known]
+
+
+class ResultsStore:
+    """
+    Jede Bewertung ist eine Zeile (O(1)-Append), mehrere Sessions/Prozesse dürfen gleichzeitig
+    schreiben (WAL + busy_timeout). Die CSV wird nur noch bei Bedarf exportiert.
+    """
+    def __init__(self, path: Optional[str] = None, legacy_csv: Optional[str] = LEGACY_CSV):
+        self.path = path or os.getenv("RESULTS_DB", "evaluation_results.sqlite")
+        with closing(self._connect()) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+            # Migration + CSV-Übernahme unter Schreibsperre: startet ein zweiter Prozess gleichzeitig,
+            # wartet er und sieht danach Schema-Version bzw. Marker (sonst doppelte Zeilen)
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                version = con.execute("PRAGMA user_version").fetchone()[0]
+                if version < _SCHEMA_VERSION:
+                    self._migrate(con, version)
+                if legacy_csv:
+                    self._import_legacy(con, legacy_csv)
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+
+    @staticmethod
+    def _migrate(con: sqlite3.Connection, version: int) -> None:
+        """
+        Bestehende Stores: model- und result_key-Spalte ergänzen, Score-Tabellen einmalig aus row_json
+        aufbauen (nur von Version 0 aus).
+        """
+        columns = {r[1] for r in con.execute("PRAGMA table_info(results)")}
+        for col in ("model", "result_key"):
+            if col not in columns:
+                con.execute(f"ALTER TABLE results ADD COLUMN {col} TEXT")
+        # NULL-Keys (App, CSV-Import) sind beliebig oft erlaubt
+        con.execute("CREATE UNIQUE INDEX IF NOT EXISTS results_key ON results (result_key)")
+        for stmt in _ANALYTICS_SCHEMA.split(";"):  # executescript würde die offene Transaktion committen
+            if stmt.strip():
+                con.execute(stmt)
+        if version < 1:
+            con.execute("DELETE FROM scores")
+            con.execute("DELETE FROM score_agg")
+            cur = con.execute("SELECT id, ts, origin, model, row_json FROM results ORDER BY id")
+            for rid, ts, origin, model, raw in cur.fetchall():
+                ResultsStore._add_scores(con, rid, ts, origin, model, json.loads(raw))
+        con.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    @staticmethod
+    def _import_legacy(con: sqlite3.Connection, path: str) -> None:
+        """Alte CSV genau einmal übernehmen – nur in einen leeren Store, danach steht der Marker."""
+        if con.execute("SELECT 1 FROM store_meta WHERE key = ?", (_LEGACY_MARKER,)).fetchone():
+            return
+        imported = 0
+        if os.path.exists(path) and con.execute("SELECT COUNT(*) FROM results").fetchone()[0] == 0:
+            rows = _read_csv_rows(path)
+            none = [None] * len(rows)
+            ResultsStore._insert(con, rows, int(os.path.getmtime(path)), none, none)
+            imported = len(rows)
+        con.execute("INSERT INTO store_meta (key, value) VALUES (?, ?)",
+                    (_LEGACY_MARKER, json.dumps({"path": path, "rows": imported})))
+
+    @staticmethod
+    def _add_scores(con: sqlite3.Connection, result_id: int, ts: int, origin: Optional[str],
+                    model: Optional[str], row: Dict[str, Any]) -> None:
+        origin, model = origin or "", model or UNKNOWN_MODEL
+        for crit, score in _row_scores(row):
+            con.execute("INSERT OR REPLACE INTO scores (result_id, ts, origin, model, crit, score) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", (result_id, ts, origin, model, crit, score))
+            con.execute(_UPSERT_AGG, (ts, origin, model, crit, score, score, score, *_bins(score)))
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=30)
+        con.execute("PRAGMA busy_timeout=30000")
+        return con
+
+    def append_many(self, rows: List[Dict[str, Any]], ts: Optional[int] = None,
+                    models: Optional[List[Optional[str]]] = None, keys: Optional[List[Optional[str]]] = None) -> int:
+        """
+        Hängt Zeilen an; 'models' (Modell-Tag des Judges je Zeile) landet nur im Index, nicht in der CSV.
+        Zeilen mit einem 'keys'-Eintrag, der schon im Store steht, werden übersprungen (z.B. erneute
+        Übernahme aus einem Batch-Checkpoint). Liefert die Zahl neu geschriebener Zeilen.
+        """
+        if not rows:
+            return 0
+        ts = int(time.time()) if ts is None else ts
+        models = models or [None] * len(rows)
+        keys = keys or [None] * len(rows)
+        with span("results.append", rows=len(rows)) as s, closing(self._connect()) as con, con:
+            s["written"] = written = self._insert(con, rows, ts, models, keys)
+        return written
+
+    @staticmethod
+    def _insert(con: sqlite3.Connection, rows: List[Dict[str, Any]], ts: int,
+                models: List[Optional[str]], keys: List[Optional[str]]) -> int:
+        written = 0
+        for r, model, key in zip(rows, models, keys):
+            cur = con.execute(
+                "INSERT OR IGNORE INTO results (ts, origin, question, average_score, model, result_key, row_json) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (ts, r.get("origin"), r.get("question"), r.get("average_score"), model, key,
+                 json.dumps(r, ensure_ascii=False)),
+            )
+            if cur.rowcount:
+                ResultsStore._add_scores(con, cur.lastrowid, ts, r.get("origin"), model, r)
+                written += 1
+        return written
+
+    def append(self, row: Dict[str, Any], ts: Optional[int] = None, model: Optional[str] = None) -> None:
+        self.append_many([row], ts, [model])
+
+    def rows(self) -> List[Dict[str, Any]]:
+        with closing(self._connect()) as con:
+            return [json.loads(r[0]) for r in con.execute("SELECT row_json FROM results ORDER BY id")]
+
+    def count(self) -> int:
+        with closing(self._connect()) as con:
+            return con.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        df = pd.DataFrame(self.rows())
+        return df[column_order(df.columns)] if not df.empty else df
+
+    def export_csv(self, path: str = LEGACY_CSV) -> int:
+        """Schreibt alle Ergebnisse im bisherigen CSV-Layout (Kompatibilität); liefert die Zeilenzahl."""
+        with span("csv.export") as s:
+            df = self.to_dataframe()
+            df.to_csv(path, index=False)
+            s["rows"] = len(df)
+        return len(df)
+
+    # --- Auswertung (nur score_agg, ohne row_json zu lesen)
+
+    def _aggregates(self, where: List[str], args: List[Any], group: Dict[str, str]) -> pd.DataFrame:
+        exprs = ", ".join(group.values())
+        sql = ("SELECT " + ", ".join(f"{expr} AS {name}" for name, expr in group.items())
+               + ", SUM(n), SUM(total), SUM(total_sq), " + ", ".join(f"SUM(h{i})" for i in SCORE_BINS)
+               + " FROM score_agg" + (" WHERE " + " AND ".join(where) if where else "")
+               + f" GROUP BY {exprs} ORDER BY {exprs}")
+        with closing(self._connect()) as con:
+            rows = con.execute(sql, args).fetchall()
+        df = pd.DataFrame(rows, columns=list(group) + ["n", "total", "total_sq"] + [f"h{i}" for i in SCORE_BINS])
+        if df.empty:
+            return df
+        df["mean"] = df["total"] / df["n"]
+        df["std"] = ((df["total_sq"] / df["n"] - df["mean"] ** 2).clip(lower=0)) ** 0.5
+        return df.drop(columns=["total", "total_sq"])
+
+    def summary(self, by: Iterable[str] = ("origin", "crit"), origins: Optional[List[str]] = None,
+                models: Optional[List[str]] = None, crits: Optional[List[str]] = None,
+                since: Optional[str] = None, until: Optional[str] = None, bucket: str = "day") -> pd.DataFrame:
+        """
+        n, Mittelwert, Standardabweichung und Score-Verteilung (h0..h5) gruppiert nach 'by'
+        (origin, model, crit, day); 'bucket' = week/month fasst Tage zusammen. Zeitraum als ISO-Datum [since, until].
+        """
+        buckets = {"day": "day", "week": "date(day, 'weekday 0', '-6 days')", "month": "strftime('%Y-%m-01', day)"}
+        if bucket not in buckets:
+            raise RuntimeError(f"Unbekanntes Zeitraster: {bucket}")
+        group = {}
+        for col in by:
+            if col not in ("origin", "model", "crit", "day"):
+                raise RuntimeError(f"Unbekannte Gruppierung: {col}")
+            group[col] = buckets[bucket] if col == "day" else col
+        where, args = [], []
+        for col, values in (("origin", origins), ("model", models), ("crit", crits)):
+            if values:
+                where.append(f"{col} IN ({', '.join('?' * len(values))})")
+                args += list(values)
+        if since:
+            where.append("day >= ?")
+            args.append(since)
+        if until:
+            where.append("day <= ?")
+            args.append(until)
+        return self._aggregates(where, args, group)
+
+    def dimensions(self) -> Dict[str, List[str]]:
+        """Vorhandene Origins, Modell-Tags, Kriterien und Tage (für Filter)."""
+        with closing(self._connect()) as con:
+            return {col: [r[0] for r in con.execute(f"SELECT DISTINCT {col} FROM score_agg ORDER BY {col}")]
+                    for col in ("origin", "model", "crit", "day")}
+
+    def import_csv(self, path: str) -> int:
+        rows = _read_csv_rows(path)
+        # mtime der CSV als Zeitstempel – die alten Zeilen haben keinen eigenen
+        self.append_many(rows, ts=int(os.path.getmtime(path)))
+        return len(rows)
+
+
+def _read_csv_rows(path: str) -> List[Dict[str, Any]]:
+    df = pd.read_csv(path)
+    return [{k: v for k, v in r.items() if not pd.isna(v)} for r in df.to_dict("records")]
+
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in ("export", "import"):
+        print("Verwendung: python prototype/results_store.py export|import <datei.csv>")
+        sys.exit(2)
+    store = ResultsStore(legacy_csv=None)
+    if sys.argv[1] == "export":
+        print(f"{store.export_csv(sys.argv[2])} Zeilen nach {sys.argv[2]} exportiert")
+    else:
+        print(f"{store.import_csv(sys.argv[2])} Zeilen aus {sys.argv[2]} importiert")
+
+
+if __name__ == "__main__":
+    main()
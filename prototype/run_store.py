@@ -0,0 +1,259 @@
+# Audit-Trail der Runs: inhaltsadressierte, komprimierte Blobs + SQLite-Index unter RUNS_DIR
+#
+#   RUNS_DIR/blobs/ab/<sha256>.z   zlib-komprimierter Inhalt, Name = SHA-256 des unkomprimierten Inhalts
+#   RUNS_DIR/runs.sqlite          runs (run_id, ts, kind, model, origin, prompt_hash, parent)
+#                                 + artifacts (run_id, name, blob)
+#
+# Lange Strings eines Payloads (Specs-Texte, Kontexte, Prompt) werden als eigene Blobs abgelegt und
+# über {"$blob": sha} referenziert – identische Texte liegen nur einmal auf der Platte.
+#
+#   python prototype/run_store.py find --model gpt-4_t0.0_p1.0 --since 2025-01-01
+#   python prototype/run_store.py find --parent <run_id>           # Bewertungen einer Generierung
+#   python prototype/run_store.py show <run_id> [artifact]
+#   python prototype/run_store.py import <alter_runs_ordner>    # {run_id}_{name}.json übernehmen
+#   python prototype/run_store.py stats
+import argparse
+import hashlib
+import json
+import os
+import re
+import secrets
+import sqlite3
+import time
+import zlib
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BLOB_MIN_CHARS = 512  # kürzere Strings bleiben im Payload selbst
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    ts          REAL NOT NULL,
+    kind        TEXT,
+    model       TEXT,
+    origin      TEXT,
+    prompt_hash TEXT,
+    parent      TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_ts ON runs (ts);
+CREATE INDEX IF NOT EXISTS runs_model ON runs (model, ts);
+CREATE INDEX IF NOT EXISTS runs_origin ON runs (origin, ts);
+CREATE INDEX IF NOT EXISTS runs_prompt ON runs (prompt_hash);
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id  TEXT NOT NULL,
+    name    TEXT NOT NULL,
+    blob    TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS artifacts_name ON artifacts (name, ts);
+"""
+_META = ("kind", "model", "origin", "prompt_hash", "parent")  # parent: Run, auf den sich dieser bezieht
+
+
+def new_run_id() -> str:
+    """Zeitlich sortierbar und kollisionsfrei (Millisekunden + 32 Zufallsbits), z.B. '20250301-142233-512-9f2c01ab'."""
+    now = time.time()
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}-{secrets.token_hex(4)}"
+
+
+class RunStore:
+    """
+    Schreiben ist O(Größe des neuen Inhalts): bekannte Blobs werden nur gehasht, nicht erneut
+    geschrieben. Mehrere Sessions/Prozesse dürfen gleichzeitig schreiben (WAL, atomare Blob-Dateien).
+    """
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or os.getenv("RUNS_DIR", "runs"))
+        self.blobs = self.root / "blobs"
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.executescript(_SCHEMA)
+            self._migrate(con)
+
+    @staticmethod
+    def _migrate(con: sqlite3.Connection) -> None:
+        # ältere runs.sqlite ohne Spalte 'parent'; IMMEDIATE, damit nicht zwei Prozesse gleichzeitig ergänzen
+        con.execute("BEGIN IMMEDIATE")
+        if "parent" not in {row[1] for row in con.execute("PRAGMA table_info(runs)")}:
+            con.execute("ALTER TABLE runs ADD COLUMN parent TEXT")
+        con.execute("CREATE INDEX IF NOT EXISTS runs_parent ON runs (parent)")
+        con.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.root / "runs.sqlite", timeout=30)
+        con.execute("PRAGMA busy_timeout=30000")
+        return con
+
+    # --- Blobs
+
+    def _blob_path(self, sha: str) -> Path:
+        return self.blobs / sha[:2] / f"{sha}.z"
+
+    def put_blob(self, data: bytes) -> str:
+        sha = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(sha)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{secrets.token_hex(4)}.tmp")
+            tmp.write_bytes(zlib.compress(data, 6))
+            os.replace(tmp, path)
+        return sha
+
+    def get_blob(self, sha: str) -> bytes:
+        try:
+            return zlib.decompress(self._blob_path(sha).read_bytes())
+        except FileNotFoundError:
+            raise RuntimeError(f"Blob {sha} fehlt unter {self.blobs}.")
+
+    def _split(self, value: Any) -> Any:
+        if isinstance(value, str) and len(value) >= BLOB_MIN_CHARS:
+            return {"$blob": self.put_blob(value.encode("utf-8"))}
+        if isinstance(value, dict):
+            return {str(k): self._split(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self._split(v) for v in value]
+        return value
+
+    def _join(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            if len(value) == 1 and "$blob" in value:
+                return self.get_blob(value["$blob"]).decode("utf-8")
+            return {k: self._join(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self._join(v) for v in value]
+        return value
+
+    # --- Runs & Artefakte
+
+    def put(self, run_id: str, name: str, payload: Any, ts: Optional[float] = None, **meta) -> str:
+        """
+        Speichert ein Artefakt (JSON-fähig) zum Run; 'meta' (kind, model, origin, prompt_hash, parent) ergänzt den
+        Index-Eintrag des Runs, bereits gesetzte Werte bleiben erhalten. Liefert den Blob-Hash.
+        """
+        unknown = set(meta) - set(_META)
+        if unknown:
+            raise RuntimeError(f"Unbekannte Run-Metadaten: {sorted(unknown)}")
+        skeleton = json.dumps(self._split(payload), ensure_ascii=False, sort_keys=True)
+        sha = self.put_blob(skeleton.encode("utf-8"))
+        ts = time.time() if ts is None else ts
+        with closing(self._connect()) as con, con:
+            con.execute("INSERT OR IGNORE INTO runs (run_id, ts) VALUES (?, ?)", (run_id, ts))
+            for key, value in meta.items():
+                if value is not None:
+                    con.execute(f"UPDATE runs SET {key} = COALESCE({key}, ?) WHERE run_id = ?", (value, run_id))
+            con.execute("INSERT OR REPLACE INTO artifacts (run_id, name, blob, ts) VALUES (?, ?, ?, ?)",
+                        (run_id, name, sha, ts))
+        return sha
+
+    def get(self, run_id: str, name: str) -> Any:
+        with closing(self._connect()) as con:
+            row = con.execute("SELECT blob FROM artifacts WHERE run_id = ? AND name = ?", (run_id, name)).fetchone()
+        if row is None:
+            raise RuntimeError(f"Artefakt '{name}' zu Run {run_id} nicht gefunden.")
+        return self._join(json.loads(self.get_blob(row[0])))
+
+    def artifacts(self, run_id: str) -> List[str]:
+        with closing(self._connect()) as con:
+            return [r[0] for r in con.execute("SELECT name FROM artifacts WHERE run_id = ? ORDER BY ts, name",
+                                              (run_id,))]
+
+    def find(self, prompt_hash: Optional[str] = None, model: Optional[str] = None, origin: Optional[str] = None,
+             kind: Optional[str] = None, since: Optional[float] = None, until: Optional[float] = None,
+             limit: int = 100, parent: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Runs (neueste zuerst) nach Prompt-Hash, Modell-Tag, Origin, Art, Parent und/oder Zeitraum [since, until)."""
+        where, args = [], []
+        for col, value in (("prompt_hash", prompt_hash), ("model", model), ("origin", origin), ("kind", kind),
+                           ("parent", parent)):
+            if value is not None:
+                where.append(f"{col} = ?")
+                args.append(value)
+        if since is not None:
+            where.append("ts >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            args.append(until)
+        sql = "SELECT run_id, ts, kind, model, origin, prompt_hash, parent FROM runs"
+        sql += (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY ts DESC LIMIT ?"
+        with closing(self._connect()) as con:
+            rows = con.execute(sql, args + [limit]).fetchall()
+        return [dict(zip(("run_id", "ts") + _META, r)) for r in rows]
+
+    def latest(self, suffix: str, limit: int = 200) -> List[Any]:
+        """Die neuesten Artefakte, deren Name auf 'suffix' endet (z.B. alle '_trace'), neueste zuerst."""
+        with closing(self._connect()) as con:
+            rows = con.execute("SELECT blob FROM artifacts WHERE name GLOB ? ORDER BY ts DESC LIMIT ?",
+                               (f"*{suffix}", limit)).fetchall()
+        return [self._join(json.loads(self.get_blob(r[0]))) for r in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with closing(self._connect()) as con:
+            runs = con.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+            artifacts = con.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+        files = list(self.blobs.glob("*/*.z"))
+        return {"runs": runs, "artifacts": artifacts, "blobs": len(files),
+                "bytes": sum(f.stat().st_size for f in files)}
+
+    def import_legacy(self, folder: str) -> int:
+        """Übernimmt alte Einzeldateien '{run_id}_{name}.json' (Zeitstempel-Run-IDs) in den Store."""
+        n = 0
+        for path in sorted(Path(folder).glob("*.json")):
+            m = re.match(r"^(\d+)_(.+)\.json$", path.name)
+            if not m:
+                continue
+            with open(path, encoding="utf-8") as f:
+                payload = json.load(f)
+            meta = {}
+            if isinstance(payload, dict):
+                meta = {k: payload[k] for k in ("model", "prompt_hash", "kind") if isinstance(payload.get(k), str)}
+            self.put(m.group(1), m.group(2), payload, ts=float(m.group(1)), **meta)
+            n += 1
+        return n
+
+
+def _timestamp(value: Optional[str]) -> Optional[float]:
+    return None if value is None else datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit-Trail der Runs (RUNS_DIR)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    find = sub.add_parser("find")
+    find.add_argument("--prompt-hash")
+    find.add_argument("--model")
+    find.add_argument("--origin")
+    find.add_argument("--kind")
+    find.add_argument("--parent", help="Runs, die sich auf diesen Run beziehen (z.B. Bewertungen einer Generierung)")
+    find.add_argument("--since", help="ISO-Datum/-Zeit, z.B. 2025-03-01 oder 2025-03-01T14:00")
+    find.add_argument("--until")
+    find.add_argument("--limit", type=int, default=100)
+    show = sub.add_parser("show")
+    show.add_argument("run_id")
+    show.add_argument("artifact", nargs="?")
+    legacy = sub.add_parser("import")
+    legacy.add_argument("folder")
+    sub.add_parser("stats")
+    args = parser.parse_args()
+
+    store = RunStore()
+    if args.cmd == "find":
+        for run in store.find(args.prompt_hash, args.model, args.origin, args.kind,
+                              _timestamp(args.since), _timestamp(args.until), args.limit, args.parent):
+            print(json.dumps(run, ensure_ascii=False))
+    elif args.cmd == "show":
+        if args.artifact is None:
+            print("\n".join(store.artifacts(args.run_id)))
+        else:
+            print(json.dumps(store.get(args.run_id, args.artifact), ensure_ascii=False, indent=2))
+    elif args.cmd == "import":
+        print(f"{store.import_legacy(args.folder)} Dateien aus {args.folder} übernommen")
+    else:
+        print(json.dumps(store.stats()))
+
+
+if __name__ == "__main__":
+    main()
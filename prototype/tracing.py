@@ -0,0 +1,187 @@
+# Leichtgewichtiges Tracing: Spans (Dauer, Tokens, Cache-Verhalten) pro Run, gespeichert unter RUNS_DIR
+#
+#   trace = Trace(run_id, "generation")
+#   with trace.activate():
+#       with span("retrieval.batch", requests=5):
+#           ...
+#   trace.save()  ->  Artefakt "generation_trace" des Runs im RunStore (RUNS_DIR)
+#
+# Ohne aktiven Trace sind span()/record() No-ops, d.h. Bibliothekscode kann immer instrumentiert sein.
+import contextvars
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+import numpy as np
+
+_TRACE: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("abibuddy_trace", default=None)
+_PARENT: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("abibuddy_span", default=None)
+
+
+def runs_dir() -> str:
+    return os.getenv("RUNS_DIR", "runs")
+
+
+class Trace:
+    """Spans eines Runs (Generierung, Bewertung, Index-Aufbau); thread-sicher."""
+    def __init__(self, run_id: str, kind: str):
+        self.run_id = run_id
+        self.kind = kind
+        self.ts = int(time.time())
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self) -> Iterator["Trace"]:
+        token = _TRACE.set(self)
+        try:
+            yield self
+        finally:
+            _TRACE.reset(token)
+
+    def add(self, name: str, start: float, duration: float, parent: Optional[int] = None,
+            span_id: Optional[int] = None, **attrs) -> Dict[str, Any]:
+        """Span mit Startzeit (perf_counter) und Dauer in Sekunden."""
+        entry = {
+            "id": span_id or next(self._ids),
+            "parent": parent,
+            "name": name,
+            "start_ms": round((start - self.t0) * 1000, 3),
+            "ms": round(duration * 1000, 3),
+            **attrs,
+        }
+        with self._lock:
+            self.spans.append(entry)
+        return entry
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        return {
+            "run_id": self.run_id,
+            "kind": self.kind,
+            "ts": self.ts,
+            "total_ms": round((time.perf_counter() - self.t0) * 1000, 3),
+            "spans": spans,
+        }
+
+    @property
+    def name(self) -> str:
+        """Artefakt-Name im RunStore."""
+        return f"{self.kind}_trace"
+
+    def save(self, directory: Optional[str] = None) -> None:
+        from run_store import RunStore
+        RunStore(directory or runs_dir()).put(self.run_id, self.name, self.to_dict(), kind=self.kind)
+
+
+def current_trace() -> Optional[Trace]:
+    return _TRACE.get()
+
+
+@contextmanager
+def span(name: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """
+    Misst den umschlossenen Block. Liefert ein Dict, in das der Block weitere Attribute
+    (z.B. tokens_out, cached) schreiben kann; verschachtelte Spans merken sich ihren Parent.
+    """
+    trace = _TRACE.get()
+    if trace is None:
+        yield attrs
+        return
+    span_id = next(trace._ids)
+    token = _PARENT.set(span_id)
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        _PARENT.reset(token)
+        trace.add(name, start, time.perf_counter() - start, parent=_PARENT.get(), span_id=span_id, **attrs)
+
+
+def record(name: str, duration: float, **attrs) -> None:
+    """Nachträglich gemessene Dauer (Sekunden), z.B. aus Worker-Prozessen oder Threads."""
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter() - duration, duration, parent=_PARENT.get(), **attrs)
+
+
+# Token-Zählung (tiktoken); ohne Encoding-Datei (offline) grobe Schätzung ~4 Zeichen/Token
+
+_ENCODERS: Dict[str, Any] = {}
+_ENC_LOCK = threading.Lock()
+
+
+def _encoder(model: str):
+    with _ENC_LOCK:
+        if model not in _ENCODERS:
+            try:
+                import tiktoken
+                try:
+                    _ENCODERS[model] = tiktoken.encoding_for_model(model)
+                except KeyError:
+                    _ENCODERS[model] = tiktoken.get_encoding("cl100k_base")
+            except Exception:
+                _ENCODERS[model] = None  # nicht erneut versuchen (z.B. kein Netz für den BPE-Download)
+        return _ENCODERS[model]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    enc = _encoder(model or os.getenv("OPENAI_MODEL", "gpt-4"))
+    if enc is None:
+        return (len(text) + 3) // 4
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    """Die ersten 'max_tokens' Tokens von 'text' (gleiche Zählweise wie count_tokens)."""
+    enc = _encoder(model or os.getenv("OPENAI_MODEL", "gpt-4"))
+    if enc is None:
+        return text[:max(0, max_tokens) * 4]
+    tokens = enc.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else enc.decode(tokens[:max(0, max_tokens)])
+
+
+def tokens_exact(model: Optional[str] = None) -> bool:
+    """False, wenn count_tokens nur schätzt."""
+    return _encoder(model or os.getenv("OPENAI_MODEL", "gpt-4")) is not None
+
+
+# Auswertung über mehrere Runs (Diagnose-Panel)
+
+def load_traces(directory: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+    """Die neuesten 'limit' Traces im RunStore unter RUNS_DIR (neueste zuerst)."""
+    from run_store import RunStore
+    return RunStore(directory or runs_dir()).latest("_trace", limit)
+
+
+def summarize(traces: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Pro (Run-Art, Span-Name): Anzahl, p50/p95/p99/Max in ms, mittlere Tokens und Cache-Trefferquote."""
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for t in traces:
+        groups.setdefault((t.get("kind", ""), "total"), []).append({"ms": t.get("total_ms", 0.0)})
+        for s in t.get("spans", []):
+            groups.setdefault((t.get("kind", ""), s["name"]), []).append(s)
+    rows = []
+    for (kind, name), spans in sorted(groups.items()):
+        ms = np.array([s["ms"] for s in spans], dtype=float)
+        row = {
+            "run": kind, "span": name, "n": len(spans),
+            "p50_ms": round(float(np.percentile(ms, 50)), 1),
+            "p95_ms": round(float(np.percentile(ms, 95)), 1),
+            "p99_ms": round(float(np.percentile(ms, 99)), 1),
+            "max_ms": round(float(ms.max()), 1),
+        }
+        for key in ("tokens_in", "tokens_out"):
+            values = [s[key] for s in spans if key in s]
+            if values:
+                row[key] = round(float(np.mean(values)), 1)
+        cached = [bool(s["cached"]) for s in spans if "cached" in s]
+        if cached:
+            row["cache_hit_rate"] = round(sum(cached) / len(cached), 2)
+        rows.append(row)
+    return rows
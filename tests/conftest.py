@@ -0,0 +1,86 @@
+# Tests laufen gegen die flachen Module in prototype/ (Imports wie in der App: "import index_store")
+import hashlib
+import sys
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "prototype"))
+
+from langchain.schema import Document  # noqa: E402
+from index_store import build_manifest, sync_store  # noqa: E402
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministische Pseudo-Embeddings ohne Modell/Netz: gleicher Text -> gleicher Vektor."""
+    def __init__(self, dim: int = 16):
+        self.dim = dim
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        return np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text)
+
+
+@pytest.fixture
+def embeddings() -> HashEmbeddings:
+    return HashEmbeddings()
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch) -> Path:
+    folder = tmp_path / "index_cache"
+    monkeypatch.setenv("INDEX_DIR", str(folder))
+    return folder
+
+
+class Corpus:
+    """
+    Corpus-Verzeichnis für sync_store ohne echte PDFs: jede "PDF" ist eine Datei mit ihren Chunk-Texten
+    (Inhalt bestimmt den SHA-256 im Manifest), chunk_files liefert die Texte direkt als Documents.
+    """
+    def __init__(self, root: Path, embeddings: HashEmbeddings):
+        self.root = root
+        self.embeddings = embeddings
+        self.texts: Dict[str, List[str]] = {}
+        self.extracted: List[str] = []
+
+    def write(self, rel: str, texts: List[str]) -> None:
+        path = self.root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(texts), encoding="utf-8")
+        self.texts[rel] = texts
+
+    def remove(self, rel: str) -> None:
+        (self.root / rel).unlink()
+        del self.texts[rel]
+
+    def chunk_files(self, rels: List[str], timings: Dict[str, float]):
+        for rel in rels:
+            self.extracted.append(rel)
+            timings[rel] = 0.0
+            yield rel, [
+                Document(page_content=text, metadata={"source": rel.split("/")[0], "file": rel.split("/")[-1],
+                                                      "section": f"Abschnitt {i}", "page_start": i + 1,
+                                                      "page_end": i + 1})
+                for i, text in enumerate(self.texts[rel])
+            ]
+
+    def sync(self, label: str = "specs", **kwargs):
+        self.extracted = []
+        manifest = build_manifest(label, str(self.root), 500, 50, "hash-test")
+        return sync_store(label, manifest, self.embeddings, self.chunk_files, **kwargs)
+
+
+@pytest.fixture
+def corpus(tmp_path, index_dir, embeddings) -> Corpus:
+    return Corpus(tmp_path / "data", embeddings)
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from ann_benchmark import MIN_QUERIES, ann_report
+
+
+def _vectors(n, dim=16):
+    return np.random.default_rng(0).standard_normal((n, dim)).astype(np.float32)
+
+
+@pytest.mark.parametrize("n, n_queries", [(5, 200), (MIN_QUERIES * 10 - 1, 200), (1000, MIN_QUERIES - 1)])
+def test_too_few_held_out_queries_raise(n, n_queries):
+    with pytest.raises(RuntimeError, match="mindestens"):
+        ann_report(_vectors(n), n_queries=n_queries, kinds=["flat"])
+
+
+def test_flat_report_on_minimal_corpus():
+    report = ann_report(_vectors(MIN_QUERIES * 10), k=5, n_queries=200, kinds=["flat"])
+    assert report["queries"] == MIN_QUERIES and report["vectors"] == MIN_QUERIES * 9
+    assert report["indexes"]["flat"]["sweep"][0]["recall"] == 1.0
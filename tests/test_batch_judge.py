@@ -0,0 +1,45 @@
+import json
+
+import batch_judge
+from results_store import ResultsStore
+
+
+def _entry(key, score):
+    results = [{"criterion": 1, "score": score, "_meta": {"model": "gpt-4"}}]
+    return {"key": key, "origin": "mistral", "question": f"Frage {key}", "results": results}
+
+
+def test_result_key_depends_on_content():
+    assert batch_judge.result_key(_entry("a#1", 3)) == batch_judge.result_key(_entry("a#1", 3))
+    assert batch_judge.result_key(_entry("a#1", 3)) != batch_judge.result_key(_entry("a#1", 4))
+    assert batch_judge.result_key(_entry("a#1", 3)) != batch_judge.result_key(_entry("a#2", 3))
+
+
+def test_resume_after_crash_before_mark_exported_writes_no_duplicates(tmp_path):
+    store = ResultsStore(str(tmp_path / "r.sqlite"), legacy_csv=None)
+    checkpoint = tmp_path / "ckpt.jsonl"
+    entries = [_entry("a#1", 3), _entry("b#1", 5)]
+    with open(checkpoint, "w", encoding="utf-8") as f:
+        for e in entries:
+            f.write(json.dumps(e) + "\n")
+    rows = [{"origin": e["origin"], "question": e["question"], "average_score": 3.0} for e in entries]
+    keys = [batch_judge.result_key(e) for e in entries]
+
+    assert store.append_many(rows, keys=keys) == 2
+    # Absturz vor mark_exported: der Checkpoint kennt die Einträge noch als offen
+    pending = [e for e in batch_judge.read_checkpoint(checkpoint).values() if not e.get("exported")]
+    assert len(pending) == 2
+    assert store.append_many(rows, keys=[batch_judge.result_key(e) for e in pending]) == 0
+    assert store.count() == 2
+    assert store.summary(by=("crit",)).set_index("crit").loc["average", "n"] == 2
+
+    batch_judge.mark_exported(checkpoint, pending)
+    assert all(e.get("exported") for e in batch_judge.read_checkpoint(checkpoint).values())
+
+
+def test_rows_without_key_are_always_appended(tmp_path):
+    store = ResultsStore(str(tmp_path / "r.sqlite"), legacy_csv=None)
+    row = {"origin": "AbiBuddy", "question": "Q", "average_score": 4.0}
+    store.append(row)
+    store.append(row)
+    assert store.count() == 2
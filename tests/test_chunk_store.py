@@ -0,0 +1,68 @@
+import pytest
+from chunk_store import ChunkDocstore, ChunkIds, ChunkStore, ChunkStoreWriter
+from langchain.schema import Document
+
+
+def _docs():
+    ids, docs = [], []
+    for rel, n in (("abi/a.pdf", 3), ("abi/b.pdf", 2)):
+        for i in range(n):
+            ids.append(f"{rel}::{i}")
+            docs.append(Document(page_content=f"Größe {rel} {i} – ü", metadata={
+                "source": "abi", "file": rel.split("/")[-1], "section": f"Teil {i % 2}",
+                "page_start": i + 1, "page_end": None if i == 2 else i + 2}))
+    ids.append("3f2a-uuid")  # fremde ID (z.B. aus FAISS)
+    docs.append(Document(page_content="", metadata={"source": "specs", "file": None}))
+    return ids, docs
+
+
+def _check(store: ChunkStore, ids, docs):
+    assert len(store) == len(docs) and store.ids == [i if "::" in i else f"{i}::0" for i in ids]
+    for i, d in enumerate(docs):
+        assert store.text(i) == d.page_content
+        md = store.metadata(i)
+        assert md["file"] == (d.metadata.get("file") or "") and md["page_end"] == d.metadata.get("page_end")
+        assert store.position(store.chunk_id(i)) == i
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_roundtrip(tmp_path, mmap):
+    ids, docs = _docs()
+    ChunkStore.from_documents(ids, docs).save(tmp_path / "chunks")
+    _check(ChunkStore.load(tmp_path / "chunks", mmap=mmap), ids, docs)
+
+
+def test_writer_matches_from_documents(tmp_path):
+    ids, docs = _docs()
+    with ChunkStoreWriter(tmp_path / "chunks") as writer:
+        writer.add(ids[:2], docs[:2])
+        writer.add(ids[2:], docs[2:])
+        assert len(writer) == len(docs)
+    loaded = ChunkStore.load(tmp_path / "chunks")
+    _check(loaded, ids, docs)
+    assert loaded.tables == ChunkStore.from_documents(ids, docs).tables
+
+
+def test_position_of_unknown_ids():
+    store = ChunkStore.from_documents(*_docs())
+    assert store.position("abi/a.pdf::3") is None  # gehört zu b.pdf
+    assert store.position("abi/c.pdf::0") is None
+    assert store.position("abi/a.pdf::x") is None
+
+
+def test_empty_store_roundtrip(tmp_path):
+    ChunkStore.from_documents([], []).save(tmp_path / "chunks")
+    store = ChunkStore.load(tmp_path / "chunks")
+    assert len(store) == 0 and store.ids == [] and store.position("a.pdf::0") is None
+
+
+def test_docstore_and_ids_views():
+    ids, docs = _docs()
+    store = ChunkStore.from_documents(ids, docs)
+    doc = ChunkDocstore(store).search("abi/b.pdf::1")
+    assert doc.id == "abi/b.pdf::1" and doc.page_content == docs[4].page_content
+    assert ChunkDocstore(store).search("fehlt::0") == "ID fehlt::0 not found."
+    mapping = ChunkIds(store)
+    assert len(mapping) == len(docs) and mapping[3] == "abi/b.pdf::0"
+    with pytest.raises(KeyError):
+        mapping[len(docs)]
@@ -0,0 +1,61 @@
+import pytest
+from context_packer import context_window, fit_budgets, merge_chunks, pack_context
+from langchain.schema import Document
+from tracing import count_tokens
+
+SENTENCES = [f"Satz {i} beschreibt den Erwartungshorizont der Aufgabe ausführlich." for i in range(40)]
+PAGE = " ".join(SENTENCES)
+
+
+def _doc(text, file="a.pdf", page=1, ord_=None):
+    return Document(id=f"{file}::{ord_}" if ord_ is not None else None, page_content=text,
+                    metadata={"file": file, "page_start": page})
+
+
+def test_overlapping_and_adjacent_chunks_are_merged():
+    a, b, c = PAGE[:300], PAGE[250:600], PAGE[600:900]
+    # Rang-Reihenfolge beliebig: b vor a, c grenzt direkt an b (Chunk-Nummer)
+    merged = merge_chunks([_doc(b, ord_=1), _doc(a, ord_=0), _doc(c, ord_=2)])
+    assert merged == [PAGE[:600] + "\n" + PAGE[600:900].strip()]
+
+
+def test_duplicates_and_other_pages_stay_separate():
+    other = "Anderer Text auf einer anderen Seite, der nicht überlappt."
+    docs = [_doc(PAGE[:300]), _doc(PAGE[:300], file="b.pdf"), _doc(PAGE[50:200]), _doc(other, page=2)]
+    assert merge_chunks(docs) == [PAGE[:300], other]
+
+
+@pytest.mark.parametrize("budget", [60, 150, 400])
+def test_pack_context_respects_budget_and_cuts_at_sentence_end(budget):
+    docs = [_doc(PAGE, page=1), _doc("Zweite Seite. " * 30, page=2)]
+    packed = pack_context(docs, budget)
+    assert count_tokens(packed) <= budget
+    assert packed.startswith("Satz 0")
+    assert packed.endswith(". …")
+
+
+def test_pack_context_keeps_everything_within_budget():
+    docs = [_doc("Kurzer Abschnitt eins.", page=1), _doc("Kurzer Abschnitt zwei.", page=2)]
+    assert pack_context(docs, 1000) == "Kurzer Abschnitt eins.\n\nKurzer Abschnitt zwei."
+
+
+def test_pack_context_drops_tail_below_minimum():
+    first = "Erster Abschnitt. " * 5
+    docs = [_doc(first.strip(), page=1), _doc(PAGE, page=2)]
+    budget = count_tokens(first.strip()) + 10
+    assert pack_context(docs, budget) == first.strip()
+
+
+def test_context_window_uses_longest_prefix():
+    assert context_window("gpt-4o-2024-08-06") == 128000
+    assert context_window("gpt-4-0613") == 8192
+    assert context_window("unbekannt") == 8192
+
+
+def test_fit_budgets_scales_and_shrinks(monkeypatch):
+    monkeypatch.setenv("CONTEXT_BUDGET_SCALE", "2")
+    assert fit_budgets({"specs": 1000, "pool": 500}, reserve=1000, model="gpt-4o") == {"specs": 2000, "pool": 1000}
+    shrunk = fit_budgets({"specs": 4000, "pool": 2000}, reserve=2192, model="gpt-4")
+    assert sum(shrunk.values()) <= 8192 - 2192 and shrunk["specs"] == 2 * shrunk["pool"]
+    with pytest.raises(RuntimeError):
+        fit_budgets({"specs": 1}, reserve=9000, model="gpt-4")
@@ -0,0 +1,57 @@
+import pytest
+from chunk_store import ChunkStore
+from indexing import DocFilter, HybridEnsemble
+from langchain.schema import Document
+
+METADATA = [
+    {"source": "abi", "file": "Mathe_2023.pdf", "section": "Analysis", "page_start": 1, "page_end": 2},
+    {"source": "abi", "file": "Mathe_2023.pdf", "section": "Stochastik ", "page_start": 3, "page_end": 3},
+    {"source": "specs", "file": "docs/Vorgaben.pdf", "section": "Operatoren", "page_start": 5, "page_end": 7},
+    {"source": "specs", "file": "docs/Vorgaben.pdf", "section": None, "page_start": None, "page_end": None},
+]
+
+FILTERS = [
+    DocFilter.of(),
+    DocFilter.of(files=["mathe_2023.PDF"]),
+    DocFilter.of(files=["/irgendwo/vorgaben.pdf"]),
+    DocFilter.of(sources=["specs"]),
+    DocFilter.of(sections=["stochastik", "OPERATOREN"]),
+    DocFilter.of(pages=(2, 5)),
+    DocFilter.of(pages=(0, 0)),
+    DocFilter.of(sources=["abi"], pages=(3, 10)),
+    DocFilter.of(files=["fehlt.pdf"]),
+]
+
+
+@pytest.fixture
+def chunks() -> ChunkStore:
+    docs = [Document(page_content=f"Text {i}", metadata=md) for i, md in enumerate(METADATA)]
+    return ChunkStore.from_documents([f"x.pdf::{i}" for i in range(len(docs))], docs)
+
+
+@pytest.mark.parametrize("where", FILTERS, ids=lambda f: f.key())
+def test_mask_agrees_with_matches(chunks, where):
+    assert where.mask(chunks).tolist() == [where.matches(md) for md in METADATA]
+
+
+def test_expected_selections(chunks):
+    assert DocFilter.of(files=["mathe_2023.PDF"]).mask(chunks).tolist() == [True, True, False, False]
+    assert DocFilter.of(pages=(2, 5)).mask(chunks).tolist() == [True, True, True, False]
+    assert DocFilter.of(pages=(0, 0)).mask(chunks).tolist() == [False, False, False, True]
+
+
+def test_key_is_independent_of_order():
+    a = DocFilter.of(files=["a.pdf", "b.pdf"], sections=["X", "y"])
+    b = DocFilter.of(files=["b.pdf", "a.pdf"], sections=["Y", "x"])
+    assert a == b and a.key() == b.key()
+    assert DocFilter.of(files=["a.pdf"]).key() != DocFilter.of(sections=["a.pdf"]).key()
+
+
+def test_search_is_restricted_before_scoring(corpus):
+    corpus.write("abi/a.pdf", [f"Analysis Ableitung {i}" for i in range(30)])
+    corpus.write("abi/b.pdf", ["Analysis Ableitung Sonderfall"])
+    store, _ = corpus.sync()
+    ens = HybridEnsemble(store.faiss, store.chunks, bm25=store.bm25)
+    hits = ens.search("Analysis Ableitung", k=5, where=DocFilter.of(files=["b.pdf"]), use_cache=False)
+    assert [d.id for d in hits] == ["abi/b.pdf::0"]
+    assert ens.search("Analysis", k=5, where=DocFilter.of(files=["fehlt.pdf"]), use_cache=False) == []
@@ -0,0 +1,53 @@
+import sys
+import faiss
+import numpy as np
+import pytest
+from index_store import read_index
+
+pytestmark = pytest.mark.skipif(
+    not sys.platform.startswith("linux") or not hasattr(faiss, "IO_FLAG_MMAP_IFC"),
+    reason="braucht /proc und faiss mit IO_FLAG_MMAP_IFC",
+)
+
+
+def _rss_anon_mb() -> float:
+    with open("/proc/self/status") as f:
+        line = next(line for line in f if line.startswith("RssAnon"))
+    return int(line.split()[1]) / 1024
+
+
+def _mapped(path) -> bool:
+    with open("/proc/self/maps") as f:
+        return str(path) in f.read()
+
+
+@pytest.mark.parametrize("factory", ["Flat", "HNSW16,Flat", "IVF16,Flat"])
+def test_mmap_keeps_vectors_out_of_anonymous_memory(tmp_path, factory):
+    vectors = np.random.default_rng(0).random((40000, 256), dtype=np.float32)  # ~40 MB
+    index = faiss.index_factory(vectors.shape[1], factory)
+    index.train(vectors)
+    index.add(vectors)
+    path = tmp_path / "faiss.index"
+    faiss.write_index(index, str(path))
+    del index
+
+    before = _rss_anon_mb()
+    mapped = read_index(path, mmap=True)
+    _, found = mapped.search(vectors[:5], 3)  # berührt die Codes
+    grown = _rss_anon_mb() - before
+
+    assert _mapped(path)
+    assert grown < vectors.nbytes / 1e6 / 4
+    assert mapped.ntotal == len(vectors)
+    _, expected = read_index(path, mmap=False).search(vectors[:5], 3)
+    assert (found == expected).all()
+
+
+def test_without_mmap_index_is_read_into_memory(tmp_path):
+    index = faiss.IndexFlatL2(8)
+    index.add(np.eye(8, dtype=np.float32))
+    path = tmp_path / "faiss.index"
+    faiss.write_index(index, str(path))
+    loaded = read_index(path, mmap=False)
+    assert not _mapped(path)
+    assert loaded.ntotal == 8
@@ -0,0 +1,56 @@
+import pytest
+from judge_cache import JudgeCache
+from llm_judge import _cacheable
+
+PROMPT = "Bewerte die Aufgabe nach Kriterium 1."
+
+
+@pytest.fixture
+def cache(tmp_path) -> JudgeCache:
+    return JudgeCache(str(tmp_path / "judge.sqlite"), max_entries=3)
+
+
+def test_key_depends_on_every_parameter():
+    base = JudgeCache.key("gpt-4", 0.0, 1.0, 1, PROMPT)
+    assert base == JudgeCache.key("gpt-4", 0, 1, "1", PROMPT)  # Typ der Parameter egal
+    variants = [
+        JudgeCache.key("gpt-4o", 0.0, 1.0, 1, PROMPT),
+        JudgeCache.key("gpt-4", 0.2, 1.0, 1, PROMPT),
+        JudgeCache.key("gpt-4", 0.0, 0.9, 1, PROMPT),
+        JudgeCache.key("gpt-4", 0.0, 1.0, 2, PROMPT),
+        JudgeCache.key("gpt-4", 0.0, 1.0, 1, PROMPT + " "),
+    ]
+    assert len({base, *variants}) == len(variants) + 1
+
+
+def test_get_put_and_lru_eviction(cache):
+    keys = [JudgeCache.key("gpt-4", 0, 1, i, PROMPT) for i in range(4)]
+    assert cache.get(keys[0]) is None
+    for k in keys[:3]:
+        cache.put(k, f"antwort {k[:4]}")
+    assert cache.get(keys[0]) == f"antwort {keys[0][:4]}"  # frischt keys[0] auf
+    cache.put(keys[3], "neu")
+    assert cache.get(keys[1]) is None  # am längsten nicht gelesen
+    assert [cache.get(k) is not None for k in (keys[0], keys[2], keys[3])] == [True, True, True]
+    cache.clear()
+    assert cache.get(keys[0]) is None
+
+
+def test_put_replaces_existing_entry(cache):
+    key = JudgeCache.key("gpt-4", 0, 1, 1, PROMPT)
+    cache.put(key, "alt")
+    cache.put(key, "neu")
+    assert cache.get(key) == "neu"
+
+
+@pytest.mark.parametrize("text, ok", [
+    ('{"score": 4, "rationale": "gut"}', True),
+    ('{"score": 0, "rationale": "fehlt"}', True),
+    ('Antwort: {"score": 5, "rationale": "sehr gut"} Ende', True),
+    ('{"score": 7, "rationale": "zu hoch"}', False),
+    ('{"rationale": "ohne Score"}', False),
+    ("Begründung: kein JSON und keine Zahl", False),
+    ("", False),
+])
+def test_only_readable_scores_are_cacheable(text, ok):
+    assert _cacheable(text) is ok
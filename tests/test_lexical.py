@@ -0,0 +1,60 @@
+import numpy as np
+from lexical import BM25Index, normalize, tokenize
+
+DOCS = [
+    "Die Ableitung einer Funktion beschreibt die Steigung.",
+    "Integralrechnung: Flächen unter Funktionsgraphen berechnen.",
+    "Binomialverteilung und Erwartungswert in der Stochastik.",
+    "Der Erwartungshorizont nennt die erwarteten Lösungen.",
+    "Horizont",
+]
+
+
+def test_normalize_and_stopwords():
+    assert normalize("Größe Übung") == "groesse uebung"
+    assert tokenize("Die Ableitungen und der Graph") == ["ableit", "graph"]
+
+
+def test_inflections_share_a_stem():
+    assert tokenize("Flächen") == tokenize("Fläche") == ["flaech"]
+    assert tokenize("Graphen") == tokenize("Graph") == ["graph"]
+    assert tokenize("Lösungen") == ["loes"]
+
+
+def test_compound_adds_known_head():
+    assert tokenize("Erwartungshorizont", heads={"horizont"}) == ["erwartungshorizont", "horizont"]
+    assert tokenize("Erwartungshorizont") == ["erwartungshorizont"]
+
+
+def test_ranking_prefers_matching_documents():
+    bm25 = BM25Index.build(DOCS)
+    assert bm25.n_docs == len(DOCS)
+    assert bm25.top_k("Ableitung Steigung", 3) == [0]
+    assert bm25.top_k("Stochastik Erwartungswert", 2)[0] == 2
+    # Kompositum findet das Grundwort-Dokument und umgekehrt
+    assert set(bm25.top_k("Horizont", 5)) == {3, 4}
+    assert bm25.top_k("Vektorgeometrie", 5) == []
+
+
+def test_top_k_within_positions_keeps_global_positions():
+    bm25 = BM25Index.build(DOCS)
+    assert set(bm25.top_k("Horizont", 5, positions=np.array([1, 4]))) == {4}
+    assert bm25.top_k("Horizont", 5, positions=np.array([], dtype=np.int64)) == []
+
+
+def test_scores_follow_bm25_formula():
+    docs = ["alpha alpha beta", "alpha gamma", "delta"]
+    bm25 = BM25Index.build(docs, k1=1.5, b=0.75)
+    n, df, tf, dl, avgdl = 3, 2, 2, 3, 2.0
+    idf = np.log((n - df + 0.5) / (df + 0.5) + 1)
+    expected = idf * tf * 2.5 / (tf + 1.5 * (1 - 0.75 + 0.75 * dl / avgdl))
+    assert np.isclose(bm25.scores("alpha")[0], expected)
+    assert bm25.scores("delta")[:2].tolist() == [0.0, 0.0]
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    bm25 = BM25Index.build(DOCS)
+    bm25.save(tmp_path / "bm25")
+    loaded = BM25Index.load(tmp_path / "bm25")
+    assert loaded.heads == bm25.heads
+    assert np.allclose(loaded.scores("Erwartungshorizont Funktion"), bm25.scores("Erwartungshorizont Funktion"))
@@ -0,0 +1,104 @@
+import json
+import multiprocessing
+import sqlite3
+import warnings
+from contextlib import closing
+import pandas as pd
+import pytest
+from llm_judge import export_results_to_csv
+from results_store import AVERAGE, ResultsStore
+
+ROW = {"origin": "AbiBuddy", "question": "Q1", "Kriterium 1": 4, "Kriterium 1 Begründung": "gut",
+       "Kriterium 1 Text": "{}", "Kriterium 2": 2, "Kriterium 2 Begründung": "schwach",
+       "Kriterium 2 Text": "{}", "average_score": 3.0}
+
+
+@pytest.fixture
+def legacy_csv(tmp_path):
+    path = tmp_path / "evaluation_results.csv"
+    pd.DataFrame([ROW, {**ROW, "question": "Q2", "origin": "mistral"}]).to_csv(path, index=False)
+    return str(path)
+
+
+def test_legacy_csv_is_imported_once(tmp_path, legacy_csv):
+    db = str(tmp_path / "r.sqlite")
+    store = ResultsStore(db, legacy_csv=legacy_csv)
+    assert store.count() == 2
+    assert {r["question"] for r in store.rows()} == {"Q1", "Q2"}
+    ResultsStore(db, legacy_csv=legacy_csv)
+    assert store.count() == 2
+
+
+def _open_store(db, legacy_csv, barrier):
+    barrier.wait()
+    ResultsStore(db, legacy_csv=legacy_csv)
+
+
+def test_concurrent_first_open_imports_legacy_csv_once(tmp_path, legacy_csv):
+    db = str(tmp_path / "r.sqlite")
+    ctx = multiprocessing.get_context("fork")
+    barrier = ctx.Barrier(6)
+    procs = [ctx.Process(target=_open_store, args=(db, legacy_csv, barrier)) for _ in range(6)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+    assert [p.exitcode for p in procs] == [0] * 6
+    assert ResultsStore(db, legacy_csv=None).count() == 2
+
+
+def test_legacy_csv_is_not_imported_into_a_store_with_results(tmp_path, legacy_csv):
+    db = str(tmp_path / "r.sqlite")
+    ResultsStore(db, legacy_csv=None).append({**ROW, "question": "neu"})
+    assert ResultsStore(db, legacy_csv=legacy_csv).count() == 1
+
+
+def test_migration_builds_score_tables_from_old_rows(tmp_path):
+    db = str(tmp_path / "r.sqlite")
+    with closing(sqlite3.connect(db)) as con:
+        con.execute("CREATE TABLE results (id INTEGER PRIMARY KEY AUTOINCREMENT, ts INTEGER NOT NULL, "
+                    "origin TEXT, question TEXT, average_score REAL, row_json TEXT NOT NULL)")
+        con.execute("INSERT INTO results (ts, origin, question, average_score, row_json) VALUES (?, ?, ?, ?, ?)",
+                    (86400 * 365, "AbiBuddy", "Q1", 3.0, json.dumps(ROW)))
+        con.commit()
+    store = ResultsStore(db, legacy_csv=None)
+    summary = store.summary(by=("origin", "crit")).set_index("crit")
+    assert summary.loc["1", "mean"] == 4 and summary.loc["2", "mean"] == 2
+    assert summary.loc[AVERAGE, "n"] == 1
+    store.append(ROW, model="gpt-4")
+    assert set(store.dimensions()["model"]) == {"gpt-4", "unbekannt"}
+
+
+def test_migration_from_v1_adds_result_key_without_rebuilding_scores(tmp_path):
+    db = str(tmp_path / "r.sqlite")
+    store = ResultsStore(db, legacy_csv=None)
+    store.append(ROW, model="gpt-4")
+    with closing(sqlite3.connect(db)) as con:  # Stand von Version 1 nachstellen
+        con.execute("DROP INDEX results_key")
+        con.execute("ALTER TABLE results DROP COLUMN result_key")
+        con.execute("PRAGMA user_version = 1")
+        con.commit()
+    store = ResultsStore(db, legacy_csv=None)
+    assert store.summary(by=("crit",)).set_index("crit").loc[AVERAGE, "n"] == 1
+    assert store.append_many([ROW, ROW], keys=["k", "k"]) == 1
+    assert store.count() == 2
+
+
+def _results():
+    return [{"evaluations": {"1": {"score": 5, "reason": "r", "text": "t"}}, "_meta": {"model": "m"}}]
+
+
+def test_export_results_to_csv_appends_to_store(tmp_path):
+    store = ResultsStore(str(tmp_path / "r.sqlite"), legacy_csv=None)
+    export_results_to_csv("Frage", _results(), origin="gemini", store=store)
+    assert store.rows()[0]["origin"] == "gemini" and store.rows()[0]["Kriterium 1"] == 5
+
+
+def test_export_results_to_csv_path_is_deprecated_but_writes_csv(tmp_path):
+    store = ResultsStore(str(tmp_path / "r.sqlite"), legacy_csv=None)
+    out = tmp_path / "out.csv"
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        export_results_to_csv("Frage", _results(), "gemini", str(out), store=store)
+    assert any(issubclass(w.category, DeprecationWarning) for w in caught)
+    assert list(pd.read_csv(out)["question"]) == ["Frage"]
@@ -0,0 +1,52 @@
+import sqlite3
+from contextlib import closing
+from run_store import RunStore, new_run_id
+
+
+def test_run_ids_are_unique():
+    assert len({new_run_id() for _ in range(1000)}) == 1000
+
+
+def test_evaluations_are_separate_runs_linked_to_their_generation(tmp_path):
+    store = RunStore(str(tmp_path))
+    gen = new_run_id()
+    store.put(gen, "generation_context", {"prompt": "p"}, kind="generation", origin="AbiBuddy")
+    first, second = new_run_id(), new_run_id()
+    store.put(first, "judge_raw", [1], kind="evaluation", origin="AbiBuddy", parent=gen)
+    store.put(second, "judge_raw", [2], kind="evaluation", origin="mistral")
+
+    assert {r["run_id"] for r in store.find(parent=gen)} == {first}
+    assert [r["run_id"] for r in store.find(kind="generation")] == [gen]
+    assert [r["run_id"] for r in store.find(origin="mistral")] == [second]
+    assert store.get(first, "judge_raw") == [1] and store.get(second, "judge_raw") == [2]
+
+
+def test_existing_metadata_is_not_overwritten(tmp_path):
+    store = RunStore(str(tmp_path))
+    store.put("r1", "a", {}, kind="generation", origin="AbiBuddy")
+    store.put("r1", "b", {}, kind="evaluation", origin="mistral")
+    assert store.find()[0]["kind"] == "generation"
+    assert store.find()[0]["origin"] == "AbiBuddy"
+
+
+def test_identical_long_strings_are_stored_once(tmp_path):
+    store = RunStore(str(tmp_path))
+    text = "Spezifikation " * 100
+    store.put("r1", "specs_map", {"1": text, "2": "kurz"})
+    before = store.stats()["blobs"]
+    store.put("r2", "specs_map", {"1": text, "2": "anders"})
+    assert store.stats()["blobs"] == before + 1  # nur das neue Skelett, der lange Text ist schon da
+    assert store.get("r2", "specs_map") == {"1": text, "2": "anders"}
+
+
+def test_old_database_gets_parent_column(tmp_path):
+    with closing(sqlite3.connect(tmp_path / "runs.sqlite")) as con:
+        con.execute("CREATE TABLE runs (run_id TEXT PRIMARY KEY, ts REAL NOT NULL, kind TEXT, model TEXT, "
+                    "origin TEXT, prompt_hash TEXT)")
+        con.execute("INSERT INTO runs (run_id, ts, kind) VALUES ('alt', 1.0, 'generation')")
+        con.commit()
+    store = RunStore(str(tmp_path))
+    store.put("neu", "judge_raw", [], kind="evaluation", parent="alt")
+    assert [r["run_id"] for r in store.find(parent="alt")] == ["neu"]
+    assert store.find(kind="generation")[0]["parent"] is None
+    RunStore(str(tmp_path))  # zweites Öffnen: Migration ist idempotent
@@ -0,0 +1,57 @@
+import threading
+import indexing
+from indexing import HybridEnsemble
+
+
+def _ensemble(corpus) -> HybridEnsemble:
+    store, _ = corpus.sync()
+    return HybridEnsemble(store.faiss, store.chunks, version="v1", bm25=store.bm25, label="specs")
+
+
+def _wait(ens: HybridEnsemble) -> None:
+    pending = ens._cache_write
+    if pending is not None:
+        pending.result(timeout=10)
+
+
+def test_misses_are_written_in_background_and_coalesced(corpus, monkeypatch):
+    corpus.write("a.pdf", ["Operatoren erläutern", "Formatvorgaben Aufgaben", "Erwartungshorizont Deutsch"])
+    ens = _ensemble(corpus)
+    release, writes = threading.Event(), []
+    original = indexing.save_artifact
+
+    def slow_save(*args):
+        release.wait(10)
+        writes.append(args[3])
+        original(*args)
+
+    monkeypatch.setattr(indexing, "save_artifact", slow_save)
+    for q in ("Operatoren", "Formatvorgaben", "Erwartungshorizont"):
+        ens.search(q, k=2)  # kehrt zurück, obwohl das Schreiben noch blockiert
+    assert writes == []
+    release.set()
+    _wait(ens)
+    assert 1 <= len(writes) <= 2  # erster Auftrag + ein zusammengefasster Nachzügler
+    assert len(writes[-1]) == 3
+
+    ens.search("Operatoren", k=2)  # Treffer: nichts geändert, nichts geschrieben
+    _wait(ens)
+    assert len(writes) <= 2 and ens.cache_stats()["hits"] == 1
+
+
+def test_saved_cache_survives_restart_and_merges_other_processes(corpus):
+    corpus.write("a.pdf", ["Operatoren erläutern", "Formatvorgaben Aufgaben"])
+    first = _ensemble(corpus)
+    first.search("Operatoren", k=1)
+    _wait(first)
+    other = HybridEnsemble(first.faiss, first.chunks, version="v1", bm25=first.bm25, label="specs")
+    other.clear_cache()
+    other.search("Formatvorgaben", k=1)
+    _wait(other)
+
+    restarted = HybridEnsemble(first.faiss, first.chunks, version="v1", bm25=first.bm25, label="specs")
+    assert restarted.cached(indexing.SearchRequest("Operatoren", k=1)) is not None
+    assert restarted.cached(indexing.SearchRequest("Formatvorgaben", k=1)) is not None
+    # andere Index-Version: gespeicherter Cache gilt nicht
+    stale = HybridEnsemble(first.faiss, first.chunks, version="v2", bm25=first.bm25, label="specs")
+    assert stale.cache_stats()["size"] == 0
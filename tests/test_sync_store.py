@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+from index_store import _read_manifest, build_manifest, load_store, sync_store
+
+
+def _texts(corpus_store):
+    return {d.id: d.page_content for d in corpus_store.chunks.docs(range(len(corpus_store.chunks)))}
+
+
+def _assert_consistent(stored, expected):
+    """Chunk-Store, FAISS und BM25 enthalten genau die Chunks von 'expected' (rel -> Texte)."""
+    want = {f"{rel}::{i}": t for rel, texts in expected.items() for i, t in enumerate(texts)}
+    assert _texts(stored) == want
+    assert stored.faiss.index.ntotal == len(stored.chunks) == len(want)
+    for i in range(len(stored.chunks)):
+        assert stored.chunks.position(stored.chunks.chunk_id(i)) == i
+    # FAISS-Position == Chunk-Position: jeder Chunk findet seinen eigenen Vektor
+    vectors = np.asarray(stored.faiss.embedding_function.embed_documents(list(stored.chunks.texts())),
+                         dtype=np.float32)
+    _, found = stored.faiss.index.search(vectors, 1)
+    assert found[:, 0].tolist() == list(range(len(stored.chunks)))
+    assert stored.bm25 is not None
+
+
+def test_first_sync_builds_everything(corpus):
+    corpus.write("abi/a.pdf", ["Analysis Ableitung", "Integral Fläche"])
+    corpus.write("abi/b.pdf", ["Stochastik Binomialverteilung"])
+    stored, update = corpus.sync()
+    assert update.rebuilt and update.added == ["abi/a.pdf", "abi/b.pdf"]
+    assert sorted(corpus.extracted) == ["abi/a.pdf", "abi/b.pdf"]
+    _assert_consistent(stored, corpus.texts)
+    files = _read_manifest("specs")["files"]
+    assert {rel: meta["chunks"] for rel, meta in files.items()} == {"abi/a.pdf": 2, "abi/b.pdf": 1}
+
+
+def test_unchanged_corpus_is_only_loaded(corpus, embeddings):
+    corpus.write("abi/a.pdf", ["Analysis"])
+    corpus.sync()
+    calls = embeddings.calls
+    stored, update = corpus.sync()
+    assert not update.changed() and update.summary() == "unverändert"
+    assert corpus.extracted == [] and embeddings.calls == calls
+    _assert_consistent(stored, corpus.texts)
+
+
+def test_add_modify_remove_extracts_only_changed_files(corpus):
+    corpus.write("abi/a.pdf", ["A1", "A2"])
+    corpus.write("abi/b.pdf", ["B1", "B2", "B3"])
+    corpus.write("abi/c.pdf", ["C1"])
+    corpus.sync(batch_size=2)
+
+    corpus.write("abi/b.pdf", ["B1 neu"])
+    corpus.remove("abi/c.pdf")
+    corpus.write("abi/d.pdf", ["D1", "D2"])
+    stored, update = corpus.sync(batch_size=2)
+    assert not update.rebuilt
+    assert (update.added, update.modified, update.removed) == (["abi/d.pdf"], ["abi/b.pdf"], ["abi/c.pdf"])
+    assert sorted(corpus.extracted) == ["abi/b.pdf", "abi/d.pdf"]
+    _assert_consistent(stored, corpus.texts)
+    files = _read_manifest("specs")["files"]
+    assert {rel: meta["chunks"] for rel, meta in files.items()} == {"abi/a.pdf": 2, "abi/b.pdf": 1, "abi/d.pdf": 2}
+    # Chunks einer PDF bleiben nach dem Update zusammenhängend (ChunkStore.position)
+    assert stored.chunks.position("abi/b.pdf::0") is not None
+    assert stored.chunks.position("abi/c.pdf::0") is None
+
+
+def test_changed_chunk_parameters_force_rebuild(corpus):
+    corpus.write("abi/a.pdf", ["A1"])
+    corpus.sync()
+    corpus.extracted = []
+    manifest = build_manifest("specs", str(corpus.root), 800, 50, "hash-test")
+    stored, update = sync_store("specs", manifest, corpus.embeddings, corpus.chunk_files)
+    assert update.rebuilt and corpus.extracted == ["abi/a.pdf"]
+    assert _read_manifest("specs")["chunk_size"] == 800
+    _assert_consistent(stored, corpus.texts)
+
+
+def test_removing_all_files_leaves_an_empty_store(corpus):
+    corpus.write("abi/a.pdf", ["A1"])
+    corpus.sync()
+    corpus.remove("abi/a.pdf")
+    stored, update = corpus.sync()
+    assert update.removed == ["abi/a.pdf"] and corpus.extracted == []
+    assert len(stored.chunks) == stored.faiss.index.ntotal == 0 and stored.bm25 is None
+
+
+def test_empty_first_build_raises_without_leaving_staging_dirs(corpus, index_dir):
+    corpus.root.mkdir(parents=True)
+    with pytest.raises(RuntimeError, match="keine Chunks"):
+        corpus.sync()
+    assert load_store("specs", corpus.embeddings) is None
+    assert [p.name for p in index_dir.iterdir() if p.is_dir()] == []